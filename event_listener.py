@@ -11,11 +11,13 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'erpproject.settings')  # Set up
 import django
 django.setup()  # Initialize Django, allowing use of models and the ORM
 
-import json
-from web3 import Web3  
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from web3 import Web3, AsyncWeb3, WebSocketProvider
+from hexbytes import HexBytes
+from datetime import timedelta
+from asgiref.sync import sync_to_async
 from django.utils import timezone  
-import threading  
-import time  
 import logging  
 
 # Load environment variables from the .env file
@@ -23,33 +25,30 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Import models from the Django app
-from supplychain.models import Delivery, Order 
+from supplychain.models import Delivery, Order, BlockCheckpoint, ProcessedEvent, FailedEvent, ChainDelivery, ChainDeliveryStatus, ChainInventory
 from warehouse.models import Product 
 from notifications.models import Notification  
 from django.contrib.auth import get_user_model  # Utility to get the current user model
+from members.user_cache import user_resolver
+from supplychain import chain_backend, listener_metrics as metrics
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
 
 # Set up logging format and level
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-# Connect to the local Ethereum blockchain (Ganache, in this case)
-ganache_url = os.getenv('WEB3_PROVIDER', 'http://127.0.0.1:7545')  # Get the URL from the environment variables
-web3 = Web3(Web3.HTTPProvider(ganache_url))  # Connect to Ethereum blockchain using HTTP provider
+# Connect to the Ethereum blockchain backend (Ganache, or the in-process tester chain with CHAIN_BACKEND=tester)
+ganache_url = chain_backend.ganache_url  # Get the URL from the environment variables
+websocket_url = os.getenv('WEB3_WS_PROVIDER', ganache_url.replace('http', 'ws', 1))  # Ganache serves websockets on the same port
+web3 = chain_backend.create_web3()  # Connect to Ethereum blockchain using the backend's pooled provider
 
 
-# Check if the connection to Ethereum is successful
-if not web3.is_connected():
-    raise Exception("Could not connect to the Ethereum blockchain")  # Raise an error if the connection fails
 
-
-
-# Function to load a smart contract from the Truffle build folder
+# Function to load a smart contract deployed on the backend (from the Truffle build folder for Ganache)
 def load_contract(contract_name):
-    with open(Path(__file__).resolve().parent / f"supplychain/smart_contracts/build/contracts/{contract_name}.json") as f:
-        contract_json = json.load(f)  # Load contract's JSON (ABI and address)
-        contract_abi = contract_json['abi']  # Extract ABI
-        contract_address = contract_json['networks']['5777']['address']  # Extract contract address for the network (Ganache: network ID 5777)
-        return web3.eth.contract(address=contract_address, abi=contract_abi)  # Return contract instance to interact with
+    contract_abi, contract_address = chain_backend.contract_interface(contract_name)  # Extract ABI and address
+    return web3.eth.contract(address=contract_address, abi=contract_abi)  # Return contract instance to interact with
     
 
 # Load all the smart contracts needed
@@ -68,41 +67,275 @@ def get_event_topic_hash(event_signature):
 
 
 
-### Event Listener Functions ###
+### Batched Lookups ###
+
+# Rows the handlers need for one batch of events, loaded up front with one query per model.
+# Users come from the shared user_resolver cache instead.
+# Notifications and product changes are collected and written once when the batch is flushed.
+class EventBatch:
+    def __init__(self, events):
+        args = [event['args'] for event in events]
+
+        product_ids = {str(arg['productId']) for arg in args if 'productId' in arg}
+        self.products = Product.objects.in_bulk(product_ids, field_name='product_id')
+
+        order_ids = {arg['orderId'] for arg in args if 'orderId' in arg}
+        self.orders = Order.objects.select_related('retail_store').in_bulk(order_ids)
+
+        # Events already recorded in the ledger, by this or another listener process
+        tx_hashes = {event_key(event)[0] for event in events}
+        self.processed = set(ProcessedEvent.objects.filter(tx_hash__in=tx_hashes).values_list('tx_hash', 'log_index'))
+
+        self.notifications = []
+        self.product_deltas = {}
+        self.created_order_ids = []
+        self.chain_deliveries = ChainDelivery.objects.in_bulk(order_ids, field_name='order_id')
+        self.changed_chain_deliveries = set()  # Order IDs of the chain deliveries to write
+        self.status_history = []  # ChainDeliveryStatus rows
+        self.chain_inventory = {}  # Product ID: ChainInventory row, the last update of the batch wins
+
+    # Remember the deferred state before a handler runs, so a failing handler's changes can be discarded
+    def savepoint(self):
+        return (len(self.notifications), dict(self.product_deltas), len(self.created_order_ids), dict(self.chain_deliveries),
+                set(self.changed_chain_deliveries), len(self.status_history), dict(self.chain_inventory))
+
+    def rollback(self, savepoint):
+        (notification_count, product_deltas, created_order_count, chain_deliveries,
+         changed_chain_deliveries, status_count, chain_inventory) = savepoint
+        del self.notifications[notification_count:]
+        self.product_deltas = product_deltas
+        self.chain_deliveries = chain_deliveries  # Projections replace rows instead of changing them, so the copy is enough
+        self.changed_chain_deliveries = changed_chain_deliveries
+        del self.status_history[status_count:]
+        self.chain_inventory = chain_inventory
+        for order_id in self.created_order_ids[created_order_count:]:  # Those inserts were rolled back with the savepoint
+            self.orders.pop(order_id, None)
+        del self.created_order_ids[created_order_count:]
+
+    # Write everything collected while the handlers ran
+    def flush(self):
+        for pk, delta in self.product_deltas.items():
+            Product.objects.filter(pk=pk).update(quantity=F('quantity') + delta)
+        if self.notifications:
+            Notification.objects.bulk_create(self.notifications)
+        if self.changed_chain_deliveries:
+            ChainDelivery.objects.bulk_create(
+                [self.chain_deliveries[order_id] for order_id in self.changed_chain_deliveries],
+                update_conflicts=True, unique_fields=['order_id'], update_fields=CHAIN_DELIVERY_FIELDS + ['updated_at'],
+            )
+        if self.status_history:
+            ChainDeliveryStatus.objects.bulk_create(self.status_history, ignore_conflicts=True)  # Replayed events are already there
+        if self.chain_inventory:
+            ChainInventory.objects.bulk_create(
+                list(self.chain_inventory.values()),
+                update_conflicts=True, unique_fields=['product_id'], update_fields=['quantity', 'block_number', 'updated_at'],
+            )
 
-# Function to listen for the 'OrderPlaced' event from the blockchain
-def listen_order_placed_event(stop_event):
-    latest_block = web3.eth.block_number  # Get the current block number
 
-    # Continuously listen for new events until the stop_event is triggered
-    while not stop_event.is_set():
-        try:
-            # Set up an event filter to listen for 'OrderPlaced' events from the retail store contract
-            event_filter = {
-                'fromBlock': latest_block + 1,
-                'toBlock': 'latest',
-                'address': retail_store_contract.address,
-                'topics': [get_event_topic_hash("OrderPlaced(uint256,uint256,uint256,address)")]
-            }
+# Fetch a product by its product ID, from the batch when one is given
+def get_product(product_id, batch=None):
+    if batch is None:
+        return Product.objects.get(product_id=product_id)
+    try:
+        return batch.products[str(product_id)]
+    except KeyError:
+        raise Product.DoesNotExist(f"Product with ID {product_id} does not exist.")
 
-            # Fetch logs (events) that match the filter
-            events = web3.eth.get_logs(event_filter)
 
-            # Process each event found
-            for event in events:
-                processed_event = retail_store_contract.events.OrderPlaced().process_log(event)
-                handle_order_placed_event(processed_event)  # Handle the 'OrderPlaced' event
+# Fetch an order by its ID, from the batch when one is given
+def get_order(order_id, batch=None):
+    if batch is None:
+        return Order.objects.get(id=order_id)
+    try:
+        return batch.orders[order_id]
+    except KeyError:
+        raise Order.DoesNotExist(f"Order with ID {order_id} does not exist.")
+
+
+# Fetch an order by its ID or create it, keeping the batch in sync so later events in it see the new order
+def get_or_create_order(order_id, batch=None, defaults=None):
+    if batch is None:
+        return Order.objects.get_or_create(id=order_id, defaults=defaults)
+    if order_id in batch.orders:
+        return batch.orders[order_id], False
+    order = Order.objects.create(id=order_id, **defaults)
+    batch.orders[order_id] = order
+    batch.created_order_ids.append(order_id)
+    return order, True
+
+
+# Fetch the user registered with an Ethereum address from the resolver cache
+def get_user_by_address(address):
+    return user_resolver.by_address(address)
+
+
+# Fetch the single user holding a role from the resolver cache
+def get_user_by_role(role):
+    return user_resolver.by_role(role)
+
+
+# Add delta to a product's stock with an F() expression so concurrent writers cannot lose updates,
+# deferring the write to the batch when one is given
+def adjust_product_quantity(product, delta, batch=None):
+    product.quantity += delta  # Keep the in-memory copy current for logging
+    if batch is None:
+        Product.objects.filter(pk=product.pk).update(quantity=F('quantity') + delta)
+    else:
+        batch.product_deltas[product.pk] = batch.product_deltas.get(product.pk, 0) + delta
+
+
+# Create a notification, deferring the insert to the batch when one is given
+def send_notification(sender, receiver, message, batch=None, event=None):
+    tx_hash = Web3.to_hex(event['transactionHash']) if event is not None else ''  # Links it to the event that sent it
+    notification = Notification(sender=sender, receiver=receiver, message=message, tx_hash=tx_hash)
+    if batch is None:
+        notification.save()
+    else:
+        batch.notifications.append(notification)
+
+
+
+### Read Model Projections ###
+
+# DeliveryContract and DistributorContract events kept as local tables (ChainDelivery, ChainDeliveryStatus,
+# ChainInventory), so delivery pages read the database instead of calling the node. They only depend on
+# the events, so they can be rebuilt from the ProcessedEvent ledger at any time (see rebuild_read_model).
+
+DELIVERY_STATUSES = ['in_transit', 'delivered', 'cancelled']  # DeliveryContract.DeliveryStatus, in enum order
+CHAIN_DELIVERY_FIELDS = ['product_id', 'quantity', 'retail_store', 'status', 'block_number']
+
+
+# Create or change the chain delivery of an order, deferring the write to the batch when one is given
+def put_chain_delivery(order_id, changes, batch=None):
+    if batch is None:
+        ChainDelivery.objects.update_or_create(order_id=order_id, defaults=changes)
+        return
+
+    current = batch.chain_deliveries.get(order_id)
+    values = {field: getattr(current, field) for field in CHAIN_DELIVERY_FIELDS} if current else {}
+    batch.chain_deliveries[order_id] = ChainDelivery(order_id=order_id, **{**values, **changes})
+    batch.changed_chain_deliveries.add(order_id)
+
+
+# Record the delivery a DeliveryInitiated event created; its status comes from the StatusUpdated event that follows
+def project_delivery_initiated(event, batch=None):
+    args = event['args']
+    put_chain_delivery(args['orderId'], {
+        'product_id': args['productId'],
+        'quantity': args['quantity'],
+        'retail_store': args['retailStore'],
+        'status': 'in_transit',
+        'block_number': event['blockNumber'],
+    }, batch)
+
+
+# Record a delivery's new status and add it to the delivery's history
+def project_status_updated(event, batch=None):
+    args = event['args']
+    status = DELIVERY_STATUSES[args['status']]
+    # updateStatus also works on orders without a delivery, which the contract then holds with empty fields
+    put_chain_delivery(args['orderId'], {'status': status, 'block_number': event['blockNumber']}, batch)
+
+    history = ChainDeliveryStatus(
+        order_id=args['orderId'], status=status, tx_hash=Web3.to_hex(event['transactionHash']),
+        log_index=event['logIndex'], block_number=event['blockNumber'],
+    )
+    if batch is None:
+        ChainDeliveryStatus.objects.bulk_create([history], ignore_conflicts=True)
+    else:
+        batch.status_history.append(history)
+
+
+# Record the quantity the DistributorContract now holds for a product
+def project_inventory_updated(event, batch=None):
+    args = event['args']
+    if batch is None:
+        ChainInventory.objects.update_or_create(product_id=args['productId'], defaults={
+            'quantity': args['newQuantity'], 'block_number': event['blockNumber'],
+        })
+    else:
+        batch.chain_inventory[args['productId']] = ChainInventory(
+            product_id=args['productId'], quantity=args['newQuantity'], block_number=event['blockNumber'],
+        )
 
-            latest_block = web3.eth.block_number  # Update the latest block number
 
-        except Exception as e:
-            logging.error(f"An error occurred while listening for OrderPlaced events: {str(e)}")
+PROJECTIONS = {
+    'DeliveryInitiated': project_delivery_initiated,
+    'StatusUpdated': project_status_updated,
+    'InventoryUpdated': project_inventory_updated,
+}
+REBUILD_CHUNK_SIZE = 1000  # Ledger events projected per batch by rebuild_read_model
+
+
+# Rebuild the read model from the ProcessedEvent ledger: all of it, or only some orders and products,
+# e.g. after a reorg removed their events. Must be called inside a transaction.
+def rebuild_read_model(order_ids=None, product_ids=None):
+    deliveries, history, inventory = ChainDelivery.objects.all(), ChainDeliveryStatus.objects.all(), ChainInventory.objects.all()
+    ledger = ProcessedEvent.objects.filter(event_name__in=PROJECTIONS)
+    if order_ids is not None or product_ids is not None:
+        order_ids, product_ids = list(order_ids or []), list(product_ids or [])
+        deliveries, history = deliveries.filter(order_id__in=order_ids), history.filter(order_id__in=order_ids)
+        inventory = inventory.filter(product_id__in=product_ids)
+        ledger = ledger.filter(
+            Q(event_name__in=['DeliveryInitiated', 'StatusUpdated'], args__orderId__in=order_ids)
+            | Q(event_name='InventoryUpdated', args__productId__in=product_ids)
+        )
 
-        time.sleep(2)  # Sleep for 2 seconds between polling
+    deliveries.delete()
+    history.delete()
+    inventory.delete()
+
+    events = []
+    for record in ledger.order_by('block_number', 'log_index').iterator(chunk_size=REBUILD_CHUNK_SIZE):
+        events.append(failed_event_to_event(record))  # Ledger rows carry the same fields as dead-letter rows
+        if len(events) == REBUILD_CHUNK_SIZE:
+            project_events(events)
+            events = []
+    project_events(events)
+
+
+def project_events(events):
+    batch = EventBatch(events)
+    for event in events:
+        PROJECTIONS[event['event']](event, batch)
+    batch.flush()
+
+
+# Record events in the ProcessedEvent ledger and project them into the read model without running their handlers,
+# for history the rest of the database already reflects, e.g. events from before the ledger existed
+# (backfill_events --project-only). Events the ledger already holds are left alone.
+def record_events(events):
+    new_events, records = [], []
+    processed = set(ProcessedEvent.objects.filter(
+        tx_hash__in={event_key(event)[0] for event in events}
+    ).values_list('tx_hash', 'log_index'))
+    for event in events:
+        tx_hash, log_index = event_key(event)
+        if (tx_hash, log_index) in processed:
+            continue
+        try:
+            validate_event_args(event)
+        except ValueError as e:
+            logging.warning(f"Skipping {event['event']} {tx_hash}:{log_index}, it cannot be recorded: {str(e)}")
+            continue
+        processed.add((tx_hash, log_index))
+        new_events.append(event)
+        records.append(ProcessedEvent(
+            tx_hash=tx_hash, log_index=log_index, block_number=event['blockNumber'],
+            block_hash=Web3.to_hex(event['blockHash']), event_name=event['event'], args=dict(event['args']),
+        ))
+
+    ProcessedEvent.objects.bulk_create(records, ignore_conflicts=True)
+    project_events([event for event in new_events if event['event'] in PROJECTIONS])
+
+
+
+### Event Handler Functions ###
 
+# Handlers let errors propagate: dispatch_events rolls the event back and moves it to the dead-letter table
 
 # Handler for the 'OrderPlaced' event
-def handle_order_placed_event(event):
+def handle_order_placed_event(event, batch=None):
     order_id = event['args']['orderId']  # Extract order ID from the event
     product_id = event['args']['productId']  # Extract product ID
     quantity = event['args']['quantity']  # Extract quantity
@@ -110,433 +343,805 @@ def handle_order_placed_event(event):
 
     logging.info(f"[Event Listener] Received OrderPlaced event with Product ID: {product_id}")
 
-    try:
-        # Check if the product exists in the database
-        product = Product.objects.get(product_id=product_id)
-        retail_store_user = User.objects.get(eth_address__iexact=retail_store_address)  # Get the retail store user by Ethereum address
-        distributor_user = User.objects.get(user_role='distributor')  # Get the distributor user
-
-        # Check if the order already exists or create it
-        order, created = Order.objects.get_or_create(
-            id=order_id,
+    # Check if the product exists in the database
+    product = get_product(product_id, batch)
+    retail_store_user = get_user_by_address(retail_store_address)  # Get the retail store user by Ethereum address
+    distributor_user = get_user_by_role('distributor')  # Get the distributor user
+
+    # Check if the order already exists or create it
+    order, created = get_or_create_order(order_id, batch, defaults={
+        'product': product,
+        'quantity': quantity,
+        'status': 'pending',
+        'retail_store': retail_store_user
+    })
+
+    # Create a notification for the distributor
+    notification_message = f"New order placed. Order ID: {order_id}, Product ID: {product_id}, Quantity: {quantity}."
+    send_notification(retail_store_user, distributor_user, notification_message, batch, event)
+    logging.debug(f"Notification created for Order ID {order_id}")
+
+    if created:
+        logging.info(f"Order ID {order_id} placed successfully.")
+    else:
+        logging.info(f"Order ID {order_id} already exists, skipping creation.")
+        
+
+
+
+
+
+# Handler for 'OrderProcessed' event
+def handle_order_processed_event(event, batch=None):
+    order_id = event['args']['orderId']
+    product_id = event['args']['productId']
+    quantity = event['args']['quantity']
+    is_available = event['args']['isAvailable']  # Whether the product is available for processing
+
+    logging.info(f"OrderProcessed event received for Order ID: {order_id}, Product ID: {product_id}, Quantity: {quantity}, Availability: {is_available}")
+
+    # Fetch the order from the database
+    order = get_order(order_id, batch)
+
+    # If available, mark the order as processed and create a delivery
+    if is_available:
+        order.status = 'processed'
+        order.save()
+
+        delivery, created = Delivery.objects.get_or_create(
+            order=order,
             defaults={
-                'product': product,
-                'quantity': quantity,
-                'status': 'pending',
-                'retail_store': retail_store_user
+                'delivery_status': 'in_transit',
+                'retail_store': order.retail_store,
+                'distributor': get_user_by_role('distributor')  # Get the distributor user
             }
         )
 
-        # Create a notification for the distributor
-        notification_message = f"New order placed. Order ID: {order_id}, Product ID: {product_id}, Quantity: {quantity}."
-        Notification.objects.create(
-            sender=retail_store_user,
-            receiver=distributor_user,
-            message=notification_message,
-        )
-        logging.debug(f"Notification created for Order ID {order_id}")
+        logging.info(f"Order ID {order_id} processed successfully. Delivery {'created' if created else 'already exists'}.")
 
-        if created:
-            logging.info(f"Order ID {order_id} placed successfully.")
-        else:
-            logging.info(f"Order ID {order_id} already exists, skipping creation.")
-            
-    except Product.DoesNotExist:
-        logging.warning(f"Product with ID {product_id} does not exist in the database.")
-    except User.DoesNotExist:
-        logging.warning(f"Retail store user with Ethereum address {retail_store_address} does not exist in the database.")
-    except Exception as e:
-        logging.error(f"An error occurred while handling OrderPlaced event: {str(e)}")
+    else:
+        order.status = 'awaiting_manufacture'
+        order.save()
+        logging.info(f"Order ID {order_id} marked as awaiting manufacture.")
 
 
 
 
 
-### Event Listener for 'OrderProcessed' Event ###
-def listen_order_processed_event(stop_event):
-    latest_block = web3.eth.block_number  # Get the latest block
+# Handler for 'DeliveryInitiated' event
+def handle_delivery_initiated_event(event, batch=None):
+    order_id = event['args']['orderId']
+    product_id = event['args']['productId']
+    quantity = event['args']['quantity']
+    retail_store_address = event['args']['retailStore']
 
-    while not stop_event.is_set():
-        try:
-            event_filter = {
-                'fromBlock': latest_block + 1,
-                'toBlock': 'latest',
-                'address': distributor_contract.address,
-                'topics': [get_event_topic_hash("OrderProcessed(uint256,uint256,uint256,bool)")]
-            }
+    logging.info(f"Received DeliveryInitiated event for Order ID: {order_id}")
+    project_delivery_initiated(event, batch)
 
-            events = web3.eth.get_logs(event_filter)
+    # Get the retail store user by Ethereum address
+    retail_store_user = get_user_by_address(retail_store_address)# Get the retail store user by Ethereum address 
+    distributor_user = get_user_by_role('distributor')  # Get the distributor user 
 
-            for event in events:
-                processed_event = distributor_contract.events.OrderProcessed().process_log(event)
-                handle_order_processed_event(processed_event)  # Process the 'OrderProcessed' event
+    # Fetch the product and update its quantity
+    product = get_product(product_id, batch)
+    adjust_product_quantity(product, -quantity, batch)  # Decrease the product's stock by the delivered quantity
 
-            latest_block = web3.eth.block_number  # Update latest block number
+    # Notify the retail store about the initiated delivery
+    notification_message = f"Delivery initiated for Order ID: {order_id}. Product ID: {product_id}, Quantity: {quantity}."
+    send_notification(distributor_user, retail_store_user, notification_message, batch, event)
+    logging.info(f"Notification sent to retail store for Order ID {order_id}")
 
-        except Exception as e:
-            logging.error(f"An error occurred while listening for OrderProcessed events: {str(e)}")
 
-        time.sleep(2)
 
 
-# Handler for 'OrderProcessed' event
-def handle_order_processed_event(event):
+
+
+# Handler for 'DeliveryConfirmed' event
+def handle_delivery_confirmed_event(event, batch=None):
+    order_id = event['args']['orderId']
+    retail_store_address = event['args']['retailStore']
+
+    retail_store_user = get_user_by_address(retail_store_address)# Get the retail store user by Ethereum address
+    distributor_user = get_user_by_role('distributor')# Get distributor user 
+
+    # Notify the distributor that the delivery has been confirmed
+    notification_message = f"Delivery confirmed for Order ID: {order_id}"
+    send_notification(retail_store_user, distributor_user, notification_message, batch, event)
+    logging.info(f"Notification created for DeliveryConfirmed event - Order ID {order_id}")
+    
+
+
+
+
+
+# Handler for 'ManufacturerContacted' event
+def handle_manufacturer_contacted_event(event, batch=None):
     order_id = event['args']['orderId']
     product_id = event['args']['productId']
     quantity = event['args']['quantity']
-    is_available = event['args']['isAvailable']  # Whether the product is available for processing
 
-    logging.info(f"OrderProcessed event received for Order ID: {order_id}, Product ID: {product_id}, Quantity: {quantity}, Availability: {is_available}")
+    distributor_user = get_user_by_role('distributor')   # Get the distributor user
+    manufacturer_user = get_user_by_role('manufacturer') # Get the manufacturer user 
 
-    try:
-        # Fetch the order from the database
-        order = Order.objects.get(id=order_id)
-
-        # If available, mark the order as processed and create a delivery
-        if is_available:
-            order.status = 'processed'
-            order.save()
-
-            delivery, created = Delivery.objects.get_or_create(
-                order=order,
-                defaults={
-                    'delivery_status': 'in_transit',
-                    'retail_store': order.retail_store,
-                    'distributor': User.objects.get(user_role='distributor')  # Get the distributor user
-                }
-            )
+    # Notify the manufacturer about the contact for this order
+    notification_message = f"Manufacturer contacted for Order ID: {order_id}, Product ID: {product_id}, Quantity: {quantity}"
+    send_notification(distributor_user, manufacturer_user, notification_message, batch, event)
+    logging.info(f"Notification created for ManufacturerContacted event - Order ID {order_id}")
+    
 
-            logging.info(f"Order ID {order_id} processed successfully. Delivery {'created' if created else 'already exists'}.")
 
-        else:
-            order.status = 'awaiting_manufacture'
-            order.save()
-            logging.info(f"Order ID {order_id} marked as awaiting manufacture.")
-
-    except Order.DoesNotExist:
-        logging.warning(f"Order with ID {order_id} does not exist in the database.")
-    except User.DoesNotExist:
-        logging.warning("Distributor user does not exist in the database.")
-    except Exception as e:
-        logging.error(f"An error occurred while handling OrderProcessed event: {str(e)}")
 
 
 
+# Handler for 'ProductCreated' event
+def handle_product_created_event(event, batch=None):
+    order_id = event['args']['orderId']
+    product_id = event['args']['productId']
+    quantity = event['args']['quantity']
 
-### Listener for 'DeliveryInitiated' Event ###
-def listen_delivery_initiated_event(stop_event):
-    latest_block = web3.eth.block_number
+    logging.info(f"ProductCreated event received for Order ID: {order_id}, Product ID: {product_id}, Quantity: {quantity}")
 
-    while not stop_event.is_set():
-        try:
-            event_filter = {
-                'fromBlock': latest_block + 1,
-                'toBlock': 'latest',
-                'address': delivery_contract.address,
-                'topics': [get_event_topic_hash("DeliveryInitiated(uint256,uint256,uint256,address)")]
-            }
+    distributor_user = get_user_by_role('distributor')  # Get the distributor user 
+    manufacturer_user = get_user_by_role('manufacturer')  # Get the manufacturer user
 
-            events = web3.eth.get_logs(event_filter)
+    # Update the product quantity in the database
+    product = get_product(product_id, batch)
+    adjust_product_quantity(product, quantity, batch)  # Increase product quantity based on event
 
-            for event in events:
-                processed_event = delivery_contract.events.DeliveryInitiated().process_log(event)
-                handle_delivery_initiated_event(processed_event)  # Process the 'DeliveryInitiated' event
+    # Notify the distributor that the product was created
+    notification_message = f"Product created with new quantity for Order ID: {order_id}, Product ID: {product_id}"
+    send_notification(manufacturer_user, distributor_user, notification_message, batch, event)
+    logging.info(f"Product ID {product_id} updated with new quantity: {product.quantity}")
 
-            latest_block = web3.eth.block_number
 
-        except Exception as e:
-            logging.error(f"An error occurred while listening for DeliveryInitiated events: {str(e)}")
 
-        time.sleep(2)
 
 
-# Handler for 'DeliveryInitiated' event
-def handle_delivery_initiated_event(event):
+
+
+# Handler for 'ManufacturerNotified' event
+def handle_manufacturer_notified_event(event, batch=None):
     order_id = event['args']['orderId']
     product_id = event['args']['productId']
     quantity = event['args']['quantity']
-    retail_store_address = event['args']['retailStore']
 
-    logging.info(f"Received DeliveryInitiated event for Order ID: {order_id}")
+    distributor_user = get_user_by_role('distributor')  # Get the distributor user
+    manufacturer_user = get_user_by_role('manufacturer')  # Get the manufacturer user 
 
-    try:
-        # Get the retail store user by Ethereum address
-        retail_store_user = User.objects.get(eth_address__iexact=retail_store_address)# Get the retail store user by Ethereum address 
-        distributor_user = User.objects.get(user_role='distributor')  # Get the distributor user 
-
-        # Fetch the product and update its quantity
-        product = Product.objects.get(product_id=product_id)
-        product.quantity -= quantity  # Decrease the product's stock by the delivered quantity
-        product.save()
-
-        # Notify the retail store about the initiated delivery
-        notification_message = f"Delivery initiated for Order ID: {order_id}. Product ID: {product_id}, Quantity: {quantity}."
-        Notification.objects.create(
-            sender=distributor_user,
-            receiver=retail_store_user,
-            message=notification_message,
-        )
-        logging.info(f"Notification sent to retail store for Order ID {order_id}")
+    # Notify the manufacturer that they were contacted for this order
+    notification_message = f"Manufacturer notified for Order ID: {order_id}, Product ID: {product_id}, Quantity: {quantity}"
+    send_notification(distributor_user, manufacturer_user, notification_message, batch, event)
+    logging.info(f"Notification created for ManufacturerNotified event - Order ID {order_id}, Product ID {product_id}")
+    
 
-    except User.DoesNotExist as e:
-        logging.error(f"User does not exist: {str(e)}")
-    except Exception as e:
-        logging.error(f"An error occurred while handling DeliveryInitiated event: {str(e)}")
 
 
 
+# Handler for 'StatusUpdated' event, which only changes the read model
+def handle_status_updated_event(event, batch=None):
+    project_status_updated(event, batch)
+    logging.info(f"Order ID {event['args']['orderId']} is now {DELIVERY_STATUSES[event['args']['status']]} on chain")
 
 
-### Listener and Handler for 'DeliveryConfirmed' Event ###
-def listen_delivery_confirmed_event(stop_event):
-    latest_block = web3.eth.block_number
 
-    while not stop_event.is_set():
-        try:
-            event_filter = {
-                'fromBlock': latest_block + 1,
-                'toBlock': 'latest',
-                'address': delivery_contract.address,
-                'topics': [get_event_topic_hash("DeliveryConfirmed(uint256,address)")]
-            }
 
-            events = web3.eth.get_logs(event_filter)
 
-            for event in events:
-                processed_event = delivery_contract.events.DeliveryConfirmed().process_log(event)
-                handle_delivery_confirmed_event(processed_event)  # Process the 'DeliveryConfirmed' event
+# Handler for 'InventoryUpdated' event, which only changes the read model
+def handle_inventory_updated_event(event, batch=None):
+    project_inventory_updated(event, batch)
+    logging.info(f"Product ID {event['args']['productId']} has {event['args']['newQuantity']} on chain")
 
-            latest_block = web3.eth.block_number
 
-        except Exception as e:
-            logging.error(f"An error occurred while listening for DeliveryConfirmed events: {str(e)}")
 
-        time.sleep(2)
 
+### Event Routing ###
 
-# Handler for 'DeliveryConfirmed' event
-def handle_delivery_confirmed_event(event):
-    order_id = event['args']['orderId']
-    retail_store_address = event['args']['retailStore']
+# Every event the listener reacts to: (contract, event name, event signature, handler)
+EVENT_SUBSCRIPTIONS = [
+    (retail_store_contract, "OrderPlaced", "OrderPlaced(uint256,uint256,uint256,address)", handle_order_placed_event),
+    (distributor_contract, "OrderProcessed", "OrderProcessed(uint256,uint256,uint256,bool)", handle_order_processed_event),
+    (delivery_contract, "DeliveryInitiated", "DeliveryInitiated(uint256,uint256,uint256,address)", handle_delivery_initiated_event),
+    (delivery_contract, "DeliveryConfirmed", "DeliveryConfirmed(uint256,address)", handle_delivery_confirmed_event),
+    (distributor_contract, "ManufacturerContacted", "ManufacturerContacted(uint256,uint256,uint256)", handle_manufacturer_contacted_event),
+    (manufacturer_contract, "ProductCreated", "ProductCreated(uint256,uint256,uint256)", handle_product_created_event),
+    (distributor_contract, "ManufacturerNotified", "ManufacturerNotified(uint256,uint256,uint256)", handle_manufacturer_notified_event),
+    (delivery_contract, "StatusUpdated", "StatusUpdated(uint256,uint8)", handle_status_updated_event),
+    (distributor_contract, "InventoryUpdated", "InventoryUpdated(uint256,uint256)", handle_inventory_updated_event),
+]
+
+# Route each (contract address, topic hash) pair to the contract event and its handler
+EVENT_ROUTES = {
+    (contract.address, get_event_topic_hash(signature)): (contract, event_name, handler)
+    for contract, event_name, signature, handler in EVENT_SUBSCRIPTIONS
+}
+
+POLL_INTERVAL = float(os.getenv('LISTENER_POLL_INTERVAL', 1))  # Seconds between polls when websockets are unavailable
+
+
+# Build a single log filter covering every contract address and every event topic
+def build_log_filter(from_block=None, to_block=None):
+    log_filter = {
+        'address': sorted({address for address, _ in EVENT_ROUTES}),
+        'topics': [sorted({topic for _, topic in EVENT_ROUTES})],  # Match any of the topics in the first position
+    }
+    if from_block is not None:  # Subscriptions take the filter without a block range
+        log_filter['fromBlock'] = from_block
+        log_filter['toBlock'] = to_block
+    return log_filter
 
+
+# Handler for each event name, used to dispatch decoded events
+EVENT_HANDLERS = {event_name: handler for _, event_name, _, handler in EVENT_SUBSCRIPTIONS}
+
+
+# Decode a raw log with the ABI of the contract and event registered for its address and topic
+def decode_log(log):
+    route = EVENT_ROUTES.get((log['address'], Web3.to_hex(log['topics'][0])))
+    if route is None:  # The same topic emitted by another of our contracts is not something we handle
+        return None
+
+    contract, event_name, _ = route
     try:
-        retail_store_user = User.objects.get(eth_address__iexact=retail_store_address)# Get the retail store user by Ethereum address
-        distributor_user = User.objects.get(user_role='distributor')# Get distributor user 
-
-        # Notify the distributor that the delivery has been confirmed
-        notification_message = f"Delivery confirmed for Order ID: {order_id}"
-        Notification.objects.create(
-            sender=retail_store_user,
-            receiver=distributor_user,
-            message=notification_message,
-        )
-        logging.info(f"Notification created for DeliveryConfirmed event - Order ID {order_id}")
-        
-    except User.DoesNotExist as e:
-        logging.warning(f"User does not exist: {str(e)}")
+        return contract.events[event_name]().process_log(log)
     except Exception as e:
-        logging.error(f"An error occurred while handling DeliveryConfirmed event: {str(e)}")
+        logging.error(f"Could not decode {event_name} log in transaction {Web3.to_hex(log['transactionHash'])}: {str(e)}")
+        return None
 
 
+# Unique key of an event in the chain: (transaction hash, log index)
+def event_key(event):
+    return (Web3.to_hex(event['transactionHash']), event['logIndex'])
 
 
+# Raised when the ProcessedEvent ledger already holds an event
+class DuplicateEvent(Exception):
+    pass
 
-### Listener and Handler for 'ManufacturerContacted' Event ###
-def listen_manufacturer_contacted_event(stop_event):
-    latest_block = web3.eth.block_number
 
-    while not stop_event.is_set():
-        try:
-            event_filter = {
-                'fromBlock': latest_block + 1,
-                'toBlock': 'latest',
-                'address': distributor_contract.address,
-                'topics': [get_event_topic_hash("ManufacturerContacted(uint256,uint256,uint256)")]
-            }
+DB_INT_MAX = 2 ** 63 - 1  # Largest integer the database columns hold, while uint256 event arguments go far beyond
+
+
+# Raise for an event with integer arguments the database cannot store, before they reach the batch queries
+def validate_event_args(event):
+    for name, value in event['args'].items():
+        if isinstance(value, int) and not 0 <= value <= DB_INT_MAX:
+            raise ValueError(f"{name} {value} is out of range.")
 
-            events = web3.eth.get_logs(event_filter)
 
-            for event in events:
-                processed_event = distributor_contract.events.ManufacturerContacted().process_log(event)
-                handle_manufacturer_contacted_event(processed_event)
+# Record an event that could not be handled in the dead-letter table
+def dead_letter_event(event, error, stage, retry=True):
+    tx_hash, log_index = event_key(event)
+    logging.error(f"An error occurred while handling {event['event']} event {tx_hash}:{log_index}: {str(error)}")
+    record_failed_event(event, error, retry)
+    metrics.events_handled.inc(event=event['event'], outcome='failed')
+    metrics.record_error(stage, error)
 
-            latest_block = web3.eth.block_number
 
+# Run the handlers for a list of decoded events, in one batch. Events with arguments the database cannot
+# hold are dead-lettered up front; if the batch still cannot be loaded or written, its events are handled
+# one at a time, so a single bad event is dead-lettered instead of failing (and blocking) the whole batch.
+# Must be called inside a transaction so the deferred writes commit together with the handlers.
+def dispatch_events(events):
+    valid_events = []
+    for event in events:
+        try:
+            validate_event_args(event)
+        except ValueError as e:
+            dead_letter_event(event, e, 'validate', retry=False)  # Would fail the same way on every retry
+            continue
+        valid_events.append(event)
+    if not valid_events:
+        return
+
+    try:
+        with transaction.atomic():  # Savepoint, so a failed batch leaves nothing behind
+            dispatch_batch(valid_events)
+    except Exception as e:
+        if len(valid_events) == 1:
+            dead_letter_event(valid_events[0], e, 'batch')
+            return
+        logging.error(f"A batch of {len(valid_events)} events failed, handling them one at a time: {str(e)}")
+        for event in valid_events:
+            dispatch_events([event])
+
+
+# Run the handlers for a list of decoded events, sharing one EventBatch between them.
+# Each event is recorded in the ProcessedEvent ledger before its handler runs, so a log that was
+# already handled (replayed range, overlapping backfill, retry) is skipped instead of applied twice.
+def dispatch_batch(events):
+    batch = EventBatch(events)
+
+    for event in events:
+        tx_hash, log_index = event_key(event)
+        if (tx_hash, log_index) in batch.processed:
+            logging.info(f"Skipping {event['event']} {tx_hash}:{log_index}, already processed.")
+            metrics.events_handled.inc(event=event['event'], outcome='duplicate')
+            continue
+
+        batch_savepoint = batch.savepoint()
+        try:
+            with transaction.atomic(), metrics.handler_duration.time(event=event['event']):  # Savepoint so a failing handler cannot poison the batch
+                try:
+                    ProcessedEvent.objects.create(
+                        tx_hash=tx_hash,
+                        log_index=log_index,
+                        block_number=event['blockNumber'],
+                        block_hash=Web3.to_hex(event['blockHash']),
+                        event_name=event['event'],
+                        args=dict(event['args']),
+                    )
+                except IntegrityError as e:  # Only the ledger insert; a handler's IntegrityError is a failure like any other
+                    raise DuplicateEvent() from e
+                EVENT_HANDLERS[event['event']](event, batch)
+        except DuplicateEvent:  # Another process recorded the event between our prefetch and insert
+            logging.info(f"Skipping {event['event']} {tx_hash}:{log_index}, processed concurrently.")
+            batch.rollback(batch_savepoint)
+            metrics.events_handled.inc(event=event['event'], outcome='duplicate')
+            continue
         except Exception as e:
-            logging.error(f"An error occurred while listening for ManufacturerContacted events: {str(e)}")
+            batch.rollback(batch_savepoint)
+            dead_letter_event(event, e, 'handler')
+            continue
+
+        batch.processed.add((tx_hash, log_index))
+        metrics.events_handled.inc(event=event['event'], outcome='processed')
+
+    batch.flush()
+
 
-        time.sleep(2)
+HANDLER_WORKERS = int(os.getenv('LISTENER_HANDLER_WORKERS', 1))  # Partitions handled concurrently, each on its own DB connection
+_handler_executor = None
+
+
+# Events of the same order must be handled in chain order; events of different orders need not be
+def partition_key(event):
+    args = event['args']
+    if 'orderId' in args:
+        return args['orderId']
+    return args.get('productId', 0)  # Inventory events without an order are ordered per product
+
+
+# SQLite cannot upgrade concurrent read transactions to writes, so partitions only run in parallel elsewhere
+def handler_workers():
+    return 1 if connection.vendor == 'sqlite' else HANDLER_WORKERS
+
+
+# Split events into worker lists, keeping the chain order within each list
+def partition_events(events, workers):
+    partitions = [[] for _ in range(workers)]
+    for event in events:
+        partitions[hash(partition_key(event)) % workers].append(event)
+    return [partition for partition in partitions if partition]
+
+
+def dispatch_partition(events):
+    with transaction.atomic():
+        dispatch_events(events)
 
 
-# Handler for 'ManufacturerContacted' event
-def handle_manufacturer_contacted_event(event):
-    order_id = event['args']['orderId']
-    product_id = event['args']['productId']
-    quantity = event['args']['quantity']
+# Run the handlers for a list of decoded events, concurrently per partition when HANDLER_WORKERS > 1.
+# With one worker the events are dispatched in the caller's transaction, as before. With more, every
+# partition commits in its own worker thread and transaction, and this returns once all of them have
+# finished, so the caller only advances the checkpoint after the whole batch is handled. A partition
+# that fails is retried with the rest of the batch; the ledger skips the events that did commit.
+def dispatch_partitioned(events):
+    global _handler_executor
 
-    try:
-        distributor_user = User.objects.get(user_role='distributor')   # Get the distributor user
-        manufacturer_user = User.objects.get(user_role='manufacturer') # Get the manufacturer user 
-
-        # Notify the manufacturer about the contact for this order
-        notification_message = f"Manufacturer contacted for Order ID: {order_id}, Product ID: {product_id}, Quantity: {quantity}"
-        Notification.objects.create(
-            sender=distributor_user,
-            receiver=manufacturer_user,
-            message=notification_message,
+    workers = handler_workers()
+    partitions = partition_events(events, workers) if workers > 1 else [events]
+    if len(partitions) <= 1:
+        dispatch_events(events)
+        return
+
+    if _handler_executor is None:
+        _handler_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='listener-handler')
+
+    futures = [_handler_executor.submit(dispatch_partition, partition) for partition in partitions]
+    for future in futures:  # Wait for every partition before raising, so none is still running when the batch is retried
+        future.exception()
+    for future in futures:
+        future.result()
+
+
+### Dead-Letter Queue ###
+
+RETRY_BASE_DELAY = int(os.getenv('DEAD_LETTER_BASE_DELAY', 30))  # Seconds before the first retry, doubled on each attempt
+RETRY_MAX_DELAY = int(os.getenv('DEAD_LETTER_MAX_DELAY', 6 * 60 * 60))  # Upper bound for the backoff
+RETRY_MAX_ATTEMPTS = int(os.getenv('DEAD_LETTER_MAX_ATTEMPTS', 10))  # Attempts before an event is abandoned
+RETRY_INTERVAL = int(os.getenv('DEAD_LETTER_RETRY_INTERVAL', 30))  # Seconds between retry worker runs
+
+
+# Persist a decoded event whose handler failed, or bump the attempt count of one that failed before.
+# Events that cannot succeed on a retry are abandoned straight away.
+def record_failed_event(event, error, retry=True):
+    tx_hash, log_index = event_key(event)
+    failed_event, created = FailedEvent.objects.get_or_create(
+        tx_hash=tx_hash,
+        log_index=log_index,
+        defaults={
+            'block_number': event['blockNumber'],
+            'block_hash': Web3.to_hex(event['blockHash']),
+            'event_name': event['event'],
+            'args': dict(event['args']),
+            'error': str(error),
+        }
+    )
+    if not created:
+        failed_event.attempts += 1
+        failed_event.error = str(error)
+
+    # Exponential backoff: base, 2x base, 4x base, ... capped at the maximum delay
+    delay = min(RETRY_BASE_DELAY * 2 ** (failed_event.attempts - 1), RETRY_MAX_DELAY)
+    failed_event.next_retry_at = timezone.now() + timedelta(seconds=delay)
+    failed_event.status = 'pending' if retry and failed_event.attempts < RETRY_MAX_ATTEMPTS else 'abandoned'
+    failed_event.save()
+
+
+# Rebuild the decoded event a dead-letter row was created from
+def failed_event_to_event(failed_event):
+    return {
+        'event': failed_event.event_name,
+        'args': failed_event.args,
+        'transactionHash': HexBytes(failed_event.tx_hash),
+        'logIndex': failed_event.log_index,
+        'blockNumber': failed_event.block_number,
+        'blockHash': HexBytes(failed_event.block_hash),
+    }
+
+
+# Re-run the handlers for dead-letter rows and mark the ones that now succeed as resolved.
+# Events are replayed in chain order so that, for example, an order is created before its delivery.
+def replay_failed_events(failed_events):
+    failed_events = sorted(failed_events, key=lambda failed_event: (failed_event.block_number, failed_event.log_index))
+    if not failed_events:
+        return 0
+
+    with transaction.atomic():
+        dispatch_events([failed_event_to_event(failed_event) for failed_event in failed_events])
+
+        processed = set(ProcessedEvent.objects.filter(
+            tx_hash__in={failed_event.tx_hash for failed_event in failed_events}
+        ).values_list('tx_hash', 'log_index'))
+        resolved_ids = [failed_event.pk for failed_event in failed_events
+                        if (failed_event.tx_hash, failed_event.log_index) in processed]
+        FailedEvent.objects.filter(pk__in=resolved_ids).update(status='resolved', updated_at=timezone.now())
+
+    logging.info(f"Retried {len(failed_events)} failed events, {len(resolved_ids)} resolved.")
+    return len(resolved_ids)
+
+
+# Retry every pending dead-letter row whose backoff has elapsed
+def retry_due_failed_events():
+    due = FailedEvent.objects.filter(status='pending', next_retry_at__lte=timezone.now())
+    return replay_failed_events(list(due))
+
+
+### Reorg Handling ###
+
+# Undo the database effects of an event whose block was orphaned, from the arguments stored in the ledger
+def revert_order_placed_event(args):
+    # Only orders nothing else has happened to yet can be removed safely
+    Order.objects.filter(id=args['orderId'], status='pending', delivery__isnull=True).delete()
+
+
+def revert_order_processed_event(args):
+    # Put the order back to pending, and drop the delivery the handler created for it unless it has moved on since
+    status = 'processed' if args['isAvailable'] else 'awaiting_manufacture'
+    if not Order.objects.filter(id=args['orderId'], status=status).update(status='pending'):
+        return
+    if args['isAvailable']:
+        Delivery.objects.filter(order_id=args['orderId'], delivery_status='in_transit').delete()
+
+
+def revert_delivery_initiated_event(args):
+    Product.objects.filter(product_id=args['productId']).update(quantity=F('quantity') + args['quantity'])
+
+
+def revert_product_created_event(args):
+    Product.objects.filter(product_id=args['productId']).update(quantity=F('quantity') - args['quantity'])
+
+
+# Events whose handlers change more than notifications need a revert function
+REVERT_HANDLERS = {
+    'OrderPlaced': revert_order_placed_event,
+    'OrderProcessed': revert_order_processed_event,
+    'DeliveryInitiated': revert_delivery_initiated_event,
+    'ProductCreated': revert_product_created_event,
+}
+
+REORG_WINDOW = int(os.getenv('LISTENER_REORG_WINDOW', 64))  # How many blocks back a fork point is searched for
+
+
+# Blocks holding processed events near the checkpoint, newest first, with the hash they were processed at
+def recent_event_blocks(checkpoint):
+    return list(
+        ProcessedEvent.objects.filter(block_number__gt=checkpoint.block_number - REORG_WINDOW)
+        .values_list('block_number', 'block_hash').distinct().order_by('-block_number')
+    )
+
+
+# Revert every event processed above block_number with the notifications it sent, drop the failed ones, and move the checkpoint back to it
+def rollback_to_block(checkpoint, block_number, block_hash=''):
+    with transaction.atomic():
+        orphaned = ProcessedEvent.objects.filter(block_number__gt=block_number).order_by('-block_number', '-log_index')
+        order_ids, product_ids = set(), set()
+        for record in orphaned:
+            revert = REVERT_HANDLERS.get(record.event_name)
+            if revert is not None:
+                revert(record.args)
+            # Projected rows are rebuilt from the events that remain
+            if record.event_name == 'InventoryUpdated':
+                product_ids.add(record.args['productId'])
+            elif record.event_name in PROJECTIONS:
+                order_ids.add(record.args['orderId'])
+            logging.warning(f"Reverted {record} after a chain reorganisation.")
+        # Notifications the orphaned events sent, which may not happen on the new chain
+        Notification.objects.filter(tx_hash__in=orphaned.values('tx_hash')).delete()
+        orphaned.delete()
+        if order_ids or product_ids:
+            rebuild_read_model(order_ids, product_ids)
+
+        # Failed events from the orphaned blocks must not be retried; the new chain's logs are handled afresh
+        dropped = FailedEvent.objects.filter(block_number__gt=block_number).delete()[0]
+        if dropped:
+            logging.warning(f"Dropped {dropped} failed events from orphaned blocks after a chain reorganisation.")
+
+        BlockCheckpoint.objects.filter(pk=checkpoint.pk).update(
+            block_number=block_number, log_index=None, block_hash=block_hash, updated_at=timezone.now()
         )
-        logging.info(f"Notification created for ManufacturerContacted event - Order ID {order_id}")
-        
-    except User.DoesNotExist as e:
-        logging.warning(f"User does not exist: {str(e)}")
-    except Exception as e:
-        logging.error(f"An error occurred while handling ManufacturerContacted event: {str(e)}")
 
+    checkpoint.block_number = block_number
+    checkpoint.log_index = None
+    checkpoint.block_hash = block_hash
 
 
+CHECKPOINT_STREAM = 'supplychain_events'  # Name of the checkpoint row used by the listener
 
 
-### Listener and Handler for 'ProductCreated' Event ###
-def listen_product_created_event(stop_event):
-    latest_block = web3.eth.block_number
+# Load the stored checkpoint for a stream, starting a new one at the current head if none exists
+def load_checkpoint(stream):
+    latest_block = web3.eth.get_block('latest')
+    checkpoint, created = BlockCheckpoint.objects.get_or_create(
+        stream=stream,
+        defaults={'block_number': latest_block['number'], 'block_hash': Web3.to_hex(latest_block['hash'])}
+    )
+    if created:
+        logging.info(f"No checkpoint found for {stream}, starting from block {checkpoint.block_number}")
+    else:
+        logging.info(f"Resuming {stream} after block {checkpoint.block_number}")
+    return checkpoint
 
-    while not stop_event.is_set():
-        try:
-            event_filter = {
-                'fromBlock': latest_block + 1,
-                'toBlock': 'latest',
-                'address': manufacturer_contract.address,
-                'topics': [get_event_topic_hash("ProductCreated(uint256,uint256,uint256)")]
-            }
 
-            events = web3.eth.get_logs(event_filter)
+# Position of a log in the chain, comparable with checkpoint_position()
+def log_position(log):
+    return (log['blockNumber'], log['logIndex'])
 
-            for event in events:
-                processed_event = manufacturer_contract.events.ProductCreated().process_log(event)
-                handle_product_created_event(processed_event)
 
-            latest_block = web3.eth.block_number
+# Position up to which a checkpoint has processed logs; without a log index it covers its whole block
+def checkpoint_position(checkpoint):
+    if checkpoint.log_index is None:
+        return (checkpoint.block_number, float('inf'))
+    return (checkpoint.block_number, checkpoint.log_index)
 
-        except Exception as e:
-            logging.error(f"An error occurred while listening for ProductCreated events: {str(e)}")
 
-        time.sleep(2)
+# First block that may still hold unprocessed logs
+def checkpoint_next_block(checkpoint):
+    return checkpoint.block_number + 1 if checkpoint.log_index is None else checkpoint.block_number
 
 
+# Dispatch a batch of logs and advance the checkpoint in the same database transaction.
+# With to_block the whole range is marked as processed, otherwise the cursor stops at the last log.
+# block_hash is the hash of the block the checkpoint ends on, if known, for reorg detection.
+def process_logs(logs, checkpoint, to_block=None, block_hash='', project_only=False):
+    position = checkpoint_position(checkpoint)
+    logs = [log for log in logs if log_position(log) > position]  # Skip anything the checkpoint already covers
 
-# Handler for 'ProductCreated' event
-def handle_product_created_event(event):
-    order_id = event['args']['orderId']
-    product_id = event['args']['productId']
-    quantity = event['args']['quantity']
+    if to_block is not None:
+        block_number, log_index = to_block, None
+    elif logs:
+        block_number, log_index = log_position(logs[-1])
+        block_hash = Web3.to_hex(logs[-1]['blockHash'])
+    else:
+        return
 
-    logging.info(f"ProductCreated event received for Order ID: {order_id}, Product ID: {product_id}, Quantity: {quantity}")
+    events = [event for event in map(decode_log, logs) if event is not None]
 
-    try:
-        distributor_user = User.objects.get(user_role='distributor')  # Get the distributor user 
-        manufacturer_user = User.objects.get(user_role='manufacturer')  # Get the manufacturer user
-
-        # Update the product quantity in the database
-        product = Product.objects.get(product_id=product_id)
-        product.quantity += quantity  # Increase product quantity based on event
-        product.save()
-
-        # Notify the distributor that the product was created
-        notification_message = f"Product created with new quantity for Order ID: {order_id}, Product ID: {product_id}"
-        Notification.objects.create(
-            sender=manufacturer_user,
-            receiver=distributor_user,
-            message=notification_message,
+    with transaction.atomic():
+        if project_only:
+            record_events(events)
+        else:
+            dispatch_partitioned(events)
+
+        BlockCheckpoint.objects.filter(pk=checkpoint.pk).update(
+            block_number=block_number, log_index=log_index, block_hash=block_hash, updated_at=timezone.now()
         )
-        logging.info(f"Product ID {product_id} updated with new quantity: {product.quantity}")
 
-    except Product.DoesNotExist:
-        logging.warning(f"Product with ID {product_id} does not exist in the database.")
-    except Exception as e:
-        logging.error(f"An error occurred while handling ProductCreated event: {str(e)}")
+    # Only move the in-memory cursor once the transaction has committed
+    checkpoint.block_number = block_number
+    checkpoint.log_index = log_index
+    checkpoint.block_hash = block_hash
+
+
+### Asyncio Event Runtime ###
+
+CONFIRMATIONS = int(os.getenv('LISTENER_CONFIRMATIONS', 0))  # Blocks a log must be buried under before it is processed
+METRICS_PORT = int(os.getenv('LISTENER_METRICS_PORT', 9108))  # Port of the Prometheus /metrics endpoint, 0 to disable
+METRICS_HOST = os.getenv('LISTENER_METRICS_HOST', '127.0.0.1')  # Local only by default
+# Seconds without a successful iteration before /healthz reports the listener as stuck, 0 to disable.
+# An idle log subscription only beats when events arrive, so keep this above the quietest expected period.
+HEARTBEAT_TIMEOUT = float(os.getenv('LISTENER_HEARTBEAT_TIMEOUT', 300))
+
+
+# Hash of a block on the current chain, reusing the latest block where possible to save a call
+async def canonical_hash(async_web3, block_number, latest_block):
+    if block_number == latest_block['number']:
+        return Web3.to_hex(latest_block['hash'])
+    if block_number == latest_block['number'] - 1:
+        return Web3.to_hex(latest_block['parentHash'])
+    if block_number > latest_block['number']:  # The chain is now shorter than the recorded block
+        return None
+    with metrics.rpc_duration.time(method='eth_getBlockByNumber'):
+        block = await async_web3.eth.get_block(block_number)
+    return Web3.to_hex(block['hash'])
+
+
+# Compare the checkpoint's block with the chain and roll back to the fork point if it was orphaned
+async def check_reorg(async_web3, checkpoint, latest_block):
+    if not checkpoint.block_hash:  # Nothing recorded to compare against
+        return
+    if await canonical_hash(async_web3, checkpoint.block_number, latest_block) == checkpoint.block_hash:
+        return
+
+    logging.warning(f"Block {checkpoint.block_number} is no longer on the chain, searching for the fork point.")
+
+    # Walk back through blocks we processed events in until one is still canonical
+    fork_number, fork_hash = max(checkpoint.block_number - REORG_WINDOW, 0), ''
+    for block_number, block_hash in await sync_to_async(recent_event_blocks)(checkpoint):
+        if await canonical_hash(async_web3, block_number, latest_block) == block_hash:
+            fork_number, fork_hash = block_number, block_hash
+            break
 
+    await sync_to_async(rollback_to_block)(checkpoint, fork_number, fork_hash)
 
 
+# Fetch and process every confirmed log after the checkpoint with one get_logs call
+async def catch_up(async_web3, checkpoint):
+    with metrics.rpc_duration.time(method='eth_getBlockByNumber'):
+        latest_block = await async_web3.eth.get_block('latest')
+    await check_reorg(async_web3, checkpoint, latest_block)
 
+    target_number = latest_block['number'] - CONFIRMATIONS
+    from_block = checkpoint_next_block(checkpoint)
 
+    if target_number >= from_block:
+        target_hash = await canonical_hash(async_web3, target_number, latest_block)
+        with metrics.rpc_duration.time(method='eth_getLogs'):
+            logs = await async_web3.eth.get_logs(build_log_filter(from_block, target_number))
+        metrics.logs_per_poll.observe(len(logs), stream=checkpoint.stream)
+        await sync_to_async(process_logs)(logs, checkpoint, target_number, target_hash)  # Logs are ordered by block and log index
 
-### Listener and Handler for 'ManufacturerNotified' Event ###
-def listen_manufacturer_notified_event(stop_event):
-    latest_block = web3.eth.block_number
+    metrics.record_position(checkpoint.stream, latest_block['number'], checkpoint.block_number)
 
-    while not stop_event.is_set():
+
+# Fallback for providers without subscriptions, and while a subscription is down: poll get_logs over async HTTP,
+# until ``stop`` is set or for good without one
+async def poll_events(checkpoint, stop=None):
+    stop = stop or asyncio.Event()
+    async_web3 = chain_backend.create_async_web3()
+    logging.info(f"Polling {'the tester chain' if chain_backend.is_tester() else ganache_url} for events every {POLL_INTERVAL} seconds")
+
+    while not stop.is_set():
         try:
-            event_filter = {
-                'fromBlock': latest_block + 1,
-                'toBlock': 'latest',
-                'address': distributor_contract.address,
-                'topics': [get_event_topic_hash("ManufacturerNotified(uint256,uint256,uint256)")]
-            }
+            await catch_up(async_web3, checkpoint)
+            metrics.beat(checkpoint.stream)  # Only successful polls count, so an exception loop shows up as a stale heartbeat
+        except Exception as e:
+            logging.error(f"An error occurred while polling for events: {str(e)}")
+            metrics.record_error('poll', e)
 
-            events = web3.eth.get_logs(event_filter)
+        try:
+            await asyncio.wait_for(stop.wait(), POLL_INTERVAL)  # Sleep, waking up early when stopped
+        except asyncio.TimeoutError:
+            pass
+
+
+# Push-based listener: logs arrive over an eth_subscribe('logs') websocket subscription.
+# ``on_subscribed`` is awaited once the subscription is up, before catching up on what it missed.
+async def subscribe_events(checkpoint, on_subscribed=None):
+    async with AsyncWeb3(WebSocketProvider(websocket_url, max_connection_retries=1), middleware=chain_backend.get_middleware()) as async_web3:
+        # Subscribe before catching up so nothing mined in between is missed; the checkpoint drops duplicates
+        if CONFIRMATIONS:
+            # Logs wait until they are buried, so each new head triggers a range-based catch-up instead
+            await async_web3.eth.subscribe('newHeads')
+        else:
+            await async_web3.eth.subscribe('logs', build_log_filter())
+        logging.info(f"Subscribed to contract events on {websocket_url}")
+        if on_subscribed is not None:
+            await on_subscribed()
+        await catch_up(async_web3, checkpoint)
+        metrics.beat(checkpoint.stream)
+
+        async for response in async_web3.socket.process_subscriptions():
+            result = response['result']
+            if CONFIRMATIONS or result.get('removed'):  # A removed log means a reorg, which catch_up rolls back
+                await catch_up(async_web3, checkpoint)
+            else:
+                metrics.logs_per_poll.observe(1, stream=checkpoint.stream)
+                await sync_to_async(process_logs)([result], checkpoint)
+            metrics.beat(checkpoint.stream)
+
+
+RECONNECT_DELAY = float(os.getenv('LISTENER_RECONNECT_DELAY', 1))  # Seconds before the first websocket reconnect, doubled per failure
+RECONNECT_MAX_DELAY = float(os.getenv('LISTENER_RECONNECT_MAX_DELAY', 60))  # Upper bound of the reconnect delay
+
+
+# Keep a websocket subscription up, reconnecting and resubscribing with exponential backoff when it drops;
+# while it is down, events are polled over HTTP, and polling stops again once the subscription is back
+async def run_subscription(checkpoint):
+    delay, poller, stop_polling = RECONNECT_DELAY, None, asyncio.Event()
+
+    async def stop_poller():
+        nonlocal delay, poller
+        delay = RECONNECT_DELAY  # Connected again, so the next drop starts over with a short delay
+        if poller is not None:
+            stop_polling.set()
+            await poller  # Lets the current poll finish, so only one of them moves the checkpoint at a time
+            poller = None
+            logging.info("Websocket subscription restored, stopped polling.")
+
+    while True:
+        try:
+            await subscribe_events(checkpoint, on_subscribed=stop_poller)
+            error = "the subscription ended"
+        except Exception as e:
+            error = str(e)
+            metrics.record_error('subscribe', e)
+        logging.warning(f"Websocket subscription unavailable ({error}), polling until it reconnects in {delay:g} seconds.")
 
-            for event in events:
-                processed_event = distributor_contract.events.ManufacturerNotified().process_log(event)
-                handle_manufacturer_notified_event(processed_event)
+        if poller is None:
+            stop_polling = asyncio.Event()
+            poller = asyncio.create_task(poll_events(checkpoint, stop_polling))
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RECONNECT_MAX_DELAY)
 
-            latest_block = web3.eth.block_number
 
+# Background task retrying dead-letter events with exponential backoff
+async def retry_failed_events():
+    while True:
+        try:
+            await sync_to_async(retry_due_failed_events)()
         except Exception as e:
-            logging.error(f"An error occurred while listening for ManufacturerNotified events: {str(e)}")
+            logging.error(f"An error occurred while retrying failed events: {str(e)}")
+            metrics.record_error('retry', e)
 
-        time.sleep(2)
+        await asyncio.sleep(RETRY_INTERVAL)
 
 
-# Handler for 'ManufacturerNotified' event
-def handle_manufacturer_notified_event(event):
-    order_id = event['args']['orderId']
-    product_id = event['args']['productId']
-    quantity = event['args']['quantity']
+# Entry point: prefer websocket subscriptions and fall back to HTTP polling while they are unavailable
+async def run_listener():
+    # Checked here rather than at import so the handlers can be imported and replayed without a node
+    if not web3.is_connected():
+        raise Exception("Could not connect to the Ethereum blockchain")
 
-    try:
-        distributor_user = User.objects.get(user_role='distributor')  # Get the distributor user
-        manufacturer_user = User.objects.get(user_role='manufacturer')  # Get the manufacturer user 
-
-        # Notify the manufacturer that they were contacted for this order
-        notification_message = f"Manufacturer notified for Order ID: {order_id}, Product ID: {product_id}, Quantity: {quantity}"
-        Notification.objects.create(
-            sender=distributor_user,
-            receiver=manufacturer_user,
-            message=notification_message,
-        )
-        logging.info(f"Notification created for ManufacturerNotified event - Order ID {order_id}, Product ID {product_id}")
-        
-    except User.DoesNotExist as e:
-        logging.warning(f"User does not exist: {str(e)}")
-    except Exception as e:
-        logging.error(f"An error occurred while handling ManufacturerNotified event: {str(e)}")
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT, METRICS_HOST, stale_after=HEARTBEAT_TIMEOUT or None)
+        logging.info(f"Serving listener metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+    if HANDLER_WORKERS > 1 and handler_workers() == 1:
+        logging.warning("LISTENER_HANDLER_WORKERS is ignored on SQLite, handling events serially.")
 
+    checkpoint = await sync_to_async(load_checkpoint)(CHECKPOINT_STREAM)
+    retry_task = asyncio.create_task(retry_failed_events())  # Keep a reference so the task is not garbage collected
 
+    if chain_backend.is_tester():  # The in-process tester chain has no websocket endpoint
+        await poll_events(checkpoint)
+    else:
+        await run_subscription(checkpoint)
 
 
-### Running all Event Listeners in Parallel Threads ###
+### Running the Event Listener ###
 if __name__ == "__main__":
-    stop_event = threading.Event()  # Event to stop all listeners when needed
     try:
-        listeners = [
-            threading.Thread(target=listen_order_placed_event, args=(stop_event,)),
-            threading.Thread(target=listen_delivery_initiated_event, args=(stop_event,)),
-            threading.Thread(target=listen_product_created_event, args=(stop_event,)),
-            threading.Thread(target=listen_manufacturer_contacted_event, args=(stop_event,)),
-            threading.Thread(target=listen_delivery_confirmed_event, args=(stop_event,)),
-            threading.Thread(target=listen_order_processed_event, args=(stop_event,)),
-            threading.Thread(target=listen_manufacturer_notified_event, args=(stop_event,)),
-        ]
-        
-        for listener in listeners:
-            listener.start()  # Start each event listener in a separate thread
-
-        while True:
-            time.sleep(1)  # Keep the main thread alive
+        asyncio.run(run_listener())
 
     except KeyboardInterrupt:
-        logging.info("Event listener stopped.")  # Log that listeners were stopped
-        stop_event.set()  # Set the stop event to terminate all listeners
-
-        for listener in listeners:
-            listener.join()  # Wait for each thread to finish cleanly
+        logging.info("Event listener stopped.")  # Log that the listener was stopped
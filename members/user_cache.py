@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from web3 import Web3
+
+
+User = get_user_model()
+
+
+class UserResolver:
+    """In-process cache resolving users by role and by Ethereum address.
+
+    Entries expire after ``ttl`` seconds and the whole cache is cleared whenever a
+    user is saved or deleted in this process, so role changes and new addresses are
+    picked up immediately here and within ``ttl`` in other processes.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._by_role = {}  # role -> (expires_at, users)
+        self._by_address = {}  # checksummed address -> (expires_at, user or None)
+
+    def invalidate(self):
+        with self._lock:
+            self._by_role.clear()
+            self._by_address.clear()
+
+    def _cached(self, cache, key, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = cache.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        value = load()  # Query outside the lock so slow lookups do not block other threads
+        with self._lock:
+            cache[key] = (now + self.ttl, value)
+        return value
+
+    def by_role(self, role):
+        """Return the single user holding ``role``, raising like ``User.objects.get(user_role=role)``."""
+        users = self._cached(self._by_role, role, lambda: list(User.objects.filter(user_role=role)[:2]))
+        if not users:
+            raise User.DoesNotExist(f"No user with role {role}.")
+        if len(users) > 1:
+            raise User.MultipleObjectsReturned(f"More than one user with role {role}.")
+        return users[0]
+
+    def by_address(self, address):
+        """Return the user registered with ``address``, whatever case it was stored in."""
+        checksum_address = Web3.to_checksum_address(address)
+        user = self._cached(self._by_address, checksum_address, lambda: self._load_by_address(checksum_address))
+        if user is None:
+            raise User.DoesNotExist(f"No user with Ethereum address {address}.")
+        return user
+
+    def _load_by_address(self, checksum_address):
+        # Try the spellings addresses are usually stored in first, which can use the unique index
+        spellings = {checksum_address, checksum_address.lower()}
+        user = User.objects.filter(eth_address__in=spellings).first()
+        if user is None:
+            user = User.objects.filter(eth_address__iexact=checksum_address).first()
+        return user
+
+
+user_resolver = UserResolver(ttl=float(os.getenv('USER_CACHE_TTL', 60)))
+
+
+@receiver(post_save, sender=User)
+def invalidate_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:  # Logins do not change roles or addresses
+        return
+    user_resolver.invalidate()
+
+
+@receiver(post_delete, sender=User)
+def invalidate_on_delete(sender, instance, **kwargs):
+    user_resolver.invalidate()
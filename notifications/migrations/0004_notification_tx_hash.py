@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_remove_notification_created_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='tx_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=66),
+        ),
+    ]
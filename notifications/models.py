@@ -10,6 +10,7 @@ class Notification(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+    tx_hash = models.CharField(max_length=66, blank=True, default='', db_index=True)  # Transaction of the event that sent it, to drop it again if a reorg orphans the event
     
 
     def __str__(self):
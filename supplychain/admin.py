@@ -1,6 +1,16 @@
 from django.contrib import admin
-from .models import Delivery, Order
+from .models import Delivery, Order, BlockCheckpoint, ProcessedEvent, FailedEvent, AccountNonce, OutboxTransaction, InventorySync, TransactionMetric, ChainDelivery, ChainDeliveryStatus, ChainInventory
 
 # Register your models here.
 admin.site.register(Delivery)
 admin.site.register(Order)
+admin.site.register(BlockCheckpoint)
+admin.site.register(ProcessedEvent)
+admin.site.register(FailedEvent)
+admin.site.register(AccountNonce)
+admin.site.register(OutboxTransaction)
+admin.site.register(InventorySync)
+admin.site.register(TransactionMetric)
+admin.site.register(ChainDelivery)
+admin.site.register(ChainDeliveryStatus)
+admin.site.register(ChainInventory)
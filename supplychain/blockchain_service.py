@@ -1,12 +1,26 @@
-import json
+import itertools
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import lru_cache
+import requests
+from eth_account import Account
 from web3 import Web3  
-from pathlib import Path 
+from web3.exceptions import TransactionNotFound
+from web3.providers import JSONBaseProvider
 import os  
-from .models import Delivery, Order  
+from . import chain_backend
+from .models import Delivery, Order, AccountNonce, OutboxTransaction, InventorySync, TransactionMetric, ChainDelivery, ChainDeliveryStatus  
 from warehouse.models import Product  
-from members.models import CustomUser  
 from django.contrib.auth import get_user_model  
 from django.utils import timezone  
+from django.apps import apps
+from django.db import IntegrityError, transaction  
+from django.db.models import F, Max, Q  
 import logging  
 
 logger = logging.getLogger('blockchain_services')  # Set up a logger for logging blockchain services
@@ -17,32 +31,742 @@ load_dotenv()  # Load environment variables from the .env file
 
 User = get_user_model()  # Get Django's user model (CustomUser or default user model)
 
-# Step 2: Connect to the local Ganache blockchain
-ganache_url = os.getenv('WEB3_PROVIDER', 'http://127.0.0.1:7545')  # Get the blockchain provider URL from the environment or use Ganache default
-web3 = Web3(Web3.HTTPProvider(ganache_url))  # Create a Web3 instance using HTTP connection to the blockchain
+# Step 2: Connect to the blockchain backend (a Ganache node, or the in-process tester chain) on first use,
+# so importing this module never needs a node
+ganache_url = chain_backend.ganache_url  # URL of the node when CHAIN_BACKEND is "ganache"
+_web3 = None  # Shared Web3 instance, created by get_web3()
+_web3_lock = threading.Lock()
 
-# Check if the connection is successful
-if not web3.is_connected():  # Verify the connection to the blockchain
-    raise Exception("Could not connect to the Ethereum blockchain")  # Raise an exception if the connection fails
 
+def get_web3():
+    """Return the shared Web3 instance, connecting and checking the node the first time it is needed."""
+    global _web3
+    if _web3 is None:
+        with _web3_lock:
+            if _web3 is None:  # Another thread may have connected while we waited
+                web3 = chain_backend.create_web3()  # Create a Web3 instance with a pooled connection to the configured backend
+                if not web3.is_connected():  # Not cached, so the next call tries again once the node is back
+                    raise Exception("Could not connect to the Ethereum blockchain")
+                _web3 = web3
+    return _web3
 
-# Step 3: Load the ABI (from the Truffle build folder)
+
+def _reset_after_fork():
+    """Drop the parent's connection in a forked worker (e.g. gunicorn --preload), so processes never share sockets."""
+    global _web3, _web3_lock, _signing_pool
+    _web3 = None
+    _web3_lock = threading.Lock()  # The parent may have held it while forking
+    _signing_pool = None  # The parent's signing workers belong to the parent
+    load_contract.cache_clear()  # Contract instances are bound to the parent's Web3 instance
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# Step 3: Load the ABI and address (from the Truffle build folder, or the tester deployment) once per contract
+@lru_cache(maxsize=None)
+def load_contract_interface(contract_name):
+    """Return a contract's ABI and deployed address, dropping the rest of the Truffle artifact."""
+    return chain_backend.contract_interface(contract_name)
+
+
+# Step 4: Create each contract instance the first time it is used
+@lru_cache(maxsize=None)
 def load_contract(contract_name):
-    """Load a contract's ABI and address by its name."""
-    with open(Path(__file__).resolve().parent / f"smart_contracts/build/contracts/{contract_name}.json") as f:
-        contract_json = json.load(f)  # Load the contract's JSON file
-        contract_abi = contract_json['abi']  # Extract the ABI (Application Binary Interface) from the JSON
+    """Return the contract instance for a contract name, e.g. "DeliveryContract"."""
+    contract_abi, contract_address = load_contract_interface(contract_name)
+    return get_web3().eth.contract(address=contract_address, abi=contract_abi)  # Create a contract instance and return it
+
+
+def has_function(contract_name, function_name):
+    """Whether the deployed contract has a function; contracts migrated before it was added lack it."""
+    contract_abi, _ = load_contract_interface(contract_name)
+    return any(item.get('type') == 'function' and item.get('name') == function_name for item in contract_abi)
+
+
+@lru_cache(maxsize=None)
+def get_chain_id():
+    """Chain ID for signing, fetched once instead of by every build_transaction call."""
+    return get_web3().eth.chain_id
+
+
+
+### Batched Reads ###
+
+BATCH_CALL_SIZE = int(os.getenv('BATCH_CALL_SIZE', 100))  # Calls per JSON-RPC batch, nodes cap the size of a batch
+
+
+def batch_call(calls):
+    """Run read-only contract calls as JSON-RPC batches and return the decoded results in order.
+
+    ``calls`` is a list of ``(contract_name, function_name, args)`` tuples. A call that
+    fails (a revert, an unknown order) raises for the whole batch, like ``call()`` would.
+    """
+    web3 = get_web3()
+    contract_functions = [getattr(load_contract(contract_name).functions, function_name)(*args)
+                          for contract_name, function_name, args in calls]
+
+    if not isinstance(web3.provider, JSONBaseProvider):  # Providers without batch support, such as the in-process test chain
+        return [contract_function.call() for contract_function in contract_functions]
+
+    results = []
+    for start in range(0, len(contract_functions), BATCH_CALL_SIZE):
+        with web3.batch_requests() as batch:
+            for contract_function in contract_functions[start:start + BATCH_CALL_SIZE]:
+                batch.add(contract_function)
+            results.extend(batch.execute())
+    return results
+
+
+
+### Transaction Sending ###
+
+# Environment variable holding the private key of each role that sends transactions. The account of this
+# key is the role's identity on chain; "<setting>_POOL" may list more keys, comma separated, whose accounts
+# share the role's transactions so that several can be pending at once (see authorize_senders).
+PRIVATE_KEY_SETTINGS = {
+    'retail_store': 'PRIVATE_KEY_RETAIL_STORE',
+    'distributor': 'PRIVATE_KEY_DISTRIBUTOR',
+    'manufacturer': 'PRIVATE_KEY_MANUFACTURER',
+}
+
+
+@lru_cache(maxsize=None)
+def get_signer(role):
+    """Return the local account that signs transactions for a role, and that the role is known by on chain."""
+    private_key = os.getenv(PRIVATE_KEY_SETTINGS[role])  # Get the private key from environment variables
+    if not private_key and chain_backend.is_tester():
+        private_key = chain_backend.tester_private_key(list(PRIVATE_KEY_SETTINGS).index(role))  # One of the tester's own accounts
+    if not private_key:
+        raise Exception(f"No private key configured for the {role} account ({PRIVATE_KEY_SETTINGS[role]}).")
+
+    signer = Account.from_key(private_key)
+    if chain_backend.is_tester():
+        chain_backend.fund_account(signer.address)  # Keys from .env belong to Ganache accounts, which start empty here
+    return signer
+
+
+@lru_cache(maxsize=None)
+def get_signers(role):
+    """Return the signer pool of a role: its own account first, then the pool accounts."""
+    pool_keys = [key.strip() for key in os.getenv(f"{PRIVATE_KEY_SETTINGS[role]}_POOL", '').split(',') if key.strip()]
+    if pool_keys and not all(has_function(contract_name, "principals") for contract_name in SENDER_CHECKED_CONTRACTS.get(role, [])):
+        # Contracts deployed before authorizeSender would record the pool accounts themselves as the senders
+        logger.warning(f"Ignoring the {role} pool accounts until the contracts are redeployed with sender authorization")
+        pool_keys = []
+    signers = [get_signer(role)] + [Account.from_key(private_key) for private_key in pool_keys]
+    if chain_backend.is_tester():
+        for signer in signers[1:]:
+            chain_backend.fund_account(signer.address)
+    return tuple(signers)
+
+
+@lru_cache(maxsize=None)
+def get_signer_by_address(address):
+    """Return the pooled signer of any role with the given address."""
+    for role in PRIVATE_KEY_SETTINGS:
+        for signer in get_signers(role):
+            if signer.address == address:
+                return signer
+    raise Exception(f"No private key configured for the sender {address}.")
+
+
+_round_robin = defaultdict(itertools.count)  # Per role; next() on a count is atomic, so threads need no lock
+
+
+def pick_signer(role, ordering_key=''):
+    """Choose the pool account that signs a transaction.
+
+    Transactions with an ordering key always use the same account, so their nonces keep them in order
+    (e.g. a stock update and the inventory check that must see it); the rest are spread round-robin.
+    """
+    signers = get_signers(role)
+    if ordering_key:
+        return signers[zlib.crc32(ordering_key.encode()) % len(signers)]  # Stable across processes, unlike hash()
+    return signers[next(_round_robin[role]) % len(signers)]
+
+
+def group_by_signer(role, items, ordering_key):
+    """Split items, in order, into groups whose ordering keys map to the same pool account.
+
+    A batch transaction per group then keeps each item's writes on the account its ordering key picks.
+    """
+    groups = defaultdict(list)
+    for item in items:
+        groups[pick_signer(role, ordering_key(item)).address].append(item)
+    return list(groups.values())
+
+
+# Ordering keys of the distributor's writes that must be mined in the order they were queued: a delivery's
+# status update after its initiation, and a notifying checkInventory after the stock push it must see.
+# They are per order and per product, so writes to different ones spread over the pool; the retail store's
+# and manufacturer's writes are independent of each other and spread over their pools.
+def delivery_ordering_key(order_id):
+    return f"delivery:{int(order_id)}"
+
+
+def inventory_ordering_key(product_id):
+    return f"inventory:{int(product_id)}"
+
+
+# Nonces are handed out from an AccountNonce row per account, so concurrent requests, threads and worker processes
+# never sign two transactions with the same nonce and no get_transaction_count call is needed per send.
+def allocate_nonce(address, count=1):
+    """Reserve the next ``count`` nonces for an account and return the first."""
+    while True:
+        with transaction.atomic():
+            # Incrementing first takes the row lock (the write lock on SQLite) before the value is read
+            if AccountNonce.objects.filter(address=address).update(next_nonce=F('next_nonce') + count):
+                return AccountNonce.objects.values_list('next_nonce', flat=True).get(address=address) - count
+
+        # First transaction from this account: start from the node's count, pending transactions included
+        chain_nonce = get_web3().eth.get_transaction_count(address, 'pending')
+        try:
+            with transaction.atomic():
+                AccountNonce.objects.create(address=address, next_nonce=chain_nonce + count)
+            return chain_nonce
+        except IntegrityError:  # Another process created the row first, take the next nonce from it
+            continue
+
+
+def release_nonce(address, nonce):
+    """Give up the nonce of a transaction that will never be sent, so the account does not stall on a gap.
+
+    The nonce is handed out again while no later one has been; otherwise a later transaction may already
+    be waiting on it, so the gap is filled with a transfer of nothing.
+    """
+    if not AccountNonce.objects.filter(address=address, next_nonce=nonce + 1).update(next_nonce=nonce):
+        fill_nonce_gap(address, nonce)
+
+
+def fill_nonce_gap(address, nonce):
+    """Use up a nonce with a zero-value transfer from the account to itself."""
+    try:
+        signed_txn = Account.sign_transaction({
+            'to': address,
+            'value': 0,
+            'nonce': nonce,
+            'chainId': get_chain_id(),
+            'gas': 21000,  # A plain transfer
+            'gasPrice': Web3.to_wei('50', 'gwei'),
+        }, get_signer_by_address(address).key)
+        get_web3().eth.send_raw_transaction(signed_txn.raw_transaction)
+        logger.warning(f"Filled the nonce gap at {nonce} of {address}")
+    except Exception as e:
+        if is_nonce_too_low(e):  # Used since, so there is no gap
+            return
+        logger.error(f"Could not fill the nonce gap at {nonce} of {address}, its later transactions wait on it: {str(e)}")
+
+
+def resync_nonce(address):
+    """Reset the next nonce of an account to the node's transaction count.
+
+    Nonces of transactions signed but not yet sent (or not yet seen by the node) are not
+    counted by the node, so the next nonce never goes below the highest one held by the outbox.
+    """
+    chain_nonce = get_web3().eth.get_transaction_count(address, 'pending')
+    signed_nonce = OutboxTransaction.objects.filter(
+        sender=address, status__in=['queued', 'sent'], nonce__isnull=False
+    ).aggregate(Max('nonce'))['nonce__max']
+    next_nonce = chain_nonce if signed_nonce is None else max(chain_nonce, signed_nonce + 1)
+    AccountNonce.objects.update_or_create(address=address, defaults={'next_nonce': next_nonce})
+    logger.warning(f"Resynchronised the nonce of {address} to {next_nonce}")
+
+
+def is_nonce_too_low(error):
+    message = str(error).lower()
+    # Geth says "nonce too low", Ganache "doesn't have the correct nonce", eth-tester "Invalid transaction nonce"
+    return any(text in message for text in ('nonce too low', 'correct nonce', 'invalid transaction nonce'))
+
+
+def is_already_known(error):
+    # Geth and Ganache say "already known" or "known transaction" when the same signed bytes are sent twice
+    message = str(error).lower()
+    return any(text in message for text in ('already known', 'known transaction', 'already imported'))
+
+
+def is_known_transaction(tx_hash):
+    """Whether the node has a transaction, pending or mined."""
+    web3 = get_web3()
+    for lookup in (web3.eth.get_transaction, web3.eth.get_transaction_receipt):
+        try:
+            lookup(tx_hash)
+            return True
+        except TransactionNotFound:
+            continue
+    return False
+
+
+def build_transaction_data(contract_name, function_name, args, sender_address, nonce):
+    """Build an unsigned contract transaction; no RPC call is needed since every field is given."""
+    contract_function = getattr(load_contract(contract_name).functions, function_name)(*args)
+    return contract_function.build_transaction({
+        'from': sender_address,  # The account the transaction is signed with
+        'nonce': nonce,
+        'chainId': get_chain_id(),
+        'gas': 2000000,  # Set the gas limit
+        'gasPrice': Web3.to_wei('50', 'gwei')  # Set the gas price in gwei
+    })
+
+
+def build_signed_transaction(contract_name, function_name, args, signer, nonce, timings=None):
+    """Build a contract transaction with the given nonce and sign it locally.
+
+    Pass a ``timings`` dict to have the build and sign stage durations recorded in it.
+    """
+    timings = {} if timings is None else timings
+    with timed(timings, 'build_ms'):
+        transaction_data = build_transaction_data(contract_name, function_name, args, signer.address, nonce)
+    with timed(timings, 'sign_ms'):
+        return signer.sign_transaction(transaction_data)  # Sign the transaction
+
+
+
+### Transaction Metrics ###
+
+# Every submission records how long each stage took in a TransactionMetric row, which
+# check_sent_transactions completes with the receipt; `manage.py transaction_metrics` summarises them.
+
+@contextmanager
+def timed(timings, stage):
+    """Record how long the block takes, in milliseconds, as timings[stage], also when it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = (time.perf_counter() - started) * 1000
+
+
+def record_transaction_metric(contract_name, function_name, outcome, timings, rpc_calls, outbox_tx=None):
+    try:
+        return TransactionMetric.objects.create(
+            outbox_tx=outbox_tx, contract_name=contract_name, function_name=function_name,
+            outcome=outcome, rpc_calls=rpc_calls, **timings
+        )
+    except Exception as e:  # Metrics must never turn a sent transaction into a failed one
+        logger.error(f"Could not record the metrics of {contract_name}.{function_name}: {str(e)}")
+
+
+
+### Transaction Outbox ###
+
+# Views queue their transactions in OutboxTransaction and return a tracking ID straight away;
+# the send_outbox command signs, sends and confirms them in the background.
+
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))  # Rejected sends before a transaction is marked failed
+
+
+def enqueue_transaction(contract_name, function_name, args, role, ordering_key='', sender='', created_by=None):
+    """Queue a contract transaction and return its OutboxTransaction row.
+
+    Transactions with the same ``ordering_key`` are signed by the same pool account, so they are mined in
+    the order they were queued; pass ``sender`` to pin the transaction to one account of the role's pool.
+    ``created_by`` is the user whose request queued it, the only one who sees it in the transaction list.
+    """
+    get_signers(role)  # Fail in the request rather than in the sender when no key is configured
+    if not has_function(contract_name, function_name):
+        raise Exception(f"The deployed {contract_name} has no {function_name} function, redeploy the contracts with truffle migrate --reset.")
+    contract_abi, _ = load_contract_interface(contract_name)
+    Web3().eth.contract(abi=contract_abi).encode_abi(function_name, args)  # Validates the arguments without a node
+    return OutboxTransaction.objects.create(
+        contract_name=contract_name, function_name=function_name, args=list(args), role=role,
+        ordering_key=ordering_key, sender=sender, created_by=created_by,
+    )
+
+
+def is_transient_error(error):
+    # The node may or may not have received the transaction, so the same signed bytes are sent again
+    return isinstance(error, (requests.exceptions.RequestException, ConnectionError, TimeoutError))
+
+
+def send_outbox_transaction(outbox_tx, timings=None):
+    """Sign and send one queued transaction, recording the outcome on its row and the stage timings in TransactionMetric.
+
+    ``timings`` may carry the stages already done for it, e.g. by sign_outbox_transactions.
+    """
+    timings, outcome = dict(timings or {}), 'error'
+    with chain_backend.count_rpc_calls() as rpc_count:
+        try:
+            outcome = _send_outbox_transaction(outbox_tx, timings)
+        except Exception as e:
+            outcome = 'transient_error' if is_transient_error(e) else 'error'
+            raise
+        finally:
+            record_transaction_metric(
+                outbox_tx.contract_name, outbox_tx.function_name, outcome, timings, rpc_count.calls, outbox_tx
+            )
+    return outcome == 'sent'
+
+
+def outbox_signer(outbox_tx):
+    """The pool account that signs a queued transaction, chosen on its first send and kept on its row."""
+    if not outbox_tx.sender:
+        outbox_tx.sender = pick_signer(outbox_tx.role, outbox_tx.ordering_key).address
+    return get_signer_by_address(outbox_tx.sender)
+
+
+def _send_outbox_transaction(outbox_tx, timings):
+    web3 = get_web3()
+    signer = outbox_signer(outbox_tx)
+
+    if not outbox_tx.raw_transaction:
+        if outbox_tx.nonce is None:
+            # Keep the nonce on the row from now on, so a failed build or a rejected send is signed again with it
+            with timed(timings, 'nonce_ms'):
+                outbox_tx.nonce = allocate_nonce(signer.address)
+            outbox_tx.save(update_fields=['sender', 'nonce', 'updated_at'])
+        # Store the signed bytes before sending, so an interrupted send is retried with the same hash and nonce
+        signed_txn = build_signed_transaction(
+            outbox_tx.contract_name, outbox_tx.function_name, outbox_tx.args, signer, outbox_tx.nonce, timings
+        )
+        outbox_tx.tx_hash = Web3.to_hex(signed_txn.hash)
+        outbox_tx.raw_transaction = Web3.to_hex(signed_txn.raw_transaction)
+        outbox_tx.save(update_fields=['sender', 'nonce', 'tx_hash', 'raw_transaction', 'updated_at'])
+
+    outbox_tx.attempts += 1
+    try:
+        with timed(timings, 'send_ms'):
+            web3.eth.send_raw_transaction(outbox_tx.raw_transaction)
+    except Exception as e:
+        outbox_tx.error = str(e)
+        if is_transient_error(e):
+            outbox_tx.save(update_fields=['attempts', 'error', 'updated_at'])
+            raise
+
+        # A resend after a timed-out send that reached the node: it is pending or mined, so keep its nonce
+        if (is_nonce_too_low(e) or is_already_known(e)) and is_known_transaction(outbox_tx.tx_hash):
+            logger.info(f"{outbox_tx} was already received by the node")
+        else:
+            return reject_outbox_transaction(outbox_tx, signer, e)
+
+    outbox_tx.status = 'sent'
+    outbox_tx.sent_at = timezone.now()
+    outbox_tx.error = ''
+    outbox_tx.save(update_fields=['status', 'sent_at', 'attempts', 'error', 'updated_at'])
+    return 'sent'
+
+
+def reject_outbox_transaction(outbox_tx, signer, error):
+    """Handle a send the node rejected: sign again next time, or give up.
+
+    The transaction keeps its nonce, since later ones of the account may already use the nonces after it;
+    only a nonce the account has used since is replaced by a fresh one.
+    """
+    outbox_tx.tx_hash, outbox_tx.raw_transaction = '', ''
+    if is_nonce_too_low(error):
+        outbox_tx.nonce = None
+        outbox_tx.save(update_fields=['nonce', 'tx_hash', 'raw_transaction', 'updated_at'])  # Before the resync, which counts stored nonces
+        resync_nonce(signer.address)
+    else:
+        outbox_tx.save(update_fields=['tx_hash', 'raw_transaction', 'updated_at'])
+    retry_or_fail(outbox_tx, error)
+    return 'rejected'
+
+
+def retry_or_fail(outbox_tx, error):
+    """Queue a transaction that could not be sent for another attempt, or mark it failed, give up its nonce and undo its changes."""
+    outbox_tx.error = str(error)
+    outbox_tx.status = 'failed' if outbox_tx.attempts >= OUTBOX_MAX_ATTEMPTS else 'queued'
+    nonce = outbox_tx.nonce
+    if outbox_tx.status == 'failed':
+        outbox_tx.nonce = None
+    outbox_tx.save()
+    logger.error(f"Sending {outbox_tx} failed: {str(error)}")
+    if outbox_tx.status == 'failed':
+        if nonce is not None:
+            release_nonce(outbox_tx.sender, nonce)
+        roll_back_outbox_transaction(outbox_tx)
+
+
+def send_queued_transactions(limit=100):
+    """Send queued transactions in the order they were queued and return how many were sent.
+
+    Transactions are spread over the signer pools, so consecutive ones from different accounts can be
+    pending at once; a backlog of several is signed up front, see sign_outbox_transactions.
+    """
+    outbox_txs = list(OutboxTransaction.objects.filter(status='queued').order_by('pk')[:limit])
+    if not outbox_txs:
+        return 0
+    get_web3()  # An unreachable node fails the round here, not each transaction
+
+    timings = {}
+    if len(outbox_txs) > 1:
+        try:
+            timings = sign_outbox_transactions(outbox_txs)
+        except Exception as e:
+            if is_transient_error(e):
+                raise
+            logger.warning(f"Signing the queued transactions up front failed, signing them one by one: {str(e)}")
+
+    sent = 0
+    for outbox_tx in outbox_txs:
+        try:
+            if send_outbox_transaction(outbox_tx, timings.get(outbox_tx.pk)):
+                sent += 1
+        except Exception as e:
+            if is_transient_error(e):  # The node may be down, so the rest of the round would fail the same way
+                raise
+            # Could not be built or signed (e.g. its sender's key is no longer configured); counts as an attempt,
+            # so one bad row cannot hold up the queue
+            outbox_tx.attempts += 1
+            retry_or_fail(outbox_tx, e)
+    return sent
+
+
+### Presigning ###
+
+SIGNING_PROCESSES = int(os.getenv('SIGNING_PROCESSES', 1))  # Worker processes that sign a backlog; 1 signs in this process
+SIGNING_POOL_THRESHOLD = int(os.getenv('SIGNING_POOL_THRESHOLD', 20))  # Smallest backlog worth sending to the workers
+
+_signing_pool = None  # ProcessPoolExecutor, created on first use
+
+
+def _sign_in_worker(private_key, transaction_data):
+    # Runs in a signing worker; returns plain values since the signed transaction object does not pickle
+    signed_txn = Account.sign_transaction(transaction_data, private_key)
+    return Web3.to_hex(signed_txn.hash), Web3.to_hex(signed_txn.raw_transaction)
+
+
+def get_signing_pool():
+    global _signing_pool
+    if _signing_pool is None:
+        _signing_pool = ProcessPoolExecutor(max_workers=SIGNING_PROCESSES)
+    return _signing_pool
+
+
+def sign_outbox_transactions(outbox_txs):
+    """Choose senders, reserve nonces and sign the unsigned transactions of a backlog in one pass.
+
+    Nonces are reserved with one allocation per sender instead of one per transaction, and all rows
+    are saved with one bulk update. Returns the build and sign timings of each row, keyed by primary key.
+    """
+    unsigned = [outbox_tx for outbox_tx in outbox_txs if not outbox_tx.raw_transaction]
+    if len(unsigned) < 2:
+        return {}
+
+    # Rows rejected before are signed again with the nonce they kept
+    by_sender = defaultdict(list)
+    for outbox_tx in unsigned:
+        if outbox_tx.nonce is None:
+            by_sender[outbox_signer(outbox_tx).address].append(outbox_tx)
+
+    timings = {outbox_tx.pk: {} for outbox_tx in unsigned}
+    for address, sender_txs in by_sender.items():
+        started = time.perf_counter()
+        first_nonce = allocate_nonce(address, len(sender_txs))
+        nonce_ms = (time.perf_counter() - started) * 1000 / len(sender_txs)  # The allocation's share of each row
+        for offset, outbox_tx in enumerate(sender_txs):
+            outbox_tx.nonce = first_nonce + offset
+            timings[outbox_tx.pk]['nonce_ms'] = nonce_ms
+    # Keep the reserved nonces on the rows, so a failure below leaves them to be signed one by one with the same nonces
+    OutboxTransaction.objects.bulk_update(unsigned, ['sender', 'nonce'])
+
+    transactions = []
+    for outbox_tx in unsigned:
+        with timed(timings[outbox_tx.pk], 'build_ms'):
+            transactions.append(build_transaction_data(
+                outbox_tx.contract_name, outbox_tx.function_name, outbox_tx.args, outbox_tx.sender, outbox_tx.nonce
+            ))
+
+    private_keys = [get_signer_by_address(outbox_tx.sender).key for outbox_tx in unsigned]
+    started = time.perf_counter()
+    if SIGNING_PROCESSES > 1 and len(unsigned) >= SIGNING_POOL_THRESHOLD:
+        signed = list(get_signing_pool().map(_sign_in_worker, private_keys, transactions, chunksize=8))
+    else:
+        signed = [_sign_in_worker(private_key, data) for private_key, data in zip(private_keys, transactions)]
+    sign_ms = (time.perf_counter() - started) * 1000 / len(unsigned)
+
+    now = timezone.now()
+    for outbox_tx, (tx_hash, raw_transaction) in zip(unsigned, signed):
+        outbox_tx.tx_hash, outbox_tx.raw_transaction, outbox_tx.updated_at = tx_hash, raw_transaction, now
+        timings[outbox_tx.pk]['sign_ms'] = sign_ms
+    OutboxTransaction.objects.bulk_update(unsigned, ['sender', 'nonce', 'tx_hash', 'raw_transaction', 'updated_at'])
+    return timings
+
+
+### Sender Authorization ###
+
+# Contracts that check who sends a role's transactions, for the roles they check. A role's pool accounts act for it once
+# the role's own account offered them (authorizeSender) and each pool account accepted the offer (acceptPrincipal).
+SENDER_CHECKED_CONTRACTS = {
+    'retail_store': ['RetailStoreContract', 'DeliveryContract'],
+}
+
+
+def authorize_pool_senders(role):
+    """Queue the next authorization step for each pool account of a role not yet acting for it on chain, and return them.
+
+    Pool accounts without an offer get an authorizeSender from the role's own account; those with one accept it
+    with acceptPrincipal. Run again once the offers are mined to queue the acceptances.
+    """
+    contract_names = SENDER_CHECKED_CONTRACTS.get(role, [])
+    for contract_name in contract_names:
+        if not has_function(contract_name, "acceptPrincipal"):
+            raise Exception(f"The deployed {contract_name} has no acceptPrincipal function, redeploy the contracts with truffle migrate --reset.")
+    principal, *pool = get_signers(role)
+
+    # Read the current principal and the pending offer of every pool account in one batch
+    accounts = [(contract_name, signer.address) for contract_name in contract_names for signer in pool]
+    results = batch_call(
+        [(contract_name, "principals", [address]) for contract_name, address in accounts]
+        + [(contract_name, "senderOffers", [principal.address, address]) for contract_name, address in accounts]
+    ) if accounts else []
+
+    outbox_txs = []
+    for (contract_name, address), current, offered in zip(accounts, results, results[len(accounts):]):
+        if current == principal.address:
+            continue
+        if int(current, 16):
+            raise Exception(f"{address} already acts for {current} on the {contract_name}.")
+        if offered:  # Accepted by the pool account itself, so no account is claimed without its consent
+            outbox_txs.append(enqueue_transaction(contract_name, "acceptPrincipal", [principal.address], role, sender=address))
+        else:  # Offered from the role's own account, since the contract records the sender as the principal
+            outbox_txs.append(enqueue_transaction(contract_name, "authorizeSender", [address, True], role, sender=principal.address))
+    return outbox_txs
+
+
+### Receipt Tracking ###
+
+# The send_outbox command polls the receipts of every sent transaction with one JSON-RPC batch per round, instead
+# of a request thread waiting on each hash. A reverted transaction has its optimistic database changes undone.
+
+OUTBOX_SENT_TIMEOUT = int(os.getenv('OUTBOX_SENT_TIMEOUT', 300))  # Seconds without a receipt before a transaction is sent again
+
+def get_transaction_receipts(tx_hashes):
+    """Fetch the receipts of several transactions in one round-trip, with None for those not mined yet.
+
+    Receipts are returned as the node sent them, so only the fields the tracker reads are converted.
+    """
+    web3 = get_web3()
+    if not tx_hashes:
+        return []
+    if not isinstance(web3.provider, JSONBaseProvider):  # Providers without batch support, such as the in-process test chain
+        receipts = []
+        for tx_hash in tx_hashes:
+            try:
+                receipts.append(dict(web3.eth.get_transaction_receipt(tx_hash)))
+            except TransactionNotFound:
+                receipts.append(None)
+        return receipts
+
+    # Raw requests, since web3's receipt formatter raises TransactionNotFound for the whole batch on a pending hash
+    responses = web3.provider.make_batch_request([('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes])
+    if isinstance(responses, dict):  # The node rejected the batch as a whole
+        raise Exception(f"Fetching receipts failed: {responses.get('error')}")
+
+    receipts = []
+    for tx_hash, response in zip(tx_hashes, sorted(responses, key=lambda response: response['id'])):
+        if 'error' in response:  # Treated as pending, asked again next round
+            logger.warning(f"Fetching the receipt of {tx_hash} failed: {response['error']}")
+        receipt = response.get('result')
+        if receipt:
+            # Nodes return hex quantities; servers wrapping eth-tester return integers
+            receipt = {**receipt, **{key: Web3.to_int(hexstr=receipt[key]) if isinstance(receipt[key], str) else receipt[key]
+                                     for key in ('status', 'blockNumber', 'gasUsed')}}
+        receipts.append(receipt)
+    return receipts
+
+
+def check_sent_transactions(limit=100):
+    """Record the receipts of sent transactions that have been mined and return how many were.
+
+    The least recently checked transactions are checked first, so pending ones cannot crowd out newer
+    ones. A transaction without a receipt after OUTBOX_SENT_TIMEOUT seconds is sent again: the node may
+    have dropped it, and if its nonce has been used since, it is signed again or given up on.
+    """
+    # Pending rows are touched below, which moves them to the back of the line
+    outbox_txs = list(OutboxTransaction.objects.filter(status='sent').order_by('updated_at', 'pk')[:limit])
+    receipts = get_transaction_receipts([outbox_tx.tx_hash for outbox_tx in outbox_txs])
+
+    mined, pending = 0, []
+    timed_out = timezone.now() - timedelta(seconds=OUTBOX_SENT_TIMEOUT)
+    for outbox_tx, receipt in zip(outbox_txs, receipts):
+        if receipt is None:
+            if outbox_tx.sent_at < timed_out:
+                logger.warning(f"{outbox_tx} has no receipt after {OUTBOX_SENT_TIMEOUT} seconds, sending it again")
+                send_outbox_transaction(outbox_tx)  # Marks it sent again, or queued or failed when rejected
+            else:
+                pending.append(outbox_tx.pk)
+            continue
+
+        succeeded = receipt['status'] == 1
+        outbox_tx.status = 'confirmed' if succeeded else 'reverted'
+        outbox_tx.error = '' if succeeded else 'Transaction reverted'
+        outbox_tx.block_number = receipt['blockNumber']
+        outbox_tx.confirmed_at = timezone.now()
+        outbox_tx.save(update_fields=['status', 'error', 'block_number', 'confirmed_at', 'updated_at'])
+        mined += 1
+
+        # Complete the metrics of the send that got mined; the receipt stage is only as precise as the polling interval
+        TransactionMetric.objects.filter(outbox_tx=outbox_tx, outcome='sent').update(
+            outcome='confirmed' if succeeded else 'reverted',
+            gas_used=receipt['gasUsed'],
+            receipt_ms=(outbox_tx.confirmed_at - outbox_tx.sent_at).total_seconds() * 1000,
+            updated_at=outbox_tx.confirmed_at,
+        )
+
+        if not succeeded:
+            logger.error(f"{outbox_tx} reverted in block {outbox_tx.block_number}")
+            roll_back_outbox_transaction(outbox_tx)
+
+    OutboxTransaction.objects.filter(pk__in=pending).update(updated_at=timezone.now())
+    return mined
+
+
+### Optimistic Updates ###
+
+# Write functions change the database as if their transaction will succeed, and record each change on the
+# outbox row. Once the transaction reverts or is given up on, roll_back_outbox_transaction undoes them.
+
+def snapshot(instance, fields):
+    """The values of some fields of a model instance as strings, by field name, for OutboxTransaction.rollback."""
+    values = {}
+    for name in fields:
+        field = instance._meta.get_field(name)
+        values[name] = None if field.value_from_object(instance) is None else field.value_to_string(instance)
+    return values
+
+
+def field_values(model, values):
+    """Turn a snapshot back into values for filter() and update(), by column name."""
+    fields = {name: model._meta.get_field(name) for name in values}
+    return {fields[name].attname: None if value is None else fields[name].to_python(value) for name, value in values.items()}
+
+
+def record_changes(outbox_tx, changes, fields):
+    """Record optimistic changes on an outbox row.
 
-        # Step 4: Get the deployed contract address (from the Truffle JSON file)
-        contract_address = contract_json['networks']['5777']['address']  # Use the address deployed on the network with ID 5777 (Ganache)
-        return web3.eth.contract(address=contract_address, abi=contract_abi)  # Create a contract instance and return it
+    ``changes`` is a list of ``(instance, before)`` pairs, taken after the change was saved; ``before``
+    is the snapshot of ``fields`` from before the change, or None for a row the change created.
+    """
+    outbox_tx.rollback.extend(
+        {'model': instance._meta.label, 'pk': instance.pk, 'before': before, 'after': snapshot(instance, fields)}
+        for instance, before in changes
+    )
+    outbox_tx.save(update_fields=['rollback', 'updated_at'])
 
 
-# Step 5: Create the contract instances for each contract
-delivery_contract = load_contract("DeliveryContract")  # Load the Delivery contract
-retail_store_contract = load_contract("RetailstoreContract")  # Load the Retail Store contract
-distributor_contract = load_contract("DistributorContract")  # Load the Distributor contract
-manufacturer_contract = load_contract("ManufacturerContract")  # Load the Manufacturer contract
+@transaction.atomic
+def roll_back_outbox_transaction(outbox_tx):
+    """Undo the database changes made along with a transaction that will not be mined, newest first.
+
+    A row is only restored (or, if the transaction's function created it, deleted) while it still holds
+    the values the function gave it, so a later change is never overwritten.
+    """
+    if outbox_tx.rolled_back:
+        return
+    for change in reversed(outbox_tx.rollback):
+        model = apps.get_model(change['model'])
+        rows = model.objects.filter(pk=change['pk'], **field_values(model, change['after']))
+        if change['before'] is None:
+            undone = rows.delete()[0]
+        else:
+            undone = rows.update(**field_values(model, change['before']))
+        if not undone:
+            logger.warning(f"Left {change['model']} {change['pk']} as it is, it has changed since {outbox_tx} was queued")
+
+    outbox_tx.rolled_back = True
+    outbox_tx.save(update_fields=['rolled_back', 'updated_at'])
 
 
 
@@ -57,12 +781,13 @@ def check_order_exists(order_id):
 
 
 # Function to interact with the DeliveryContract
-def initiate_delivery(order_id, product_id, quantity, retail_store_address):
+@transaction.atomic  # The queued transaction and the database changes are committed together
+def initiate_delivery(order_id, product_id, quantity, retail_store_address, created_by=None):
     """Initiate a delivery process by interacting with the blockchain and updating the database."""
     check_order_exists(order_id)  # Verify that the order exists
 
     # Sender's account address from Ganache
-    sender_address = web3.eth.accounts[1]  # Use the second account in Ganache as the distributor's address
+    sender_address = get_signer('distributor').address  # The distributor's address, derived from its private key
 
     print(f"Sender Address: {sender_address}")
     print(f"Retail Store Address: {retail_store_address}")
@@ -87,27 +812,10 @@ def initiate_delivery(order_id, product_id, quantity, retail_store_address):
     except Delivery.DoesNotExist:  # If the delivery does not exist, we skip the error
         pass
 
-    # Send the transaction to the blockchain to initiate delivery
-    transaction = delivery_contract.functions.initiateDelivery(
-        order_id,  # uint256
-        product_id,  # uint256
-        quantity,  # uint256
-        retail_store_address  # address
-    ).build_transaction({
-        'from': sender_address,  # The sender address is the distributor's Ethereum account
-        'nonce': web3.eth.get_transaction_count(sender_address),  # Get the current nonce for the sender
-        'gas': 2000000,  # Set the gas limit
-        'gasPrice': Web3.to_wei('50', 'gwei')  # Set the gas price in gwei
-    })
-
-    # Sign the transaction with the distributor's private key
-    private_key = os.getenv("PRIVATE_KEY_DISTRIBUTOR")  # Get the private key from environment variables
-    signed_txn = web3.eth.account.sign_transaction(transaction, private_key)  # Sign the transaction
-
-    # Send the signed transaction to the blockchain
-    tx_hash = web3.eth.send_raw_transaction(signed_txn.raw_transaction)  # Send the signed transaction
+    # Queue the transaction for the distributor's account; the outbox sender signs and sends it
+    outbox_tx = enqueue_transaction("DeliveryContract", "initiateDelivery", [order_id, product_id, quantity, retail_store_address], 'distributor', ordering_key=delivery_ordering_key(order_id), created_by=created_by)
 
-    # If the transaction is successful, update the Delivery model in the database
+    # Update the Delivery model in the database, in the same database transaction as the queued chain write
     try:
         distributor_user = User.objects.get(eth_address=sender_address)  # Get the distributor user from the database
         retail_store_user = User.objects.get(eth_address=retail_store_address)  # Get the retail store user from the database
@@ -122,27 +830,106 @@ def initiate_delivery(order_id, product_id, quantity, retail_store_address):
             }
         )
 
+        before = None
         if not created:  # If the delivery already exists, update its status
+            before = snapshot(delivery, ['delivery_status'])
             delivery.delivery_status = 'in_transit'
             delivery.save()  # Save changes to the database
+        record_changes(outbox_tx, [(delivery, before)], ['delivery_status'])  # Undone if the transaction reverts
 
     except User.DoesNotExist:  # Handle missing users in the database
         raise Exception("Distributor or Retail store user not found in the database.")
     except Exception as e:  # Catch other errors
         raise Exception(f"Failed to create the delivery record in the database: {str(e)}")
 
-    # Return the transaction hash as a hexadecimal string
-    return web3.to_hex(tx_hash)
+    # Return the queued transaction; the view shows its tracking ID
+    return outbox_tx
+
+
+
+
+# Function to initiate the deliveries of many orders in one transaction
+MAX_DELIVERY_BATCH = int(os.getenv('MAX_DELIVERY_BATCH', 100))  # Orders per dispatch, keeps the initiateDeliveries transaction within its gas limit
+
+
+@transaction.atomic  # The queued transaction and the database changes are committed together
+def initiate_deliveries(order_ids, created_by=None):
+    """Initiate the deliveries of several orders with one initiateDeliveries transaction.
+
+    Orders are validated with a few set-based queries; product, quantity and retail store are taken
+    from each order. Returns ``(outbox_txs, deliveries)``.
+    """
+    order_ids = list(dict.fromkeys(int(order_id) for order_id in order_ids))  # Drop duplicates, keep the order given
+    if not order_ids:
+        raise Exception("No orders selected for delivery.")
+    if len(order_ids) > MAX_DELIVERY_BATCH:
+        raise Exception(f"At most {MAX_DELIVERY_BATCH} deliveries can be initiated at once.")
+
+    # Fetch the orders with their products and retail stores in one query
+    orders = Order.objects.select_related('product', 'retail_store').in_bulk(order_ids)
+    missing = [order_id for order_id in order_ids if order_id not in orders]
+    if missing:
+        raise ValueError(f"Orders with IDs {', '.join(map(str, missing))} do not exist.")
+    # Orders with a delivery in transit or delivered cannot be initiated again; cancelled ones can
+    deliveries = {delivery.order_id: delivery for delivery in Delivery.objects.filter(order_id__in=order_ids)}
+    already_initiated = [order_id for order_id, delivery in deliveries.items() if delivery.delivery_status != 'cancelled']
+    if already_initiated:
+        raise Exception(f"Deliveries for orders {', '.join(map(str, sorted(already_initiated)))} have already been initiated.")
+
+    invalid_address = [order_id for order_id in order_ids if not Web3.is_address(orders[order_id].retail_store.eth_address or '')]
+    if invalid_address:
+        raise ValueError(f"The retail stores of orders {', '.join(map(str, invalid_address))} have no valid Ethereum address.")
+
+    # The distributor user, found by the address of the account that signs the transaction
+    try:
+        distributor_user = User.objects.get(eth_address=get_signer('distributor').address)
+    except User.DoesNotExist:
+        raise Exception("Distributor user not found in the database.")
+
+    # Queue one transaction per distributor pool account the orders' ordering keys map to, or one initiateDelivery per
+    # order on contracts deployed before initiateDeliveries; the outbox sender signs and sends them
+    calls = [(order_id, int(orders[order_id].product.product_id), orders[order_id].quantity,
+              Web3.to_checksum_address(orders[order_id].retail_store.eth_address)) for order_id in order_ids]
+    outbox_txs = {}
+    if has_function("DeliveryContract", "initiateDeliveries"):
+        for group in group_by_signer('distributor', calls, lambda call: delivery_ordering_key(call[0])):
+            outbox_tx = enqueue_transaction("DeliveryContract", "initiateDeliveries", [list(column) for column in zip(*group)],
+                                            'distributor', ordering_key=delivery_ordering_key(group[0][0]), created_by=created_by)
+            outbox_txs.update(dict.fromkeys((call[0] for call in group), outbox_tx))
+    else:
+        for call in calls:
+            outbox_txs[call[0]] = enqueue_transaction("DeliveryContract", "initiateDelivery", list(call), 'distributor',
+                                                      ordering_key=delivery_ordering_key(call[0]), created_by=created_by)
+
+    # Re-initiate cancelled deliveries with one update and create the rest with one insert
+    Delivery.objects.filter(order_id__in=list(deliveries)).update(delivery_status='in_transit', distributor=distributor_user)
+    Delivery.objects.bulk_create([
+        Delivery(order=orders[order_id], delivery_status='in_transit', distributor=distributor_user,
+                 retail_store=orders[order_id].retail_store)
+        for order_id in order_ids if order_id not in deliveries
+    ])
+
+    # Record the changes, to be undone if the transaction initiating them reverts
+    initiated = list(Delivery.objects.filter(order_id__in=order_ids).order_by('order_id'))
+    before = {order_id: snapshot(delivery, ['delivery_status', 'distributor']) for order_id, delivery in deliveries.items()}
+    changes = defaultdict(list)
+    for delivery in initiated:
+        changes[outbox_txs[delivery.order_id]].append((delivery, before.get(delivery.order_id)))
+    for outbox_tx, tx_changes in changes.items():
+        record_changes(outbox_tx, tx_changes, ['delivery_status', 'distributor'])
+
+    # Return the queued transactions and the deliveries; the view shows the tracking IDs
+    return list(changes), initiated
 
 
 
 
 # Function to confirm delivery on the blockchain
+@transaction.atomic  # The queued transaction and the database changes are committed together
 def confirm_delivery(order_id, retail_store_user):
     """Confirm delivery for a specific order and update the blockchain and database."""
     check_order_exists(order_id)  # Ensure the order exists
 
-    sender_address = web3.eth.accounts[0]  # Use the first account in Ganache as the sender (retail store)
 
     try:
         # Fetch the delivery record from the database
@@ -156,29 +943,18 @@ def confirm_delivery(order_id, retail_store_user):
         if delivery.delivery_status != 'in_transit':
             raise Exception("Delivery must be in transit to be confirmed.")  # Error if not in transit
 
-        # Build the transaction to confirm delivery on the blockchain
-        transaction = delivery_contract.functions.confirmDelivery(
-            order_id  # uint256
-        ).build_transaction({
-            'from': sender_address,  # The sender address is the retail store
-            'nonce': web3.eth.get_transaction_count(sender_address),  # Get the current nonce
-            'gas': 2000000,  # Set the gas limit
-            'gasPrice': Web3.to_wei('50', 'gwei')  # Set the gas price
-        })
-
-        private_key = os.getenv("PRIVATE_KEY_RETAIL_STORE")  # Get the private key for the retail store from environment
-        signed_txn = web3.eth.account.sign_transaction(transaction, private_key)  # Sign the transaction
-
-        # Send the signed transaction to the blockchain
-        tx_hash = web3.eth.send_raw_transaction(signed_txn.raw_transaction)  # Send the transaction
+        # Queue the transaction to confirm delivery for the retail store's account; the outbox sender signs and sends it
+        outbox_tx = enqueue_transaction("DeliveryContract", "confirmDelivery", [order_id], 'retail_store', created_by=retail_store_user)
 
-        # Update the delivery status in the database upon success
+        # Update the delivery status in the database along with the queued transaction
+        before = snapshot(delivery, ['delivery_status', 'delivered_at'])
         delivery.delivery_status = 'delivered'  # Set the delivery status to 'delivered'
         delivery.delivered_at = timezone.now()  # Record the delivery time
         delivery.save()  # Save changes to the database
+        record_changes(outbox_tx, [(delivery, before)], ['delivery_status', 'delivered_at'])  # Undone if the transaction reverts
 
-        # Return the transaction hash as a hexadecimal string
-        return Web3.to_hex(tx_hash)
+        # Return the queued transaction; the view shows its tracking ID
+        return outbox_tx
 
     except Delivery.DoesNotExist:  # If the delivery does not exist
         raise Exception("Delivery has not been initiated for this order.")
@@ -190,40 +966,30 @@ def confirm_delivery(order_id, retail_store_user):
 
 
 # Function to update delivery status on the blockchain
-def update_delivery_status(order_id, new_status):
+@transaction.atomic  # The queued transaction and the database changes are committed together
+def update_delivery_status(order_id, new_status, created_by=None):
     """Update the status of a delivery on the blockchain and in the database."""
     check_order_exists(order_id)  # Ensure the order exists
 
-    sender_address = web3.eth.accounts[1]  # Use the second account in Ganache (distributor or admin)
 
     order_id = int(order_id)  # Convert the order ID to an integer
 
-    # Build the transaction to update delivery status on the blockchain
-    transaction = delivery_contract.functions.updateStatus(order_id, new_status).build_transaction({
-        'from': sender_address,  # Sender's address
-        'nonce': web3.eth.get_transaction_count(sender_address),  # Get the current nonce
-        'gas': 2000000,  # Set gas limit
-        'gasPrice': Web3.to_wei('50', 'gwei')  # Set gas price
-    })
-
-    # Sign the transaction with the distributor's private key
-    private_key = os.getenv("PRIVATE_KEY_DISTRIBUTOR")  # Get the private key from environment
-    signed_txn = web3.eth.account.sign_transaction(transaction, private_key)  # Sign the transaction
+    # Queue the transaction for the distributor's account; the outbox sender signs and sends it
+    outbox_tx = enqueue_transaction("DeliveryContract", "updateStatus", [order_id, new_status], 'distributor', ordering_key=delivery_ordering_key(order_id), created_by=created_by)
 
-    # Send the signed transaction to the blockchain
-    tx_hash = web3.eth.send_raw_transaction(signed_txn.raw_transaction)  # Send the transaction
-
-    # Update the database after the transaction is successful
+    # Update the database along with the queued transaction
     delivery = Delivery.objects.get(order__id=order_id)  # Fetch the delivery from the database
+    before = snapshot(delivery, ['delivery_status', 'delivered_at'])
     status_map = {0: 'in_transit', 1: 'delivered', 2: 'cancelled'}  # Map status codes to human-readable status
     delivery.delivery_status = status_map.get(new_status, 'unknown')  # Update the delivery status
 
     if new_status == 1:  # If the new status is 'delivered'
         delivery.delivered_at = timezone.now()  # Record the delivery time
     delivery.save()  # Save changes to the database
+    record_changes(outbox_tx, [(delivery, before)], ['delivery_status', 'delivered_at'])  # Undone if the transaction reverts
 
-    # Return the transaction hash as a hexadecimal string
-    return Web3.to_hex(tx_hash)
+    # Return the queued transaction; the view shows its tracking ID
+    return outbox_tx
 
 
 
@@ -232,19 +998,60 @@ def update_delivery_status(order_id, new_status):
 # Function to get delivery details from the blockchain
 def get_delivery_details(order_id):
     """Get delivery details from the blockchain."""
-    delivery_details = delivery_contract.functions.getDeliveryDetails(
+    delivery_details = load_contract("DeliveryContract").functions.getDeliveryDetails(
         order_id  # uint256
     ).call()  # Call the smart contract to get the delivery details
     return delivery_details  # Return the delivery details (tuple)
 
 
+# Function to get the delivery details of many orders in one round-trip
+def get_deliveries_details(order_ids):
+    """Get delivery details for several orders from the blockchain, in the order of order_ids."""
+    return batch_call([("DeliveryContract", "getDeliveryDetails", [int(order_id)]) for order_id in order_ids])
+
+
+# Function to get delivery details from the read model the event listener projects from contract events
+def get_local_deliveries_details(order_ids):
+    """Get the delivery and status history of several orders from the database, without calling the node.
+
+    Returns ``{order_id: (ChainDelivery or None, [ChainDeliveryStatus, ...])}``, the history in chain order.
+    """
+    deliveries = ChainDelivery.objects.in_bulk(order_ids, field_name='order_id')
+    history = defaultdict(list)
+    for status in ChainDeliveryStatus.objects.filter(order_id__in=order_ids).order_by('block_number', 'log_index'):
+        history[status.order_id].append(status)
+    return {order_id: (deliveries.get(order_id), history[order_id]) for order_id in order_ids}
+
+
+ZERO_ADDRESS = '0x' + '0' * 40  # Retail store of a delivery that was never initiated
+
+
+# Function to compare the read model with the blockchain, for the pages' "verify on chain" action
+def verify_deliveries_details(order_ids):
+    """Read the deliveries from the blockchain in one round-trip and compare them with the read model.
+
+    Returns ``{order_id: (on-chain details, whether the read model matches them)}``.
+    """
+    local = get_local_deliveries_details(order_ids)
+    verified = {}
+    for order_id, details in zip(order_ids, get_deliveries_details(order_ids)):
+        delivery = local[order_id][0]
+        if delivery is None:  # Nothing projected: the chain must hold the empty delivery (its status defaults to In Transit)
+            matches = details[0] == 0 and details[4] == 'In Transit'
+        else:
+            local_details = (delivery.product_id, delivery.quantity, (delivery.retail_store or ZERO_ADDRESS).lower(), delivery.get_status_display())
+            matches = local_details == (details[1], details[2], details[3].lower(), details[4])
+        verified[order_id] = (details, matches)
+    return verified
+
+
 
 
 
 # Function to place an order on the blockchain and update the database
+@transaction.atomic  # The queued transaction and the database changes are committed together
 def place_order(order_id, product_id, quantity, retail_store_user):
     """Place an order on the blockchain and update the database."""
-    sender_address = web3.eth.accounts[0]  # Use the first account in Ganache as the retail store's address
 
     # Ensure that order_id, product_id, and quantity are integers
     order_id = int(order_id)
@@ -253,26 +1060,10 @@ def place_order(order_id, product_id, quantity, retail_store_user):
 
     logging.info(f"Placing order with Product ID: {product_id}, Quantity: {quantity}, Order ID: {order_id}")  # Log the order placement
 
-    # Build the transaction to place an order on the blockchain
-    transaction = retail_store_contract.functions.placeOrder(
-        order_id,  # uint256
-        product_id,  # uint256
-        quantity  # uint256
-    ).build_transaction({
-        'from': sender_address,  # Retail store's Ethereum address
-        'nonce': web3.eth.get_transaction_count(sender_address),  # Get the current nonce
-        'gas': 2000000,  # Set gas limit
-        'gasPrice': Web3.to_wei('50', 'gwei')  # Set gas price
-    })
+    # Queue the transaction for the retail store's account; the outbox sender signs and sends it
+    outbox_tx = enqueue_transaction("RetailStoreContract", "placeOrder", [order_id, product_id, quantity], 'retail_store', created_by=retail_store_user)
 
-    # Sign the transaction with the retail store's private key
-    private_key = os.getenv("PRIVATE_KEY_RETAIL_STORE")  # Get the private key from environment
-    signed_txn = web3.eth.account.sign_transaction(transaction, private_key)  # Sign the transaction
-
-    # Send the signed transaction to the blockchain
-    tx_hash = web3.eth.send_raw_transaction(signed_txn.raw_transaction)  # Send the transaction
-
-    # Update the order in the database after the transaction is successful
+    # Create the order in the database along with the queued transaction
     try:
         product = Product.objects.get(product_id=product_id)  # Get the product from the database by its ID
         order = Order.objects.create(  # Create a new order in the database
@@ -282,14 +1073,71 @@ def place_order(order_id, product_id, quantity, retail_store_user):
             status='pending'
         )
         order.save()  # Save the order
+        record_changes(outbox_tx, [(order, None)], ['status'])  # Deleted again if the transaction reverts
 
     except Product.DoesNotExist:  # Handle case where the product does not exist
         raise Exception(f"Product with ID {product_id} does not exist.")
     except Exception as e:  # Catch any other exceptions
         raise Exception(f"Failed to create the order in the database: {str(e)}")
 
-    # Return the transaction hash as a hexadecimal string
-    return Web3.to_hex(tx_hash)
+    # Return the queued transaction; the view shows its tracking ID
+    return outbox_tx
+
+
+
+
+# Function to place a basket of orders on the blockchain in one transaction and update the database
+MAX_ORDER_LINES = int(os.getenv('MAX_ORDER_LINES', 100))  # Lines per basket, keeps the placeOrders transaction within its gas limit
+
+
+@transaction.atomic  # The queued transaction and the database changes are committed together
+def place_orders(lines, retail_store_user):
+    """Place several orders with one placeOrders transaction and one bulk insert.
+
+    ``lines`` is a list of ``(product_id, quantity)`` pairs. Returns ``(outbox_txs, orders)``,
+    with the orders in the order of ``lines``; their database IDs are the on-chain order IDs.
+    """
+    if not lines:
+        raise Exception("The order has no lines.")
+    if len(lines) > MAX_ORDER_LINES:
+        raise Exception(f"An order can have at most {MAX_ORDER_LINES} lines.")
+
+    # Ensure that product IDs and quantities are positive integers
+    try:
+        lines = [(str(int(product_id)), int(quantity)) for product_id, quantity in lines]
+    except (TypeError, ValueError):
+        raise Exception("Invalid product ID or quantity provided.")
+    if any(quantity <= 0 for _, quantity in lines):
+        raise Exception("Quantity must be greater than zero.")
+
+    # Fetch every product of the basket in one query
+    products = Product.objects.in_bulk({product_id for product_id, _ in lines}, field_name='product_id')
+    missing = sorted({product_id for product_id, _ in lines} - set(products))
+    if missing:
+        raise Exception(f"Products with IDs {', '.join(missing)} do not exist.")
+
+    logging.info(f"Placing {len(lines)} orders for retail store {retail_store_user}")  # Log the order placement
+
+    # Create the orders in one insert; the IDs the database assigns are the order IDs sent to the chain
+    orders = Order.objects.bulk_create([
+        Order(product=products[product_id], quantity=quantity, retail_store=retail_store_user, status='pending')
+        for product_id, quantity in lines
+    ])
+
+    # Queue one transaction for the whole basket from the retail store's account, or one placeOrder per order
+    # on contracts deployed before placeOrders; the outbox sender signs and sends them
+    calls = [(order.id, int(product_id), quantity) for order, (product_id, quantity) in zip(orders, lines)]
+    if has_function("RetailStoreContract", "placeOrders"):
+        batches = [(enqueue_transaction("RetailStoreContract", "placeOrders", [list(column) for column in zip(*calls)], 'retail_store',
+                                        created_by=retail_store_user), orders)]
+    else:
+        batches = [(enqueue_transaction("RetailStoreContract", "placeOrder", list(call), 'retail_store', created_by=retail_store_user), [order])
+                   for call, order in zip(calls, orders)]
+    for outbox_tx, placed in batches:
+        record_changes(outbox_tx, [(order, None) for order in placed], ['status'])  # Deleted again if the transaction reverts
+
+    # Return the queued transactions and the orders; the view shows the tracking IDs
+    return [outbox_tx for outbox_tx, _ in batches], orders
 
 
 
@@ -308,7 +1156,7 @@ def process_order(order_id, product_id, quantity):
     quantity = int(quantity)
 
     # Build the transaction to call the `processOrder` function in the DistributorContract
-    transaction = distributor_contract.functions.processOrder(
+    transaction = load_contract("DistributorContract").functions.processOrder(
         order_id,
         product_id,
         quantity
@@ -348,49 +1196,43 @@ def process_order(order_id, product_id, quantity):
 
 
 # Function to check inventory on the blockchain
-def check_inventory(order_id, product_id, quantity):
-    """Check inventory status on the blockchain for a given order and product."""
-    check_order_exists(order_id)  # Ensure the order exists
+@transaction.atomic  # A stock push and the notifying check are queued together
+def check_inventory(order_id, product_id, quantity, warehouse_quantity, created_by=None):
+    """Check inventory on the blockchain with read-only calls, sending a transaction only to notify the manufacturer.
 
-    # Use the distributor's account in Ganache
-    sender_address = web3.eth.accounts[1]  # Distributor's Ethereum address
+    Returns ``(is_available, outbox_tx)``; ``outbox_tx`` is the queued checkInventory transaction
+    that emits ManufacturerNotified, or None when the product is available.
+    """
+    check_order_exists(order_id)  # Ensure the order exists
 
     try:
         # Convert order_id, product_id, and quantity to integers
         order_id = int(order_id)
-        product_id = product_id.strip()  # Strip any surrounding whitespace
+        product_id = str(product_id).strip()  # Strip any surrounding whitespace
         product_id = int(product_id)  # Convert product_id to integer
         quantity = int(quantity)  # Convert quantity to integer
+        warehouse_quantity = int(warehouse_quantity)  # Stock recorded in the warehouse
 
-        # Build the transaction to check inventory on the blockchain
-        transaction = distributor_contract.functions.checkInventory(
-            order_id,  # uint256: Order ID
-            product_id,  # uint256: Product ID
-            quantity  # uint256: Quantity
-        ).build_transaction({
-            'from': sender_address,  # Distributor's Ethereum address
-            'nonce': web3.eth.get_transaction_count(sender_address),  # Get the current nonce
-            'gas': 2000000,  # Set the gas limit
-            'gasPrice': Web3.to_wei('50', 'gwei')  # Set gas price
-        })
-
-        # Sign the transaction with the distributor's private key
-        private_key = os.getenv("PRIVATE_KEY_DISTRIBUTOR")  # Get private key from environment
-        signed_txn = web3.eth.account.sign_transaction(transaction, private_key)  # Sign the transaction
-
-        # Send the signed transaction
-        tx_hash = web3.eth.send_raw_transaction(signed_txn.raw_transaction)  # Send the transaction to the blockchain
-
-        # Wait for the transaction receipt to get the return value
-        tx_receipt = web3.eth.wait_for_transaction_receipt(tx_hash)  # Wait for the transaction to be confirmed
-        
-        # Extract the logs to check if the inventory is available
-        logs = distributor_contract.events.ManufacturerNotified().process_receipt(tx_receipt)  # Process the receipt logs
-        
-        if logs:  # If a ManufacturerNotified event was emitted
-            return False  # Inventory is not available
-        else:
-            return True  # Inventory is available
+        # Read the on-chain stock and simulate checkInventory with eth_call, both in one round-trip
+        (_, chain_quantity), is_available = batch_call([
+            ("DistributorContract", "inventory", [product_id]),
+            ("DistributorContract", "checkInventory", [order_id, product_id, quantity]),
+        ])
+
+        if chain_quantity != warehouse_quantity:
+            # Judge availability by the warehouse stock with checkInventory's own rule, since the simulation above saw the old value
+            is_available = warehouse_quantity >= quantity
+            if not is_available:
+                # The notifying checkInventory must see the current stock, so push it first unless a push is already queued;
+                # otherwise the stock is left to the scheduled sync_inventory run
+                sync_inventory([product_id], created_by=created_by)
+
+        if is_available:
+            return True, None
+
+        # Queue the transaction for the distributor's account; the outbox sender signs and sends it
+        # A ManufacturerNotified event from this transaction reaches the manufacturer through the event listener
+        return False, enqueue_transaction("DistributorContract", "checkInventory", [order_id, product_id, quantity], 'distributor', ordering_key=inventory_ordering_key(product_id), created_by=created_by)
 
     except ValueError:  # Handle conversion errors
         raise Exception(f"Invalid order ID, product ID, or quantity provided.")
@@ -402,69 +1244,105 @@ def check_inventory(order_id, product_id, quantity):
 
 
 # Function to update inventory on the blockchain
-def update_inventory_on_blockchain(product_id, quantity):
+def update_inventory_on_blockchain(product_id, quantity, created_by=None):
     """Update the inventory of a product on the blockchain."""
-    sender_address = web3.eth.accounts[1]  # Distributor's Ethereum address
 
     # Convert product_id and quantity to integers
     product_id = Web3.to_int(product_id)  # Convert product ID to uint256
     quantity = Web3.to_int(quantity)  # Convert quantity to uint256
 
-    # Build the transaction to update the inventory on the blockchain
-    transaction = distributor_contract.functions.updateInventory(
-        product_id,  # uint256: Product ID
-        quantity  # uint256: Quantity
-    ).build_transaction({
-        'from': sender_address,  # Distributor's Ethereum address
-        'nonce': web3.eth.get_transaction_count(sender_address),  # Get the current nonce
-        'gas': 2000000,  # Set gas limit
-        'gasPrice': Web3.to_wei('50', 'gwei')  # Set gas price
-    })
+    # Queue the transaction for the distributor's account; the outbox sender signs and sends it
+    outbox_tx = enqueue_transaction("DistributorContract", "updateInventory", [product_id, quantity], 'distributor', ordering_key=inventory_ordering_key(product_id), created_by=created_by)
 
-    # Sign the transaction with the distributor's private key
-    private_key = os.getenv("PRIVATE_KEY_DISTRIBUTOR")  # Get the private key from environment
-    signed_txn = web3.eth.account.sign_transaction(transaction, private_key)  # Sign the transaction
+    # Return the queued transaction; the view shows its tracking ID
+    return outbox_tx
 
-    # Send the signed transaction to the blockchain
-    tx_hash = web3.eth.send_raw_transaction(signed_txn.raw_transaction)  # Send the transaction
 
-    # Return the transaction hash as a hexadecimal string
-    return Web3.to_hex(tx_hash)
+
+
+
+### Inventory Sync ###
+
+# Warehouse quantities are pushed to the DistributorContract in batches, and only for products whose
+# quantity changed since the last push (or whose push failed); InventorySync records what was pushed.
+
+INVENTORY_SYNC_BATCH_SIZE = int(os.getenv('INVENTORY_SYNC_BATCH_SIZE', 50))  # Products per updateInventories transaction
+
+
+def stale_products(product_ids=None):
+    """Products whose warehouse quantity differs from the last quantity pushed to the blockchain."""
+    products = Product.objects.filter(
+        Q(inventory_sync__isnull=True)  # Never pushed
+        | ~Q(inventory_sync__synced_quantity=F('quantity'))  # Changed since the last push
+        | Q(inventory_sync__outbox_tx__status__in=['reverted', 'failed'])  # The last push never made it on chain
+    ).filter(product_id__regex=r'^[0-9]+$')  # The contract keys inventory by a uint256 product ID
+    if product_ids is not None:
+        products = products.filter(product_id__in=[str(product_id) for product_id in product_ids])
+    return products
+
+
+@transaction.atomic  # The queued transactions and the sync records are committed together
+def sync_inventory(product_ids=None, created_by=None):
+    """Queue updateInventories transactions for the products whose quantity changed, and return them.
+
+    Pass ``product_ids`` to only consider those products, and ``created_by`` for a push a user's request queued.
+    """
+    # Lock the products being pushed, so two sync runs never queue the same change twice
+    products = list(stale_products(product_ids).select_for_update(of=('self',)).order_by('pk'))
+
+    batched = has_function("DistributorContract", "updateInventories")  # One updateInventory per product on older deployments
+    batch_size = INVENTORY_SYNC_BATCH_SIZE if batched else 1
+
+    # Chunk the products of each distributor pool account their ordering keys map to
+    chunks = [group[start:start + batch_size]
+              for group in group_by_signer('distributor', products, lambda product: inventory_ordering_key(product.product_id))
+              for start in range(0, len(group), batch_size)]
+
+    outbox_txs = []
+    for chunk in chunks:
+        product_ids = [int(product.product_id) for product in chunk]
+        quantities = [max(int(product.quantity), 0) for product in chunk]  # The contract stores whole, non-negative units
+
+        # Queue the transaction for the distributor's account; the outbox sender signs and sends it
+        if batched:
+            outbox_tx = enqueue_transaction("DistributorContract", "updateInventories", [product_ids, quantities],
+                                            'distributor', ordering_key=inventory_ordering_key(product_ids[0]), created_by=created_by)
+        else:
+            outbox_tx = enqueue_transaction("DistributorContract", "updateInventory", [product_ids[0], quantities[0]],
+                                            'distributor', ordering_key=inventory_ordering_key(product_ids[0]), created_by=created_by)
+        outbox_txs.append(outbox_tx)
+
+        # Record what was pushed, creating or updating every sync record of the chunk in one query
+        synced_at = timezone.now()
+        InventorySync.objects.bulk_create(
+            [InventorySync(product=product, synced_quantity=product.quantity, outbox_tx=outbox_tx, synced_at=synced_at)
+             for product in chunk],
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['synced_quantity', 'outbox_tx', 'synced_at'],
+        )
+
+    if products:
+        logger.info(f"Queued {len(outbox_txs)} inventory updates for {len(products)} products")
+    return outbox_txs
 
 
 
 
 
 # Function to create a product on the blockchain
-def create_product(order_id, product_id, quantity):
+def create_product(order_id, product_id, quantity, created_by=None):
     """Create a new product on the blockchain as part of an order."""
     check_order_exists(order_id)  # Ensure the order exists
 
-    sender_address = web3.eth.accounts[2]  # Use the manufacturer's account (third account in Ganache)
     
     # Ensure the order_id, product_id, and quantity are integers
     order_id = int(order_id)
     product_id = int(product_id)
     quantity = int(quantity)
 
-    # Build the transaction to create the product on the blockchain
-    transaction = manufacturer_contract.functions.createProduct(
-        order_id,  # uint256: Order ID
-        product_id,  # uint256: Product ID
-        quantity  # uint256: Quantity
-    ).build_transaction({
-        'from': sender_address,  # Manufacturer's Ethereum address
-        'nonce': web3.eth.get_transaction_count(sender_address),  # Get the current nonce
-        'gas': 2000000,  # Set gas limit
-        'gasPrice': Web3.to_wei('50', 'gwei')  # Set gas price
-    })
-
-    # Sign the transaction with the manufacturer's private key
-    private_key = os.getenv("PRIVATE_KEY_MANUFACTURER")  # Get the private key from environment
-    signed_txn = web3.eth.account.sign_transaction(transaction, private_key)  # Sign the transaction
+    # Queue the transaction for the manufacturer's account; the outbox sender signs and sends it
+    outbox_tx = enqueue_transaction("ManufacturerContract", "createProduct", [order_id, product_id, quantity], 'manufacturer', created_by=created_by)
 
-    # Send the signed transaction to the blockchain
-    tx_hash = web3.eth.send_raw_transaction(signed_txn.raw_transaction)  # Send the transaction
-
-    # Return the transaction hash as a hexadecimal string
-    return Web3.to_hex(tx_hash)
+    # Return the queued transaction; the view shows its tracking ID
+    return outbox_tx
@@ -0,0 +1,333 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+import requests
+from eth_utils import abi_to_signature, function_abi_to_4byte_selector
+from requests.adapters import HTTPAdapter
+from web3 import AsyncWeb3, Web3
+from web3._utils.http_session_manager import HTTPSessionManager
+from web3.middleware import Web3Middleware
+from web3.providers.rpc.utils import ExceptionRetryConfiguration
+
+logger = logging.getLogger('blockchain_services')
+
+# Load environment variables from .env
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# Which chain the application talks to:
+#   "ganache" - a JSON-RPC node at WEB3_PROVIDER, with the contract addresses Truffle deployed to network 5777
+#   "tester"  - an in-process eth-tester chain the four contracts are deployed to on first use, so tests and
+#               benchmarks run without a node. The chain lives in the process that created it.
+CHAIN_BACKEND = os.getenv('CHAIN_BACKEND', 'ganache')
+ganache_url = os.getenv('WEB3_PROVIDER', 'http://127.0.0.1:7545')  # Get the blockchain provider URL from the environment or use Ganache default
+TRUFFLE_NETWORK_ID = '5777'  # Network ID Ganache deploys to
+
+CONTRACTS_DIR = Path(__file__).resolve().parent / 'smart_contracts'
+
+# Contracts in deployment order, each with the contracts whose addresses its constructor takes
+CONTRACT_DEPLOYMENTS = [
+    ('DeliveryContract', []),
+    ('ManufacturerContract', ['DeliveryContract']),
+    ('DistributorContract', ['ManufacturerContract', 'DeliveryContract']),
+    ('RetailStoreContract', ['DistributorContract', 'DeliveryContract']),
+]
+
+SOLC_VERSION = os.getenv('SOLC_VERSION', '0.8.17')  # Compiler version the Truffle artifacts were built with
+TESTER_FUNDING = Web3.to_wei(1000, 'ether')  # Balance given to signing accounts on the tester chain
+
+
+def is_tester():
+    return CHAIN_BACKEND == 'tester'
+
+
+def load_artifact(contract_name):
+    """Return the Truffle build artifact of a contract; callers keep only the parts they need."""
+    with open(CONTRACTS_DIR / f"build/contracts/{contract_name}.json") as f:
+        return json.load(f)
+
+
+def compile_contracts():
+    """Compile the Solidity sources with py-solc-x, returning ``{name: (abi, bytecode)}``, or None when no compiler is available."""
+    try:
+        import solcx
+        output = solcx.compile_files(
+            sorted(str(path) for path in (CONTRACTS_DIR / 'contracts').glob('*.sol')),
+            output_values=['abi', 'bin'],
+            solc_version=SOLC_VERSION,
+        )
+    except Exception as e:  # py-solc-x not installed, or the solc binary not downloaded
+        logger.warning(f"Could not compile the contracts ({str(e)}), deploying the Truffle artifacts' bytecode instead")
+        return None
+    # Output is keyed by "<source path>:<contract name>"
+    return {key.rsplit(':', 1)[1]: (contract['abi'], contract['bin']) for key, contract in output.items()}
+
+
+def check_artifact_bytecode(contract_name, artifact):
+    """Raise when a Truffle artifact's bytecode does not implement every function of its ABI, i.e. it is stale."""
+    deployed_bytecode = bytes.fromhex(artifact.get('deployedBytecode', '').removeprefix('0x'))
+    if not deployed_bytecode:
+        missing = ['all functions']
+    else:
+        # The function dispatcher compares the call's selector with each function's selector
+        missing = [abi_to_signature(entry) for entry in artifact['abi'] if entry['type'] == 'function'
+                   and function_abi_to_4byte_selector(entry) not in deployed_bytecode]
+    if missing:
+        raise Exception(
+            f"The {contract_name} artifact's bytecode is out of date with its ABI ({', '.join(missing)} missing). "
+            f"Install solc {SOLC_VERSION} for py-solc-x (solcx.install_solc('{SOLC_VERSION}')), "
+            f"or rebuild the artifacts with truffle compile."
+        )
+
+
+### HTTP Transport ###
+
+RPC_CONNECT_TIMEOUT = float(os.getenv('RPC_CONNECT_TIMEOUT', 3))  # Seconds to open a connection to the node
+RPC_TIMEOUT = float(os.getenv('RPC_TIMEOUT', 30))  # Seconds to wait for a response, e.g. a large eth_getLogs
+RPC_POOL_SIZE = int(os.getenv('RPC_POOL_SIZE', 10))  # Kept-alive connections of the session a process's threads share; concurrent requests beyond it open short-lived ones
+RPC_RETRIES = int(os.getenv('RPC_RETRIES', 3))  # Retries of a read after a connection error, timeout or 429/5xx response
+RPC_RETRY_BACKOFF = float(os.getenv('RPC_RETRY_BACKOFF', 0.1))  # Upper bound in seconds of the first retry's delay, doubled per retry
+RPC_MIDDLEWARE = os.getenv('RPC_MIDDLEWARE', 'default')  # "lean" drops web3's default middleware
+
+# Read-only methods we call, which are safe to repeat. eth_sendRawTransaction is never retried here:
+# the outbox sender rebroadcasts the same signed bytes itself after a transient error.
+RETRY_METHODS = {
+    'web3_clientVersion', 'eth_chainId', 'eth_blockNumber', 'eth_getBlockByNumber', 'eth_getBlockByHash',
+    'eth_getLogs', 'eth_call', 'eth_getBalance', 'eth_getTransactionCount', 'eth_getTransactionReceipt',
+}
+
+
+def is_retryable(error):
+    if isinstance(error, requests.HTTPError):  # Overloaded or restarting node; other HTTP errors will not go away
+        return error.response is not None and (error.response.status_code == 429 or error.response.status_code >= 500)
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def retry_delay(attempt):
+    # "Full jitter": workers that failed together spread their retries instead of hitting the node in step
+    return random.uniform(0, RPC_RETRY_BACKOFF * 2 ** attempt)
+
+
+def create_session():
+    """A requests session with a connection pool sized for the process's request threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=RPC_POOL_SIZE, max_retries=0)  # Retries are done per RPC method
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_session = None  # Shared by every provider and thread of the process, created by get_session()
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """The process's session, created on first use, so a worker forked before then opens its own connections."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def _drop_session_after_fork():
+    # A forked child must not share its parent's sockets
+    global _session, _session_lock
+    _session, _session_lock = None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_drop_session_after_fork)
+
+
+class SharedSessionManager(HTTPSessionManager):
+    """Hands every thread the process's one sized session, instead of web3's cache of a session per thread."""
+
+    def cache_and_return_session(self, endpoint_uri, session=None, request_timeout=None):
+        return get_session()
+
+
+class PooledHTTPProvider(Web3.HTTPProvider):
+    """HTTPProvider on the shared pooled session, with bounded timeouts and jittered retries of read-only methods."""
+
+    def __init__(self, endpoint_uri):
+        super().__init__(
+            endpoint_uri,
+            request_kwargs={'timeout': (RPC_CONNECT_TIMEOUT, RPC_TIMEOUT)},
+            exception_retry_configuration=None,  # Replaced by the jittered retries below
+        )
+        self._request_session_manager = SharedSessionManager()
+
+    def with_retries(self, methods, send):
+        # Only a request made of read-only methods is repeated
+        attempts = RPC_RETRIES + 1 if all(method in RETRY_METHODS for method in methods) else 1
+        for attempt in range(attempts):
+            try:
+                return send()
+            except Exception as e:
+                if attempt == attempts - 1 or not is_retryable(e):
+                    raise
+                logger.warning(f"Retrying {', '.join(sorted(set(methods)))} after {type(e).__name__}: {str(e)}")
+                time.sleep(retry_delay(attempt))
+
+    def make_request(self, method, params):
+        send = super().make_request
+        return self.with_retries([method], lambda: send(method, params))
+
+    def make_batch_request(self, batch_requests):
+        send = super().make_batch_request
+        return self.with_retries([method for method, _ in batch_requests], lambda: send(batch_requests))
+
+
+def get_middleware():
+    """Middleware for new Web3 instances: None keeps web3's defaults, "lean" uses none.
+
+    The lean profile fits the calls this project makes: transactions are signed locally with an explicit
+    gas limit, gas price, nonce and chain ID, so gas estimation, gas price strategies and request validation
+    are not needed; addresses are never ENS names; and results are read as dicts, not attributes.
+    """
+    return [] if RPC_MIDDLEWARE == 'lean' else None
+
+
+def create_web3():
+    """Return a new Web3 instance on the configured backend, with the configured middleware."""
+    web3 = Web3(get_provider(), middleware=get_middleware())
+    web3.middleware_onion.add(RPCCallCounter, 'rpc_call_counter')  # Also in the lean profile, it costs one attribute lookup
+    return web3
+
+
+def create_async_web3():
+    """Return a new AsyncWeb3 instance on the configured backend, with the configured middleware."""
+    return AsyncWeb3(get_async_provider(), middleware=get_middleware())
+
+
+
+### RPC Call Counting ###
+
+_rpc_count = threading.local()  # Counter of the count_rpc_calls() block running in this thread
+
+
+class RPCCallCounter(Web3Middleware):
+    """Counts the JSON-RPC calls made inside count_rpc_calls(), each call of a batch included."""
+
+    def request_processor(self, method, params):
+        count = getattr(_rpc_count, 'count', None)
+        if count is not None:
+            count.calls += 1
+        return method, params
+
+
+@contextmanager
+def count_rpc_calls():
+    """Count the RPC calls this thread makes in the block; read ``.calls`` of the yielded object."""
+    previous = getattr(_rpc_count, 'count', None)
+    _rpc_count.count = SimpleNamespace(calls=0)
+    try:
+        yield _rpc_count.count
+    finally:
+        _rpc_count.count = previous
+
+
+
+### In-Process Tester Chain ###
+
+_tester = None  # (provider, {contract name: (abi, address)}), created by get_tester()
+_tester_lock = threading.Lock()
+
+
+def get_tester():
+    """Return the in-process tester provider and deployed contract interfaces, deploying the contracts the first time."""
+    global _tester
+    if _tester is None:
+        with _tester_lock:
+            if _tester is None:
+                _tester = deploy_tester_chain()
+    return _tester
+
+
+def deploy_tester_chain():
+    from web3 import EthereumTesterProvider  # Needs eth-tester, which only the tester backend uses
+
+    provider = EthereumTesterProvider()
+    web3 = Web3(provider)
+    deployer = web3.eth.accounts[0]
+    compiled = compile_contracts() or {}
+
+    interfaces = {}
+    for contract_name, dependencies in CONTRACT_DEPLOYMENTS:
+        if contract_name in compiled:
+            abi, bytecode = compiled[contract_name]
+        else:
+            artifact = load_artifact(contract_name)
+            check_artifact_bytecode(contract_name, artifact)  # Never deploy code that lacks functions the ABI promises
+            abi, bytecode = artifact['abi'], artifact['bytecode']
+
+        constructor_args = [interfaces[dependency][1] for dependency in dependencies]
+        tx_hash = web3.eth.contract(abi=abi, bytecode=bytecode).constructor(*constructor_args).transact({'from': deployer})
+        interfaces[contract_name] = (abi, web3.eth.get_transaction_receipt(tx_hash)['contractAddress'])
+        logger.info(f"Deployed {contract_name} to the tester chain at {interfaces[contract_name][1]}")
+
+    return provider, interfaces
+
+
+def tester_private_key(index):
+    """Private key of one of the tester chain's pre-funded accounts."""
+    provider, _ = get_tester()
+    return provider.ethereum_tester.backend.account_keys[index].to_hex()
+
+
+def fund_account(address):
+    """Give an account on the tester chain enough ether to pay for gas, e.g. one configured with a Ganache key."""
+    provider, _ = get_tester()
+    web3 = Web3(provider)
+    if web3.eth.get_balance(address) < TESTER_FUNDING // 2:
+        web3.eth.send_transaction({'from': web3.eth.accounts[0], 'to': address, 'value': TESTER_FUNDING})
+
+
+### Backend Interface ###
+
+def get_provider():
+    """Return a provider for the configured backend."""
+    if is_tester():
+        return get_tester()[0]
+    return PooledHTTPProvider(ganache_url)  # Pooled HTTP connection to the blockchain node
+
+
+def get_async_provider():
+    """Return an async provider for the configured backend, on the same chain as get_provider()."""
+    if is_tester():
+        from web3.providers.eth_tester import AsyncEthereumTesterProvider
+
+        async_provider = AsyncEthereumTesterProvider()
+        async_provider.ethereum_tester = get_tester()[0].ethereum_tester  # Share the chain the contracts were deployed to
+        return async_provider
+
+    import aiohttp
+    from web3 import AsyncHTTPProvider
+    return AsyncHTTPProvider(
+        ganache_url,
+        request_kwargs={'timeout': aiohttp.ClientTimeout(total=RPC_TIMEOUT, connect=RPC_CONNECT_TIMEOUT)},
+        exception_retry_configuration=ExceptionRetryConfiguration(
+            errors=(aiohttp.ClientError, TimeoutError), retries=RPC_RETRIES + 1, backoff_factor=RPC_RETRY_BACKOFF,
+            method_allowlist=sorted(RETRY_METHODS),
+        ),
+    )
+
+
+def contract_interface(contract_name):
+    """Return a contract's ABI and deployed address on the configured backend."""
+    if is_tester():
+        return get_tester()[1][contract_name]
+
+    artifact = load_artifact(contract_name)
+    if TRUFFLE_NETWORK_ID not in artifact['networks']:
+        raise Exception(f"{contract_name} is not deployed to network {TRUFFLE_NETWORK_ID}, run truffle migrate --reset.")
+    return artifact['abi'], artifact['networks'][TRUFFLE_NETWORK_ID]['address']  # Use the address deployed on Ganache
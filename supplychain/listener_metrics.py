@@ -0,0 +1,189 @@
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Histogram buckets in seconds, from a cached lookup to a slow RPC call
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Buckets for counts of logs returned by one poll
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names, label_values):
+    if not label_names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)) + '}'
+
+
+class Metric:
+    """Base class for a metric family; values are kept per tuple of label values."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, (label_names, label_values), value in self._rendered_samples():
+            lines.append(f"{name}{_format_labels(label_names, label_values)} {value}")
+        return '\n'.join(lines)
+
+    def _rendered_samples(self):
+        return [(name, (self.label_names, key), value) for name, key, value in self.samples()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, count, total = self._values.get(key, ((0,) * len(self.buckets), 0, 0.0))
+            counts = tuple(bucket_count + (value <= bound) for bucket_count, bound in zip(counts, self.buckets))
+            self._values[key] = (counts, count + 1, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _rendered_samples(self):
+        rendered = []
+        for _, key, (counts, count, total) in self.samples():
+            bucket_labels = self.label_names + ('le',)
+            for bound, bucket_count in zip(self.buckets, counts):  # Buckets are cumulative, as Prometheus expects
+                rendered.append((f"{self.name}_bucket", (bucket_labels, key + (bound,)), bucket_count))
+            rendered.append((f"{self.name}_bucket", (bucket_labels, key + ('+Inf',)), count))
+            rendered.append((f"{self.name}_sum", (self.label_names, key), total))
+            rendered.append((f"{self.name}_count", (self.label_names, key), count))
+        return rendered
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+registry = Registry()
+
+
+### Listener Metrics ###
+
+head_block = registry.register(Gauge(
+    'listener_head_block', 'Latest block number reported by the node', ['stream']))
+checkpoint_block = registry.register(Gauge(
+    'listener_checkpoint_block', 'Block number the checkpoint has processed up to', ['stream']))
+block_lag = registry.register(Gauge(
+    'listener_block_lag', 'Blocks between the chain head and the checkpoint', ['stream']))
+logs_per_poll = registry.register(Histogram(
+    'listener_logs_per_poll', 'Logs returned by one get_logs call or subscription message', ['stream'], COUNT_BUCKETS))
+events_handled = registry.register(Counter(
+    'listener_events_total', 'Events dispatched to a handler, by outcome', ['event', 'outcome']))
+handler_duration = registry.register(Histogram(
+    'listener_handler_duration_seconds', 'Time spent in an event handler', ['event']))
+errors = registry.register(Counter(
+    'listener_errors_total', 'Exceptions caught by the listener, by stage and exception type', ['stage', 'type']))
+rpc_duration = registry.register(Histogram(
+    'listener_rpc_duration_seconds', 'Latency of JSON-RPC calls made by the listener', ['method']))
+heartbeat = registry.register(Gauge(
+    'listener_heartbeat_timestamp_seconds', 'Unix time the listener loop last completed an iteration', ['stream']))
+
+
+def record_error(stage, error):
+    errors.inc(stage=stage, type=type(error).__name__)
+
+
+def beat(stream):
+    heartbeat.set(time.time(), stream=stream)
+
+
+def record_position(stream, head_number, checkpoint_number):
+    head_block.set(head_number, stream=stream)
+    checkpoint_block.set(checkpoint_number, stream=stream)
+    block_lag.set(max(head_number - checkpoint_number, 0), stream=stream)
+
+
+### HTTP Endpoint ###
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    # Heartbeats older than this make /healthz fail, set by start_http_server
+    stale_after = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] == '/metrics':
+            self._respond(200, registry.render(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif self.path.split('?')[0] == '/healthz':
+            beats = [value for _, _, value in heartbeat.samples()]
+            healthy = bool(beats) and (self.stale_after is None or time.time() - max(beats) < self.stale_after)
+            self._respond(200 if healthy else 503, 'ok\n' if healthy else 'stale\n', 'text/plain')
+        else:
+            self._respond(404, 'not found\n', 'text/plain')
+
+    def _respond(self, status, body, content_type):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # Scrapes every few seconds would flood the listener log
+        pass
+
+
+def start_http_server(port, host='127.0.0.1', stale_after=None):
+    """Serve /metrics and /healthz from a daemon thread and return the server."""
+    handler = type('ListenerMetricsHandler', (MetricsHandler,), {'stale_after': stale_after})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='listener-metrics', daemon=True).start()
+    return server
@@ -0,0 +1,28 @@
+# supplychain/management/commands/authorize_senders.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from supplychain import blockchain_service
+
+
+class Command(BaseCommand):
+    help = ("Queues the transactions letting each role's pool accounts send on its behalf: authorizeSender offers from "
+            "the role's account, then, on a second run once those are mined, acceptPrincipal from each pool account")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--role', action='append', dest='roles', choices=list(blockchain_service.PRIVATE_KEY_SETTINGS),
+                            help='Only authorize the pool of this role (repeatable)')
+
+    def handle(self, *args, **options):
+        for role in options['roles'] or blockchain_service.SENDER_CHECKED_CONTRACTS:
+            try:
+                outbox_txs = blockchain_service.authorize_pool_senders(role)
+            except Exception as e:
+                raise CommandError(f"Could not authorize the {role} pool: {str(e)}")
+
+            if not outbox_txs:
+                self.stdout.write(f"The {role} pool accounts are already authorized.")
+            for outbox_tx in outbox_txs:
+                self.stdout.write(f"Queued {outbox_tx.function_name}({outbox_tx.args[0]}) from {outbox_tx.sender} on the {outbox_tx.contract_name}. Tracking ID: {outbox_tx.tracking_id}")
+            if any(outbox_tx.function_name == "authorizeSender" for outbox_tx in outbox_txs):
+                self.stdout.write(f"Run this command again once the offers are mined, to have the {role} pool accounts accept them.")
@@ -0,0 +1,81 @@
+# supplychain/management/commands/backfill_events.py
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Replays contract events from a block range through the event listener handlers; with --project-only, '
+            'only records them in the processed event ledger and the read model')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-block', type=int, required=True, help='First block to replay')
+        parser.add_argument('--to-block', type=int, help='Last block to replay (defaults to the current head)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Initial number of blocks per get_logs call')
+        parser.add_argument('--max-chunk-size', type=int, default=50000, help='Upper bound for the adaptive chunk size')
+        parser.add_argument('--workers', type=int, default=4, help='Number of concurrent get_logs calls')
+        parser.add_argument('--stream', default='backfill', help='Checkpoint stream used to record progress')
+        parser.add_argument('--project-only', action='store_true',
+                            help='Record the events and project them into the read model without running the handlers, '
+                                 'for history the database already reflects (e.g. from before the ledger existed)')
+
+    def handle(self, *args, **options):
+        import event_listener  # Imported here so the command only connects to the node when it runs
+
+        self.listener = event_listener
+        self.chunk_size = options['chunk_size']
+        self.max_chunk_size = options['max_chunk_size']
+
+        from_block = options['from_block']
+        to_block = options['to_block'] if options['to_block'] is not None else event_listener.web3.eth.block_number
+        if from_block < 0 or to_block < from_block:
+            raise CommandError(f"Invalid block range {from_block}-{to_block}.")
+
+        # Progress is recorded in its own stream so the live poller's cursor is left alone
+        checkpoint, _ = event_listener.BlockCheckpoint.objects.update_or_create(
+            stream=options['stream'],
+            defaults={'block_number': max(from_block - 1, 0), 'log_index': None}
+        )
+
+        total_logs = 0
+        max_in_flight = options['workers'] * 2  # Keep a few chunks queued so the workers never idle
+        pending = deque()
+        next_block = from_block
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while next_block <= to_block or pending:
+                # Schedule chunks ahead of the one being processed, using the current adaptive size
+                while next_block <= to_block and len(pending) < max_in_flight:
+                    chunk_end = min(next_block + self.chunk_size - 1, to_block)
+                    pending.append((chunk_end, executor.submit(self.fetch_logs, next_block, chunk_end)))
+                    next_block = chunk_end + 1
+
+                # Chunks are consumed in the order they were scheduled, so handlers see events in block order
+                chunk_end, future = pending.popleft()
+                logs = sorted(future.result(), key=lambda log: (log['blockNumber'], log['logIndex']))
+                event_listener.process_logs(logs, checkpoint, chunk_end, project_only=options['project_only'])
+
+                total_logs += len(logs)
+                self.stdout.write(f"Processed blocks up to {chunk_end} ({total_logs} events so far)")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total_logs} events from blocks {from_block}-{to_block}."))
+
+    def fetch_logs(self, from_block, to_block):
+        """Fetch logs for a block range, splitting it in half whenever the node rejects the request."""
+        try:
+            logs = self.listener.web3.eth.get_logs(self.listener.build_log_filter(from_block, to_block))
+        except Exception as e:
+            if from_block == to_block:  # A single block cannot be split any further
+                raise CommandError(f"Could not fetch logs for block {from_block}: {str(e)}")
+
+            # Too many results or a timeout: shrink future chunks and retry this range in two halves
+            self.chunk_size = max(1, min(self.chunk_size, to_block - from_block + 1) // 2)
+            middle = (from_block + to_block) // 2
+            return self.fetch_logs(from_block, middle) + self.fetch_logs(middle + 1, to_block)
+
+        # Sparse ranges let the next chunks cover more blocks per call
+        if len(logs) < 1000 and to_block - from_block + 1 >= self.chunk_size:
+            self.chunk_size = min(self.chunk_size * 2, self.max_chunk_size)
+        return logs
@@ -0,0 +1,177 @@
+# supplychain/management/commands/benchmark_listener.py
+
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from web3 import Web3
+
+
+# Decoded event shape accepted from --input, one JSON object per line:
+# {"event": "OrderPlaced", "args": {...}, "transactionHash": "0x..", "logIndex": 0, "blockNumber": 1, "blockHash": "0x.."}
+# Only "event" and "args" are required; missing chain coordinates are filled in.
+
+
+class Command(BaseCommand):
+    help = 'Replays decoded events through the event listener handlers offline and reports throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input', help='JSONL file of decoded events to replay')
+        parser.add_argument('--synthetic', type=int, default=0, help='Generate this many synthetic orders (10 events each)')
+        parser.add_argument('--write-events', help='Write the replayed events to this JSONL file for later runs')
+        parser.add_argument('--batch-size', type=int, default=100, help='Events per dispatch_events call, like one poll')
+        parser.add_argument('--db-file', help='SQLite file for the throwaway database (defaults to a temp file)')
+        parser.add_argument('--quiet', action='store_true', help='Silence the handlers\' per-event INFO logging')
+
+    def handle(self, *args, **options):
+        if not options['input'] and not options['synthetic']:
+            raise CommandError("Pass --input or --synthetic.")
+
+        events = self.load_events(options['input']) if options['input'] else self.synthetic_events(options['synthetic'])
+        if options['write_events']:
+            with open(options['write_events'], 'w') as f:
+                for event in events:
+                    f.write(json.dumps(event) + '\n')
+
+        if options['quiet']:
+            logging.disable(logging.INFO)
+
+        # Always run against a throwaway database, on disk so commits cost what they cost in production
+        old_name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite':
+            db_file = options['db_file'] or os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = db_file
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        try:
+            import event_listener  # Only needs the contract ABIs; no node is contacted
+
+            self.seed_database(events)
+            results = self.run(event_listener, [self.to_decoded_event(event) for event in events], options['batch_size'])
+            self.report(results, len(events))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def load_events(self, path):
+        with open(path) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+
+        for position, event in enumerate(events):  # Fill in chain coordinates that recordings may lack
+            event.setdefault('blockNumber', position + 1)
+            event.setdefault('logIndex', 0)
+            event.setdefault('transactionHash', Web3.to_hex(Web3.keccak(text=f"benchmark-tx-{position}")))
+            event.setdefault('blockHash', Web3.to_hex(Web3.keccak(text=f"benchmark-block-{event['blockNumber']}")))
+        return events
+
+    def synthetic_events(self, order_count):
+        """A realistic order lifecycle per order: placed, checked, manufactured, processed, shipped, confirmed."""
+        retail_stores = [Web3.to_checksum_address(Web3.keccak(text=f"store-{n}")[-20:]) for n in range(10)]
+        events = []
+
+        def emit(name, **event_args):
+            block_number = len(events) + 1
+            events.append({
+                'event': name,
+                'args': event_args,
+                'transactionHash': Web3.to_hex(Web3.keccak(text=f"benchmark-tx-{block_number}")),
+                'logIndex': 0,
+                'blockNumber': block_number,
+                'blockHash': Web3.to_hex(Web3.keccak(text=f"benchmark-block-{block_number}")),
+            })
+
+        for order_id in range(1, order_count + 1):
+            product_id = order_id % 50 + 1
+            retail_store = retail_stores[order_id % len(retail_stores)]
+            emit('OrderPlaced', orderId=order_id, productId=product_id, quantity=3, retailStore=retail_store)
+            emit('ManufacturerNotified', orderId=order_id, productId=product_id, quantity=3)
+            emit('ManufacturerContacted', orderId=order_id, productId=product_id, quantity=3)
+            emit('ProductCreated', orderId=order_id, productId=product_id, quantity=3)
+            emit('InventoryUpdated', productId=product_id, newQuantity=order_id % 100)
+            emit('OrderProcessed', orderId=order_id, productId=product_id, quantity=3, isAvailable=True)
+            emit('DeliveryInitiated', orderId=order_id, productId=product_id, quantity=3, retailStore=retail_store)
+            emit('StatusUpdated', orderId=order_id, status=0)
+            emit('DeliveryConfirmed', orderId=order_id, retailStore=retail_store)
+            emit('StatusUpdated', orderId=order_id, status=1)
+        return events
+
+    def seed_database(self, events):
+        """Create the users and products the events refer to, so handlers run their success path."""
+        from warehouse.models import Product
+
+        User = get_user_model()
+        distributor = User.objects.create(username='benchmark_distributor', user_role='distributor')
+        User.objects.create(username='benchmark_manufacturer', user_role='manufacturer')
+
+        addresses = {event['args']['retailStore'] for event in events if 'retailStore' in event['args']}
+        User.objects.bulk_create([
+            User(username=f"benchmark_store_{n}", user_role='retail_store', eth_address=address)
+            for n, address in enumerate(sorted(addresses))
+        ])
+
+        product_ids = {str(event['args']['productId']) for event in events if 'productId' in event['args']}
+        Product.objects.bulk_create([
+            Product(product_id=product_id, name=f"Product {product_id}", description='Benchmark', unitofmesurment='pcs',
+                    quantity=1000000, reorderpoint=0, price=1, supplierinfo='Benchmark', comments='', created_by=distributor)
+            for product_id in sorted(product_ids)
+        ])
+
+    def to_decoded_event(self, event):
+        from hexbytes import HexBytes
+
+        return dict(event, transactionHash=HexBytes(event['transactionHash']), blockHash=HexBytes(event['blockHash']))
+
+    def run(self, event_listener, events, batch_size):
+        latencies = defaultdict(list)
+        queries = defaultdict(int)
+        current = ['overhead']  # Event type the running queries are attributed to
+
+        def count_queries(execute, sql, params, many, context):
+            queries[current[0]] += 1
+            return execute(sql, params, many, context)
+
+        def timed(name, handler):
+            def wrapper(event, batch=None):
+                current[0] = name
+                started = time.perf_counter()
+                try:
+                    return handler(event, batch)
+                finally:
+                    latencies[name].append(time.perf_counter() - started)
+                    current[0] = 'overhead'
+            return wrapper
+
+        original_handlers = dict(event_listener.EVENT_HANDLERS)
+        event_listener.EVENT_HANDLERS.update({name: timed(name, handler) for name, handler in original_handlers.items()})
+
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_queries):
+                for start in range(0, len(events), batch_size):
+                    with transaction.atomic():  # One transaction per batch, like process_logs
+                        event_listener.dispatch_events(events[start:start + batch_size])
+        finally:
+            event_listener.EVENT_HANDLERS.update(original_handlers)
+
+        return time.perf_counter() - started, latencies, queries
+
+    def report(self, results, event_count):
+        elapsed, latencies, queries = results
+
+        self.stdout.write(f"{'Event':<24}{'Count':>8}{'p50 ms':>10}{'p99 ms':>10}{'Queries/event':>16}")
+        for name, samples in sorted(latencies.items()):
+            samples = sorted(samples)
+            p50 = statistics.median(samples) * 1000
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000
+            self.stdout.write(f"{name:<24}{len(samples):>8}{p50:>10.3f}{p99:>10.3f}{queries[name] / len(samples):>16.2f}")
+
+        self.stdout.write(f"Batch overhead (prefetch, ledger, flush, savepoints): {queries['overhead'] / event_count:.2f} queries/event")
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {event_count} events in {elapsed:.2f}s: {event_count / elapsed:.0f} events/sec"
+        ))
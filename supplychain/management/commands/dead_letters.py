@@ -0,0 +1,44 @@
+# supplychain/management/commands/dead_letters.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from supplychain.models import FailedEvent
+
+
+class Command(BaseCommand):
+    help = 'Lists, replays or purges blockchain events whose handlers failed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'replay', 'purge'])
+        parser.add_argument('ids', nargs='*', type=int, help='Dead-letter IDs to act on')
+        parser.add_argument('--status', choices=[status for status, _ in FailedEvent.STATUS_CHOICES],
+                            help='Act on every dead letter with this status instead of explicit IDs')
+
+    def handle(self, *args, **options):
+        failed_events = FailedEvent.objects.order_by('block_number', 'log_index')
+        if options['ids']:
+            failed_events = failed_events.filter(pk__in=options['ids'])
+        elif options['status']:
+            failed_events = failed_events.filter(status=options['status'])
+        elif options['action'] != 'list':
+            raise CommandError("Pass dead-letter IDs or --status to choose what to act on.")
+
+        if options['action'] == 'list':
+            for failed_event in failed_events:
+                self.stdout.write(
+                    f"#{failed_event.pk} {failed_event.event_name} block {failed_event.block_number} "
+                    f"{failed_event.tx_hash}:{failed_event.log_index} [{failed_event.status}] "
+                    f"attempts={failed_event.attempts} next_retry={failed_event.next_retry_at:%Y-%m-%d %H:%M:%S} "
+                    f"error={failed_event.error}"
+                )
+
+        elif options['action'] == 'replay':
+            import event_listener  # Imported here so listing and purging work without a node
+
+            replayable = list(failed_events.exclude(status='resolved'))
+            resolved = event_listener.replay_failed_events(replayable)
+            self.stdout.write(self.style.SUCCESS(f"Replayed {len(replayable)} events, {resolved} resolved."))
+
+        else:
+            deleted, _ = failed_events.delete()
+            self.stdout.write(self.style.SUCCESS(f"Purged {deleted} dead letters."))
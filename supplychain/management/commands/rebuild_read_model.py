@@ -0,0 +1,23 @@
+# supplychain/management/commands/rebuild_read_model.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from supplychain.models import ChainDelivery, ChainDeliveryStatus, ChainInventory
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the chain deliveries, delivery status history and chain inventory from the processed event ledger. '
+            'Run backfill_events --project-only first to record events that happened before the listener handled them; '
+            'without --project-only their handlers would apply them to the database a second time')
+
+    def handle(self, *args, **options):
+        import event_listener  # Imported here so the command only connects to the node when it runs
+
+        with transaction.atomic():
+            event_listener.rebuild_read_model()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {ChainDelivery.objects.count()} deliveries, {ChainDeliveryStatus.objects.count()} status changes "
+            f"and the inventory of {ChainInventory.objects.count()} products."
+        ))
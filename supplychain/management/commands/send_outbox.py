@@ -0,0 +1,33 @@
+# supplychain/management/commands/send_outbox.py
+
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from supplychain import blockchain_service
+
+
+class Command(BaseCommand):
+    help = 'Signs and sends queued blockchain transactions and records their receipts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1, help='Seconds between rounds when there is nothing to do')
+        parser.add_argument('--batch-size', type=int, default=100, help='Transactions sent or checked per round')
+        parser.add_argument('--once', action='store_true', help='Run a single round and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent = blockchain_service.send_queued_transactions(options['batch_size'])
+                mined = blockchain_service.check_sent_transactions(options['batch_size'])
+            except Exception as e:  # Node unreachable or a transient send error; the row is retried next round
+                logging.error(f"An error occurred while sending queued transactions: {str(e)}")
+                sent = mined = 0
+
+            if sent or mined:
+                self.stdout.write(f"Sent {sent} transactions, {mined} mined.")
+            if options['once']:
+                break
+            if sent < options['batch_size']:  # Only wait when the queue has been drained
+                time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+# supplychain/management/commands/sync_inventory.py
+
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from supplychain import blockchain_service
+
+
+class Command(BaseCommand):
+    help = 'Pushes warehouse quantities that changed since the last sync to the blockchain in batched transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between sync rounds')
+        parser.add_argument('--once', action='store_true', help='Run a single round and exit')
+        parser.add_argument('--product', action='append', dest='product_ids', help='Only sync this product ID (repeatable)')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                outbox_txs = blockchain_service.sync_inventory(options['product_ids'])
+            except Exception as e:  # Nothing was queued; the same changes are picked up next round
+                logging.error(f"An error occurred while syncing inventory: {str(e)}")
+                outbox_txs = []
+
+            for outbox_tx in outbox_txs:
+                self.stdout.write(f"Queued {outbox_tx.function_name} for {len(outbox_tx.args[0])} products. Tracking ID: {outbox_tx.tracking_id}")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,57 @@
+# supplychain/management/commands/transaction_metrics.py
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from supplychain.models import TransactionMetric
+
+
+STAGES = ['nonce_ms', 'build_ms', 'sign_ms', 'send_ms', 'receipt_ms']
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Summarises blockchain transaction submissions per contract function: outcomes, stage latencies, RPC calls and gas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='Only include submissions from the last N hours')
+        parser.add_argument('--function', help='Only include this contract function, e.g. placeOrder')
+
+    def handle(self, *args, **options):
+        metrics = TransactionMetric.objects.filter(created_at__gte=timezone.now() - timedelta(hours=options['hours']))
+        if options['function']:
+            metrics = metrics.filter(function_name=options['function'])
+
+        groups = defaultdict(list)
+        for metric in metrics.values('contract_name', 'function_name', 'outcome', 'rpc_calls', 'gas_used', *STAGES):
+            groups[f"{metric['contract_name']}.{metric['function_name']}"].append(metric)
+
+        if not groups:
+            self.stdout.write("No transactions recorded in this period.")
+            return
+
+        for name, rows in sorted(groups.items()):
+            outcomes = Counter(row['outcome'] for row in rows)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name}: {len(rows)} submissions"))
+            self.stdout.write("  Outcomes: " + ', '.join(f"{outcome} {count}" for outcome, count in sorted(outcomes.items())))
+
+            self.stdout.write(f"  {'Stage':<12}{'Count':>8}{'p50 ms':>12}{'p95 ms':>12}{'max ms':>12}")
+            for stage in STAGES:
+                values = [row[stage] for row in rows if row[stage] is not None]
+                if values:
+                    self.stdout.write(
+                        f"  {stage[:-3]:<12}{len(values):>8}{percentile(values, 0.5):>12.2f}"
+                        f"{percentile(values, 0.95):>12.2f}{max(values):>12.2f}"
+                    )
+
+            gas = [row['gas_used'] for row in rows if row['gas_used'] is not None]
+            self.stdout.write(f"  RPC calls per submission: {sum(row['rpc_calls'] for row in rows) / len(rows):.2f}")
+            if gas:
+                self.stdout.write(f"  Gas used: average {sum(gas) / len(gas):.0f}, max {max(gas)}")
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplychain', '0005_delete_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stream', models.CharField(max_length=50, unique=True)),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplychain', '0006_blockcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blockcheckpoint',
+            name='log_index',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
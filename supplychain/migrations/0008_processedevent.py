@@ -0,0 +1,35 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplychain', '0007_blockcheckpoint_log_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tx_hash', models.CharField(max_length=66)),
+                ('log_index', models.PositiveIntegerField()),
+                ('block_number', models.PositiveBigIntegerField(db_index=True)),
+                ('block_hash', models.CharField(max_length=66)),
+                ('event_name', models.CharField(max_length=50)),
+                ('args', models.JSONField()),
+                ('processed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='blockcheckpoint',
+            name='block_hash',
+            field=models.CharField(blank=True, default='', max_length=66),
+        ),
+        migrations.AddConstraint(
+            model_name='processedevent',
+            constraint=models.UniqueConstraint(fields=('tx_hash', 'log_index'), name='unique_processed_event'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplychain', '0008_processedevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FailedEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tx_hash', models.CharField(max_length=66)),
+                ('log_index', models.PositiveIntegerField()),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('block_hash', models.CharField(max_length=66)),
+                ('event_name', models.CharField(max_length=50)),
+                ('args', models.JSONField()),
+                ('error', models.TextField()),
+                ('attempts', models.PositiveIntegerField(default=1)),
+                ('next_retry_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('resolved', 'Resolved'), ('abandoned', 'Abandoned')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='failedevent',
+            constraint=models.UniqueConstraint(fields=('tx_hash', 'log_index'), name='unique_failed_event'),
+        ),
+    ]
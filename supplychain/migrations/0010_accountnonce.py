@@ -0,0 +1,22 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplychain', '0009_failedevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountNonce',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=42, unique=True)),
+                ('next_nonce', models.PositiveBigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:55
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplychain', '0010_accountnonce'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tracking_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('contract_name', models.CharField(max_length=50)),
+                ('function_name', models.CharField(max_length=50)),
+                ('args', models.JSONField()),
+                ('role', models.CharField(max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('sent', 'Sent'), ('confirmed', 'Confirmed'), ('failed', 'Failed')], db_index=True, default='queued', max_length=20)),
+                ('nonce', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('tx_hash', models.CharField(blank=True, default='', max_length=66)),
+                ('raw_transaction', models.TextField(blank=True, default='')),
+                ('block_number', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('confirmed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
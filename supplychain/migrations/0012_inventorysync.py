@@ -0,0 +1,26 @@
+# Generated by Django 4.2.5 on 2026-10-18 02:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0018_remove_product_category'),
+        ('supplychain', '0011_outboxtransaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('synced_quantity', models.FloatField()),
+                ('synced_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('outbox_tx', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='supplychain.outboxtransaction')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_sync', to='warehouse.product')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-18 02:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplychain', '0012_inventorysync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('contract_name', models.CharField(max_length=50)),
+                ('function_name', models.CharField(max_length=50)),
+                ('outcome', models.CharField(choices=[('sent', 'Sent'), ('confirmed', 'Confirmed'), ('reverted', 'Reverted'), ('rejected', 'Rejected'), ('transient_error', 'Transient error'), ('error', 'Error')], db_index=True, max_length=20)),
+                ('nonce_ms', models.FloatField(blank=True, null=True)),
+                ('build_ms', models.FloatField(blank=True, null=True)),
+                ('sign_ms', models.FloatField(blank=True, null=True)),
+                ('send_ms', models.FloatField(blank=True, null=True)),
+                ('receipt_ms', models.FloatField(blank=True, null=True)),
+                ('rpc_calls', models.PositiveIntegerField(default=0)),
+                ('gas_used', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('outbox_tx', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='metrics', to='supplychain.outboxtransaction')),
+            ],
+        ),
+    ]
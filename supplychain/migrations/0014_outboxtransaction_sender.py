@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplychain', '0013_transactionmetric'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxtransaction',
+            name='ordering_key',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='outboxtransaction',
+            name='sender',
+            field=models.CharField(blank=True, default='', max_length=42),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.5 on 2026-10-18 02:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplychain', '0014_outboxtransaction_sender'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxtransaction',
+            name='rollback',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='outboxtransaction',
+            name='rolled_back',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='outboxtransaction',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('sent', 'Sent'), ('confirmed', 'Confirmed'), ('reverted', 'Reverted'), ('failed', 'Failed')], db_index=True, default='queued', max_length=20),
+        ),
+    ]
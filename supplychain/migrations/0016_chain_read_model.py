@@ -0,0 +1,54 @@
+# Generated by Django 4.2.5 on 2026-10-18 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplychain', '0015_outboxtransaction_rollback'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChainDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.PositiveBigIntegerField(unique=True)),
+                ('product_id', models.PositiveBigIntegerField(default=0)),
+                ('quantity', models.PositiveBigIntegerField(default=0)),
+                ('retail_store', models.CharField(blank=True, db_index=True, default='', max_length=42)),
+                ('status', models.CharField(choices=[('in_transit', 'In Transit'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChainInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.PositiveBigIntegerField(unique=True)),
+                ('quantity', models.PositiveBigIntegerField()),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChainDeliveryStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.PositiveBigIntegerField()),
+                ('status', models.CharField(choices=[('in_transit', 'In Transit'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('tx_hash', models.CharField(max_length=66)),
+                ('log_index', models.PositiveIntegerField()),
+                ('block_number', models.PositiveBigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order_id', 'block_number', 'log_index'], name='supplychain_order_i_74ec1e_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chaindeliverystatus',
+            constraint=models.UniqueConstraint(fields=('tx_hash', 'log_index'), name='unique_chain_delivery_status'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.5 on 2026-10-18 03:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('supplychain', '0016_chain_read_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxtransaction',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outbox_transactions', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from warehouse.models import Product
 from django.utils.timezone import now
@@ -26,3 +27,166 @@ class Delivery(models.Model):
     def __str__(self):
         return f"Delivery for Order {self.order.id} - Status: {self.delivery_status}"
 
+
+class BlockCheckpoint(models.Model):
+    stream = models.CharField(max_length=50, unique=True)  # Name of the event stream this cursor belongs to
+    block_number = models.PositiveBigIntegerField()  # Last block whose logs were processed
+    log_index = models.PositiveIntegerField(null=True, blank=True)  # Last processed log when the block is only partly done
+    block_hash = models.CharField(max_length=66, blank=True, default='')  # Hash of block_number, used to detect reorgs
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Checkpoint {self.stream} - Block {self.block_number}"
+
+class ProcessedEvent(models.Model):
+    tx_hash = models.CharField(max_length=66)
+    log_index = models.PositiveIntegerField()
+    block_number = models.PositiveBigIntegerField(db_index=True)
+    block_hash = models.CharField(max_length=66)
+    event_name = models.CharField(max_length=50)
+    args = models.JSONField()  # Decoded event arguments, kept so the event can be reverted after a reorg
+    processed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tx_hash', 'log_index'], name='unique_processed_event'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_name} in block {self.block_number} ({self.tx_hash}:{self.log_index})"
+
+class FailedEvent(models.Model):
+    STATUS_CHOICES = [('pending', 'Pending'), ('resolved', 'Resolved'), ('abandoned', 'Abandoned')]
+
+    tx_hash = models.CharField(max_length=66)
+    log_index = models.PositiveIntegerField()
+    block_number = models.PositiveBigIntegerField()
+    block_hash = models.CharField(max_length=66)
+    event_name = models.CharField(max_length=50)
+    args = models.JSONField()  # Decoded event arguments, enough to re-run the handler without the chain
+    error = models.TextField()  # Error raised by the most recent attempt
+    attempts = models.PositiveIntegerField(default=1)
+    next_retry_at = models.DateTimeField(default=now, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tx_hash', 'log_index'], name='unique_failed_event'),
+        ]
+
+    def __str__(self):
+        return f"Failed {self.event_name} ({self.tx_hash}:{self.log_index}) - {self.status}, {self.attempts} attempts"
+
+class AccountNonce(models.Model):
+    address = models.CharField(max_length=42, unique=True)  # Checksummed address of a signing account
+    next_nonce = models.PositiveBigIntegerField()  # Nonce the next transaction from this account will use
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.address} - next nonce {self.next_nonce}"
+
+class OutboxTransaction(models.Model):
+    STATUS_CHOICES = [('queued', 'Queued'), ('sent', 'Sent'), ('confirmed', 'Confirmed'), ('reverted', 'Reverted'), ('failed', 'Failed')]
+
+    tracking_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)  # Returned to the user instead of a tx hash
+    contract_name = models.CharField(max_length=50)
+    function_name = models.CharField(max_length=50)
+    args = models.JSONField()  # Arguments of the contract function, in ABI order
+    role = models.CharField(max_length=20)  # Role whose account signs the transaction
+    sender = models.CharField(max_length=42, blank=True, default='')  # Account of the role's signer pool that signs it, set when first signed
+    ordering_key = models.CharField(max_length=100, blank=True, default='')  # Transactions with the same key go through the same account, in order
+    # User whose request queued it, who alone can look it up; None for transactions queued by management commands
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='outbox_transactions')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', db_index=True)
+    nonce = models.PositiveBigIntegerField(null=True, blank=True)
+    tx_hash = models.CharField(max_length=66, blank=True, default='')
+    raw_transaction = models.TextField(blank=True, default='')  # Signed transaction, rebroadcast as-is if a send is interrupted
+    block_number = models.PositiveBigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')  # Error of the most recent failed attempt
+    # Database changes made along with queueing it, undone if it reverts or fails: [{model, pk, before, after}]
+    rollback = models.JSONField(default=list, blank=True)
+    rolled_back = models.BooleanField(default=False)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    confirmed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.contract_name}.{self.function_name} {self.tracking_id} - {self.status}"
+
+class TransactionMetric(models.Model):
+    OUTCOME_CHOICES = [
+        ('sent', 'Sent'), ('confirmed', 'Confirmed'), ('reverted', 'Reverted'),
+        ('rejected', 'Rejected'), ('transient_error', 'Transient error'), ('error', 'Error'),
+    ]
+
+    outbox_tx = models.ForeignKey(OutboxTransaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='metrics')
+    contract_name = models.CharField(max_length=50)
+    function_name = models.CharField(max_length=50)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES, db_index=True)
+    # Stage durations in milliseconds; null when the stage did not run (e.g. a rebroadcast reuses the signed bytes)
+    nonce_ms = models.FloatField(null=True, blank=True)
+    build_ms = models.FloatField(null=True, blank=True)
+    sign_ms = models.FloatField(null=True, blank=True)
+    send_ms = models.FloatField(null=True, blank=True)
+    receipt_ms = models.FloatField(null=True, blank=True)  # From the send until the receipt was seen
+    rpc_calls = models.PositiveIntegerField(default=0)  # JSON-RPC calls made while submitting
+    gas_used = models.PositiveBigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.contract_name}.{self.function_name} - {self.outcome}"
+
+class InventorySync(models.Model):
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='inventory_sync')
+    synced_quantity = models.FloatField()  # Warehouse quantity last pushed to the DistributorContract
+    outbox_tx = models.ForeignKey(OutboxTransaction, on_delete=models.SET_NULL, null=True, blank=True)  # Transaction that pushed it
+    synced_at = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return f"Inventory of {self.product.product_id} synced at {self.synced_quantity}"
+
+# Read model of the chain, projected from contract events by the event listener, so pages do not call the node
+
+CHAIN_DELIVERY_STATUS_CHOICES = [('in_transit', 'In Transit'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')]  # DeliveryContract.DeliveryStatus, in enum order
+
+class ChainDelivery(models.Model):
+    order_id = models.PositiveBigIntegerField(unique=True)  # Order ID on chain, which need not exist in Order
+    product_id = models.PositiveBigIntegerField(default=0)
+    quantity = models.PositiveBigIntegerField(default=0)
+    retail_store = models.CharField(max_length=42, blank=True, default='', db_index=True)  # Address of the retail store
+    status = models.CharField(max_length=20, choices=CHAIN_DELIVERY_STATUS_CHOICES)
+    block_number = models.PositiveBigIntegerField()  # Block of the last event that changed it
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Chain delivery for Order {self.order_id} - Status: {self.status}"
+
+class ChainDeliveryStatus(models.Model):
+    order_id = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=20, choices=CHAIN_DELIVERY_STATUS_CHOICES)
+    tx_hash = models.CharField(max_length=66)
+    log_index = models.PositiveIntegerField()
+    block_number = models.PositiveBigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tx_hash', 'log_index'], name='unique_chain_delivery_status'),
+        ]
+        indexes = [models.Index(fields=['order_id', 'block_number', 'log_index'])]  # History of an order, in chain order
+
+    def __str__(self):
+        return f"Order {self.order_id} {self.status} in block {self.block_number}"
+
+class ChainInventory(models.Model):
+    product_id = models.PositiveBigIntegerField(unique=True)
+    quantity = models.PositiveBigIntegerField()  # Quantity the DistributorContract holds
+    block_number = models.PositiveBigIntegerField()  # Block of the InventoryUpdated event it was set by
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Chain inventory of {self.product_id}: {self.quantity}"
@@ -35,7 +35,59 @@ contract DeliveryContract {     // Contract for handling delivery operations in
 
 
 
+    // Pool accounts that send transactions on behalf of another account, e.g. a retail store's signer pool
+    mapping(address => address) public principals;
+
+    // Offers to act for a principal (principal => sender => offered), each accepted by the sender itself
+    mapping(address => mapping(address => bool)) public senderOffers;
+
+    event SenderAuthorized(address principal, address sender, bool authorized);  // Event emitted when a pool account is authorized or revoked
+
+    // Function to offer another account to send transactions on behalf of the caller, or to withdraw the offer or authorization
+    function authorizeSender(address sender, bool authorized) external {
+        require(sender != msg.sender, "An account cannot authorize itself");
+
+        senderOffers[msg.sender][sender] = authorized;
+        if (!authorized && principals[sender] == msg.sender) {
+            principals[sender] = address(0);
+            emit SenderAuthorized(msg.sender, sender, false);
+        }
+    }
+
+    // Function for an account to accept an offer and start acting for its principal, so no account can be claimed without its consent
+    function acceptPrincipal(address principal) external {
+        require(senderOffers[principal][msg.sender], "No offer from this principal");
+        require(principals[msg.sender] == address(0), "Sender already acts for another account");
+
+        senderOffers[principal][msg.sender] = false;
+        principals[msg.sender] = principal;
+        emit SenderAuthorized(principal, msg.sender, true);
+    }
+
+    // The account a transaction is sent on behalf of: the authorizing account for a pool account, otherwise the sender itself
+    function _principal(address sender) internal view returns (address) {
+        address principal = principals[sender];
+        return principal == address(0) ? sender : principal;
+    }
+
     function initiateDelivery(uint orderId, uint productId, uint quantity, address retailStore) external {
+    _initiateDelivery(orderId, productId, quantity, retailStore);
+}
+
+    // Function to initiate the deliveries of many orders in one transaction, e.g. a whole truck load
+    function initiateDeliveries(uint[] calldata orderIds, uint[] calldata productIds, uint[] calldata quantities, address[] calldata retailStores) external {
+        require(
+            orderIds.length == productIds.length && orderIds.length == quantities.length && orderIds.length == retailStores.length,
+            "Order IDs, product IDs, quantities and retail stores must have the same length"
+        );
+
+        for (uint i = 0; i < orderIds.length; i++) {
+            _initiateDelivery(orderIds[i], productIds[i], quantities[i], retailStores[i]);
+        }
+    }
+
+    // Helper function shared by initiateDelivery and initiateDeliveries
+    function _initiateDelivery(uint orderId, uint productId, uint quantity, address retailStore) internal {
     require(quantity > 0, "Quantity must be greater than 0");
 
     Delivery storage delivery = deliveries[orderId];
@@ -54,11 +106,11 @@ contract DeliveryContract {     // Contract for handling delivery operations in
     // Function to confirm delivery
     function confirmDelivery(uint orderId) external {
         Delivery storage delivery = deliveries[orderId];  // Fetch the delivery details using the orderId.
-        require(delivery.retailStore == msg.sender, "Only the assigned retail store can confirm this delivery");   // Ensure that only the assigned retail store can confirm the delivery.
+        require(delivery.retailStore == _principal(msg.sender), "Only the assigned retail store can confirm this delivery");   // Ensure that only the assigned retail store, or a pool account acting for it, can confirm the delivery.
         require(delivery.status == DeliveryStatus.InTransit, "Delivery must be in transit to be confirmed");   // Ensure that delivery is in the correct status for confirmation.
         
         delivery.status = DeliveryStatus.Delivered;  // Update the status of the delivery to "Delivered".
-        emit DeliveryConfirmed(orderId, msg.sender);  // Emit an event to confirm the delivery.
+        emit DeliveryConfirmed(orderId, delivery.retailStore);  // Emit an event to confirm the delivery.
         emit StatusUpdated(orderId, DeliveryStatus.Delivered);   // Emit an event for the updated status.
     }
 
@@ -68,5 +68,15 @@ contract DistributorContract {
         emit InventoryUpdated(productId, quantity);
     }
 
+    // Function to update the inventory of many products in one transaction
+    function updateInventories(uint256[] calldata productIds, uint256[] calldata quantities) external {
+        require(productIds.length == quantities.length, "Product IDs and quantities must have the same length");
+
+        for (uint256 i = 0; i < productIds.length; i++) {
+            inventory[productIds[i]] = InventoryItem(productIds[i], quantities[i]);
+            emit InventoryUpdated(productIds[i], quantities[i]);
+        }
+    }
+
     
 }
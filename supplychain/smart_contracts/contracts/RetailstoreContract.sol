@@ -17,6 +17,41 @@ contract RetailStoreContract {
     event DeliveryConfirmed(uint orderId);  // Event emitted when the delivery is confirmed
 
    
+    // Pool accounts that send transactions on behalf of another account, e.g. a retail store's signer pool
+    mapping(address => address) public principals;
+
+    // Offers to act for a principal (principal => sender => offered), each accepted by the sender itself
+    mapping(address => mapping(address => bool)) public senderOffers;
+
+    event SenderAuthorized(address principal, address sender, bool authorized);  // Event emitted when a pool account is authorized or revoked
+
+    // Function to offer another account to send transactions on behalf of the caller, or to withdraw the offer or authorization
+    function authorizeSender(address sender, bool authorized) external {
+        require(sender != msg.sender, "An account cannot authorize itself");
+
+        senderOffers[msg.sender][sender] = authorized;
+        if (!authorized && principals[sender] == msg.sender) {
+            principals[sender] = address(0);
+            emit SenderAuthorized(msg.sender, sender, false);
+        }
+    }
+
+    // Function for an account to accept an offer and start acting for its principal, so no account can be claimed without its consent
+    function acceptPrincipal(address principal) external {
+        require(senderOffers[principal][msg.sender], "No offer from this principal");
+        require(principals[msg.sender] == address(0), "Sender already acts for another account");
+
+        senderOffers[principal][msg.sender] = false;
+        principals[msg.sender] = principal;
+        emit SenderAuthorized(principal, msg.sender, true);
+    }
+
+    // The account a transaction is sent on behalf of: the authorizing account for a pool account, otherwise the sender itself
+    function _principal(address sender) internal view returns (address) {
+        address principal = principals[sender];
+        return principal == address(0) ? sender : principal;
+    }
+
     // Constructor to initialize the manufacturer and delivery contract addresses
     constructor(address _distributor, address _deliveryContract) {
         distributor = _distributor;
@@ -27,11 +62,21 @@ contract RetailStoreContract {
     // Function to place an order
     function placeOrder(uint orderId, uint productId, uint quantity) external {
         require(quantity > 0, "Quantity must be greater than zero"); // Validate input quantity
-        emit OrderPlaced(orderId, productId, quantity, msg.sender);    // Emit an event indicating the order was placed
+        emit OrderPlaced(orderId, productId, quantity, _principal(msg.sender));    // Emit an event indicating the order was placed, for the store a pool account acts for
         
         
     }
 
+    // Function to place several orders in one transaction, one OrderPlaced event per order
+    function placeOrders(uint[] calldata orderIds, uint[] calldata productIds, uint[] calldata quantities) external {
+        require(orderIds.length == productIds.length && orderIds.length == quantities.length, "Order IDs, product IDs and quantities must have the same length");
+
+        for (uint i = 0; i < orderIds.length; i++) {
+            require(quantities[i] > 0, "Quantity must be greater than zero"); // Validate input quantity
+            emit OrderPlaced(orderIds[i], productIds[i], quantities[i], _principal(msg.sender));    // Emit an event indicating the order was placed, for the store a pool account acts for
+        }
+    }
+
     // Function to confirm delivery
     function confirmDelivery(uint orderId) external{
         DeliveryContract(deliveryContract).confirmDelivery(orderId);    // Call the confirmDelivery function in the DeliveryContract to confirm the delivery
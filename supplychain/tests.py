@@ -1,3 +1,413 @@
-from django.test import TestCase
+from unittest import SkipTest, mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from hexbytes import HexBytes
+from web3 import Web3
+
+import event_listener
+from members.user_cache import user_resolver
+from notifications.models import Notification
+from warehouse.models import Product
+from . import blockchain_service, chain_backend
+from .models import (
+    AccountNonce, BlockCheckpoint, ChainDelivery, ChainDeliveryStatus, ChainInventory, Delivery, FailedEvent, Order,
+    OutboxTransaction, ProcessedEvent, TransactionMetric,
+)
+
+User = get_user_model()
+
+
+class ArtifactBytecodeTests(SimpleTestCase):
+    def test_stale_artifact_is_rejected(self):
+        artifact = chain_backend.load_artifact('ManufacturerContract')
+        chain_backend.check_artifact_bytecode('ManufacturerContract', artifact)  # Built from the current source
+
+        # An ABI function the bytecode does not dispatch to
+        stale = {**artifact, 'abi': artifact['abi'] + [{
+            'type': 'function', 'name': 'missingFunction', 'inputs': [], 'outputs': [], 'stateMutability': 'nonpayable',
+        }]}
+        with self.assertRaisesMessage(Exception, 'missingFunction() missing'):
+            chain_backend.check_artifact_bytecode('ManufacturerContract', stale)
+
+        with self.assertRaisesMessage(Exception, 'all functions missing'):
+            chain_backend.check_artifact_bytecode('ManufacturerContract', {**artifact, 'deployedBytecode': ''})
+
+
+class TesterChainTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if chain_backend.compile_contracts() is None:
+            raise SkipTest(f"solc {chain_backend.SOLC_VERSION} is not installed for py-solc-x")
+        provider, interfaces = chain_backend.deploy_tester_chain()
+        cls.web3 = Web3(provider)
+        cls.contracts = {name: cls.web3.eth.contract(address=address, abi=abi) for name, (abi, address) in interfaces.items()}
+
+    def transact(self, contract_name, function_name, *args, sender=None):
+        contract_function = getattr(self.contracts[contract_name].functions, function_name)(*args)
+        tx_hash = contract_function.transact({'from': sender or self.web3.eth.accounts[0]})
+        return self.web3.eth.get_transaction_receipt(tx_hash)
+
+    def test_order_and_delivery_writes(self):
+        store = self.web3.eth.accounts[0]
+
+        receipt = self.transact('RetailStoreContract', 'placeOrders', [101, 102], [7, 8], [3, 4])
+        self.assertEqual(receipt['status'], 1)
+        events = self.contracts['RetailStoreContract'].events.OrderPlaced().process_receipt(receipt)
+        self.assertEqual([(event['args']['orderId'], event['args']['retailStore']) for event in events], [(101, store), (102, store)])
+
+        receipt = self.transact('DeliveryContract', 'initiateDeliveries', [101, 102], [7, 8], [3, 4], [store, store])
+        self.assertEqual(receipt['status'], 1)
+
+        self.assertEqual(self.transact('DeliveryContract', 'confirmDelivery', 101)['status'], 1)
+        delivery = self.contracts['DeliveryContract'].functions.getDeliveryDetails(101).call()
+        self.assertEqual(delivery[4], 'Delivered')
+
+    def placed_for(self, order_id, sender):
+        receipt = self.transact('RetailStoreContract', 'placeOrder', order_id, 7, 1, sender=sender)
+        return self.contracts['RetailStoreContract'].events.OrderPlaced().process_receipt(receipt)[0]['args']['retailStore']
+
+    def test_pool_account_acts_for_its_principal(self):
+        store, pool_account = self.web3.eth.accounts[0], self.web3.eth.accounts[5]
+
+        self.assertEqual(self.transact('RetailStoreContract', 'authorizeSender', pool_account, True)['status'], 1)
+        self.assertEqual(self.placed_for(201, pool_account), pool_account)  # Offered, not yet accepted
+
+        self.assertEqual(self.transact('RetailStoreContract', 'acceptPrincipal', store, sender=pool_account)['status'], 1)
+        self.assertEqual(self.placed_for(202, pool_account), store)  # Recorded for the store, not the pool account
+
+        self.assertEqual(self.transact('RetailStoreContract', 'authorizeSender', pool_account, False)['status'], 1)
+        self.assertEqual(self.placed_for(203, pool_account), pool_account)
+
+    def test_account_cannot_be_claimed_without_an_offer(self):
+        claimant, account = self.web3.eth.accounts[1], self.web3.eth.accounts[6]
+
+        with self.assertRaises(Exception):  # Reverts: the store never offered the account
+            self.transact('RetailStoreContract', 'acceptPrincipal', self.web3.eth.accounts[0], sender=account)
+        self.transact('RetailStoreContract', 'authorizeSender', account, True, sender=claimant)
+        self.assertEqual(self.placed_for(301, account), account)  # An offer alone does not make the account act for the claimant
+
+
+# Event listener, nonce and outbox behaviour against the test database; the outbox tests run on the in-process tester chain
+
+STORE_ADDRESS = Web3.to_checksum_address('0x' + 'ab' * 20)  # Retail store address the synthetic events carry
+
+
+def chain_event(name, block_number, log_index=0, **args):
+    # A decoded log as the listener receives it, with one transaction per block
+    return {
+        'event': name, 'args': args, 'blockNumber': block_number, 'logIndex': log_index,
+        'transactionHash': HexBytes(block_number.to_bytes(32, 'big')),
+        'blockHash': HexBytes((block_number + 1000).to_bytes(32, 'big')),
+    }
+
+
+def create_product(product_id, created_by, quantity=100):
+    return Product.objects.create(
+        product_id=product_id, name='Product', description='Description', unitofmesurment='Piece', quantity=quantity,
+        reorderpoint=10, price=1, supplierinfo='Supplier', comments='', created_by=created_by,
+    )
+
+
+class SupplyChainTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = User.objects.create(username='store', user_role='retail_store', eth_address=STORE_ADDRESS)
+        cls.distributor = User.objects.create(username='distributor', user_role='distributor')
+        cls.manufacturer = User.objects.create(username='manufacturer', user_role='manufacturer')
+        cls.product = create_product('7', cls.manufacturer)
+
+    def setUp(self):
+        user_resolver.invalidate()  # Users cached by an earlier test were rolled back with it
+
+    def stock(self):
+        return Product.objects.get(product_id='7').quantity
+
+
+class EventListenerTestCase(SupplyChainTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checkpoint = BlockCheckpoint.objects.create(stream='test', block_number=10)
+
+    def dispatch(self, *events):
+        with transaction.atomic():
+            event_listener.dispatch_events(list(events))
+
+
+class EventLedgerTests(EventListenerTestCase):
+    def test_replayed_event_is_applied_once(self):
+        placed = chain_event('OrderPlaced', 11, orderId=1, productId=7, quantity=5, retailStore=STORE_ADDRESS)
+        initiated = chain_event('DeliveryInitiated', 12, orderId=1, productId=7, quantity=5, retailStore=STORE_ADDRESS)
+        self.dispatch(placed, initiated)
+        self.dispatch(placed, initiated)  # E.g. an overlapping backfill
+
+        order = Order.objects.get(id=1)
+        self.assertEqual((order.quantity, order.status, order.retail_store), (5, 'pending', self.store))
+        self.assertEqual(self.stock(), 95)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(ProcessedEvent.objects.count(), 2)
+
+    def test_reorg_reverts_orphaned_events(self):
+        self.dispatch(
+            chain_event('OrderPlaced', 11, orderId=1, productId=7, quantity=5, retailStore=STORE_ADDRESS),
+            chain_event('OrderProcessed', 12, orderId=1, productId=7, quantity=5, isAvailable=True),
+            chain_event('DeliveryInitiated', 13, orderId=1, productId=7, quantity=5, retailStore=STORE_ADDRESS),
+            chain_event('StatusUpdated', 13, 1, orderId=1, status=0),
+            chain_event('OrderPlaced', 13, 2, orderId=2, productId=8, quantity=1, retailStore=STORE_ADDRESS),  # Unknown product
+        )
+        self.assertEqual(Order.objects.get(id=1).status, 'processed')
+        self.assertEqual((self.stock(), Delivery.objects.count(), ChainDelivery.objects.count()), (95, 1, 1))
+        self.assertEqual(FailedEvent.objects.count(), 1)
+
+        event_listener.rollback_to_block(self.checkpoint, 11, '0x11')
+
+        self.assertEqual(Order.objects.get(id=1).status, 'pending')
+        self.assertEqual((self.stock(), Delivery.objects.count()), (100, 0))
+        self.assertEqual((ChainDelivery.objects.count(), ChainDeliveryStatus.objects.count()), (0, 0))
+        self.assertEqual(list(ProcessedEvent.objects.values_list('block_number', flat=True)), [11])
+        self.assertEqual(list(Notification.objects.values_list('tx_hash', flat=True)), [Web3.to_hex(HexBytes((11).to_bytes(32, 'big')))])
+        self.assertFalse(FailedEvent.objects.exists())
+        self.checkpoint.refresh_from_db()
+        self.assertEqual((self.checkpoint.block_number, self.checkpoint.block_hash), (11, '0x11'))
+
+        event_listener.rollback_to_block(self.checkpoint, 10)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+
+
+class DeadLetterTests(EventListenerTestCase):
+    def test_failing_event_does_not_block_its_batch(self):
+        self.dispatch(
+            chain_event('OrderPlaced', 11, orderId=1, productId=7, quantity=5, retailStore=STORE_ADDRESS),
+            chain_event('OrderPlaced', 11, 1, orderId=2, productId=8, quantity=5, retailStore=STORE_ADDRESS),
+            chain_event('OrderPlaced', 11, 2, orderId=3, productId=7, quantity=5, retailStore=STORE_ADDRESS),
+        )
+
+        self.assertEqual(list(Order.objects.order_by('id').values_list('id', flat=True)), [1, 3])
+        self.assertEqual(Notification.objects.count(), 2)  # The failed event's notification was discarded with it
+        failed_event = FailedEvent.objects.get()
+        self.assertEqual((failed_event.log_index, failed_event.status, failed_event.attempts), (1, 'pending', 1))
+        self.assertFalse(ProcessedEvent.objects.filter(log_index=1).exists())
+
+        self.assertEqual(event_listener.retry_due_failed_events(), 0)  # Backing off
+        FailedEvent.objects.update(next_retry_at=timezone.now())
+        self.assertEqual(event_listener.retry_due_failed_events(), 0)  # Still failing
+        failed_event.refresh_from_db()
+        self.assertEqual((failed_event.status, failed_event.attempts), ('pending', 2))
+        self.assertGreater(failed_event.next_retry_at, timezone.now())
+
+        create_product('8', self.manufacturer)
+        self.assertEqual(event_listener.replay_failed_events([failed_event]), 1)
+        self.assertEqual(FailedEvent.objects.get().status, 'resolved')
+        self.assertTrue(Order.objects.filter(id=2, product__product_id='8').exists())
+
+    def test_out_of_range_argument_is_abandoned(self):
+        self.dispatch(chain_event('OrderPlaced', 11, orderId=1, productId=7, quantity=2 ** 64, retailStore=STORE_ADDRESS))
+
+        self.assertEqual(FailedEvent.objects.get().status, 'abandoned')  # Would fail the same way on every retry
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(ProcessedEvent.objects.exists())
+
+
+class EventBatchTests(EventListenerTestCase):
+    def test_batch_shares_lookups_and_inserts(self):
+        events = [chain_event('OrderPlaced', 11, index, orderId=index + 1, productId=7, quantity=1, retailStore=STORE_ADDRESS)
+                  for index in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            self.dispatch(*events)
+
+        self.assertEqual(Order.objects.filter(retail_store=self.store).count(), 20)
+        self.assertEqual(Notification.objects.filter(sender=self.store, receiver=self.distributor).count(), 20)
+
+        def count(text):
+            return sum(text in query['sql'] for query in queries.captured_queries)
+        self.assertEqual(count('FROM "warehouse_product"'), 1)  # One prefetch for the batch
+        self.assertEqual(count('FROM "members_customuser"'), 2)  # The distributor and the store, then from the resolver cache
+        self.assertEqual(count('INSERT INTO "notifications_notification"'), 1)
+
+    def test_saved_user_is_resolved_straight_away(self):
+        address = Web3.to_checksum_address('0x' + 'cd' * 20)
+        with self.assertRaises(User.DoesNotExist):
+            user_resolver.by_address(address)  # Caches the miss
+
+        user = User.objects.create(username='second_store', user_role='retail_store', eth_address=address.lower())
+        self.assertEqual(user_resolver.by_address(address), user)
+
+
+class ReadModelTests(EventListenerTestCase):
+    def read_model(self):
+        return (
+            list(ChainDelivery.objects.values_list('order_id', 'product_id', 'quantity', 'retail_store', 'status', 'block_number')),
+            list(ChainDeliveryStatus.objects.order_by('block_number').values_list('order_id', 'status', 'block_number')),
+            list(ChainInventory.objects.values_list('product_id', 'quantity', 'block_number')),
+        )
+
+    def test_read_model_is_rebuilt_from_the_ledger(self):
+        self.dispatch(
+            chain_event('DeliveryInitiated', 11, orderId=1, productId=7, quantity=5, retailStore=STORE_ADDRESS),
+            chain_event('StatusUpdated', 11, 1, orderId=1, status=0),
+            chain_event('StatusUpdated', 12, orderId=1, status=1),
+            chain_event('InventoryUpdated', 12, 1, productId=7, newQuantity=40),
+        )
+        projected = self.read_model()
+        self.assertEqual(projected, (
+            [(1, 7, 5, STORE_ADDRESS, 'delivered', 12)],
+            [(1, 'in_transit', 11), (1, 'delivered', 12)],
+            [(7, 40, 12)],
+        ))
+
+        ChainDelivery.objects.update(status='cancelled')
+        ChainInventory.objects.all().delete()
+        with transaction.atomic():
+            event_listener.rebuild_read_model()
+        self.assertEqual(self.read_model(), projected)
+
+        ChainInventory.objects.update(quantity=1)
+        with transaction.atomic():
+            event_listener.rebuild_read_model(order_ids=[1])  # Leaves the inventory alone
+        self.assertEqual(ChainInventory.objects.get().quantity, 1)
+
+    def test_recorded_events_are_projected_without_their_handlers(self):
+        events = [
+            chain_event('OrderPlaced', 11, orderId=1, productId=7, quantity=5, retailStore=STORE_ADDRESS),
+            chain_event('DeliveryInitiated', 12, orderId=1, productId=7, quantity=5, retailStore=STORE_ADDRESS),
+        ]
+        with transaction.atomic():
+            event_listener.record_events(events)
+            event_listener.record_events(events)
+
+        self.assertEqual(ProcessedEvent.objects.count(), 2)
+        self.assertEqual(ChainDelivery.objects.get().status, 'in_transit')
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(self.stock(), 100)
+
+        self.dispatch(*events)  # Already in the ledger
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(), 100)
+
+
+class NonceTests(TestCase):
+    address = Web3.to_checksum_address('0x' + 'ef' * 20)
+
+    def setUp(self):
+        self.web3 = mock.Mock()
+        self.web3.eth.get_transaction_count.return_value = 7  # Transactions the node has seen from the account
+        patcher = mock.patch.object(blockchain_service, 'get_web3', return_value=self.web3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def next_nonce(self):
+        return AccountNonce.objects.get(address=self.address).next_nonce
+
+    def outbox_tx(self, nonce, attempts=1):
+        return OutboxTransaction.objects.create(
+            contract_name='RetailStoreContract', function_name='placeOrder', args=[1, 7, 1], role='retail_store',
+            sender=self.address, nonce=nonce, tx_hash='0x01', raw_transaction='0x02', attempts=attempts,
+        )
+
+    def test_nonces_are_allocated_in_sequence(self):
+        self.assertEqual(blockchain_service.allocate_nonce(self.address), 7)
+        self.assertEqual(blockchain_service.allocate_nonce(self.address, 3), 8)
+        self.assertEqual(blockchain_service.allocate_nonce(self.address), 11)
+        self.web3.eth.get_transaction_count.assert_called_once_with(self.address, 'pending')  # Only for the first
+
+    @mock.patch.object(blockchain_service, 'fill_nonce_gap')
+    def test_released_nonce_is_reused_or_filled(self, fill_nonce_gap):
+        blockchain_service.allocate_nonce(self.address, 3)
+
+        blockchain_service.release_nonce(self.address, 9)  # The last one handed out
+        self.assertEqual(self.next_nonce(), 9)
+        fill_nonce_gap.assert_not_called()
+
+        blockchain_service.release_nonce(self.address, 7)  # Nonce 8 may already be waiting on it
+        self.assertEqual(self.next_nonce(), 9)
+        fill_nonce_gap.assert_called_once_with(self.address, 7)
+
+    def test_rejected_send_keeps_its_nonce(self):
+        signer = mock.Mock(address=self.address)
+        outbox_tx = self.outbox_tx(5)
+        blockchain_service.reject_outbox_transaction(outbox_tx, signer, Exception('insufficient funds for gas'))
+        outbox_tx.refresh_from_db()
+        self.assertEqual((outbox_tx.status, outbox_tx.nonce, outbox_tx.raw_transaction), ('queued', 5, ''))
+
+        blockchain_service.reject_outbox_transaction(outbox_tx, signer, Exception('nonce too low'))
+        outbox_tx.refresh_from_db()
+        self.assertEqual((outbox_tx.status, outbox_tx.nonce), ('queued', None))  # Signed again with a fresh nonce
+        self.assertEqual(self.next_nonce(), 7)  # Resynchronised with the node
+
+    def test_failed_transaction_gives_up_its_nonce(self):
+        AccountNonce.objects.create(address=self.address, next_nonce=6)
+        outbox_tx = self.outbox_tx(5, attempts=blockchain_service.OUTBOX_MAX_ATTEMPTS)
+        blockchain_service.reject_outbox_transaction(outbox_tx, mock.Mock(address=self.address), Exception('out of gas'))
+
+        outbox_tx.refresh_from_db()
+        self.assertEqual((outbox_tx.status, outbox_tx.nonce, outbox_tx.rolled_back), ('failed', None, True))
+        self.assertEqual(self.next_nonce(), 5)
+
+
+class OutboxTests(SupplyChainTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(self.clear_caches)  # Runs last, once the backend is restored
+        for patcher in (mock.patch.object(chain_backend, 'CHAIN_BACKEND', 'tester'),
+                        mock.patch.object(blockchain_service, '_web3', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.clear_caches()
+
+    def clear_caches(self):
+        for cached in (blockchain_service.load_contract, blockchain_service.load_contract_interface, blockchain_service.get_signer,
+                       blockchain_service.get_signers, blockchain_service.get_signer_by_address, blockchain_service.get_chain_id):
+            cached.cache_clear()
+
+    def send_and_check(self):
+        sent = blockchain_service.send_queued_transactions()
+        return sent, blockchain_service.check_sent_transactions()
+
+    def test_queued_transactions_are_sent_and_confirmed(self):
+        outbox_txs, orders = blockchain_service.place_orders([('7', 2), ('7', 3)], self.store)
+        self.assertEqual({outbox_tx.status for outbox_tx in outbox_txs}, {'queued'})
+        self.assertEqual(self.send_and_check(), (len(outbox_txs), len(outbox_txs)))
+
+        outbox_txs = OutboxTransaction.objects.filter(pk__in=[outbox_tx.pk for outbox_tx in outbox_txs])
+        for outbox_tx in outbox_txs:
+            self.assertEqual((outbox_tx.status, outbox_tx.created_by), ('confirmed', self.store))
+            self.assertIsNotNone(outbox_tx.block_number)
+        nonces = sorted(outbox_txs.values_list('nonce', flat=True))
+        self.assertEqual(nonces, list(range(nonces[0], nonces[0] + len(nonces))))  # One account, no gaps
+
+        metrics = TransactionMetric.objects.filter(outbox_tx__in=outbox_txs)
+        self.assertEqual(set(metrics.values_list('outcome', flat=True)), {'confirmed'})
+        self.assertTrue(all(metric.gas_used and metric.send_ms is not None for metric in metrics))
+        self.assertEqual(Order.objects.filter(id__in=[order.id for order in orders]).count(), 2)
+
+    def test_reverted_transaction_is_rolled_back(self):
+        order = Order.objects.create(product=self.product, quantity=2, retail_store=self.store, status='processed')
+        Delivery.objects.create(order=order, delivery_status='in_transit', distributor=self.distributor, retail_store=self.store)
+        outbox_tx = blockchain_service.confirm_delivery(order.id, self.store)  # The chain has no delivery for it
+        self.assertEqual(Delivery.objects.get().delivery_status, 'delivered')
+
+        self.assertEqual(self.send_and_check(), (1, 1))
+        outbox_tx.refresh_from_db()
+        self.assertEqual((outbox_tx.status, outbox_tx.rolled_back), ('reverted', True))
+        self.assertEqual(TransactionMetric.objects.get(outbox_tx=outbox_tx).outcome, 'reverted')
+        delivery = Delivery.objects.get()
+        self.assertEqual((delivery.delivery_status, delivery.delivered_at), ('in_transit', None))
+
+    @mock.patch.object(blockchain_service, 'OUTBOX_MAX_ATTEMPTS', 1)
+    def test_failed_transaction_is_rolled_back(self):
+        (outbox_tx,), (order,) = blockchain_service.place_orders([('7', 2)], self.store)
+        with mock.patch.object(blockchain_service, 'build_transaction_data', side_effect=Exception('Invalid arguments')):
+            self.assertEqual(blockchain_service.send_queued_transactions(), 0)
+
+        outbox_tx.refresh_from_db()
+        self.assertEqual((outbox_tx.status, outbox_tx.nonce, outbox_tx.rolled_back), ('failed', None, True))
+        self.assertFalse(Order.objects.filter(id=order.id).exists())
+        self.assertEqual(TransactionMetric.objects.get(outbox_tx=outbox_tx).outcome, 'error')
+        chain_nonce = blockchain_service.get_web3().eth.get_transaction_count(outbox_tx.sender, 'pending')
+        self.assertEqual(AccountNonce.objects.get(address=outbox_tx.sender).next_nonce, chain_nonce)  # Handed out again
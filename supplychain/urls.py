@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path('initiate-delivery/', views.initiate_delivery_view, name='initiate_delivery'),
+    path('initiate-deliveries/', views.initiate_deliveries_view, name='initiate_deliveries'),
     path('confirm-delivery/', views.confirm_delivery_view, name='confirm_delivery'),
     path('update-delivery-status/', views.update_delivery_status_view, name='update_delivery_status'),
     path('get-delivery-details/', views.get_delivery_details_view, name='get_delivery_details'),
@@ -11,5 +12,7 @@ urlpatterns = [
     #path('process-order/', views.process_order_view, name='process_order'),
     path('check-inventory/', views.check_inventory_view, name='check_inventory'),
     path('create-product/', views.create_product_view, name='create_product'),
+    path('transactions/', views.transaction_list_view, name='transaction_list'),
+    path('transactions/<uuid:tracking_id>/', views.transaction_status_view, name='transaction_status'),
     
 ]
\ No newline at end of file
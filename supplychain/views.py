@@ -1,15 +1,16 @@
 from django.shortcuts import render  
 from .blockchain_service import (  
-    initiate_delivery, confirm_delivery, update_delivery_status, 
-    get_delivery_details, place_order, check_inventory, create_product, 
-    update_inventory_on_blockchain, check_order_exists
+    initiate_delivery, initiate_deliveries, confirm_delivery, update_delivery_status, 
+    get_local_deliveries_details, verify_deliveries_details, place_orders, check_inventory, create_product, 
+    check_order_exists
 )
 from hexbytes import HexBytes  
 from web3 import Web3  
 from django.contrib import messages  
 from warehouse.models import Product  
-from .models import Delivery, Order  
-from django.utils import timezone  
+from .models import Delivery, Order, OutboxTransaction  
+from django.http import JsonResponse  
+from django.shortcuts import get_object_or_404  
 from django.contrib.auth.decorators import user_passes_test, login_required 
 from django.db import models  
 from django.core.paginator import Paginator  
@@ -64,10 +65,10 @@ def initiate_delivery_view(request):
             if Delivery.objects.filter(order_id=order_id).exists():
                 messages.warning(request, "Delivery for this order has already been initiated.")
             else:
-                # Call blockchain service to initiate delivery
-                tx_hash = initiate_delivery(order_id, product_id, quantity, retail_store_address)
-                # Display success message with the transaction hash
-                messages.success(request, f"Transaction was successful! Transaction Hash: {tx_hash}")
+                # Call blockchain service to queue the delivery transaction
+                outbox_tx = initiate_delivery(order_id, product_id, quantity, retail_store_address, created_by=request.user)
+                # Display success message with the tracking ID of the queued transaction
+                messages.success(request, f"Delivery initiated! Blockchain transaction queued with Tracking ID: {outbox_tx.tracking_id}")
 
         except Product.DoesNotExist:  # Handle case where the product doesn't exist
             messages.warning(request, "Product does not exist.")
@@ -81,6 +82,41 @@ def initiate_delivery_view(request):
 
 
 
+# View to initiate the deliveries of many orders at once, accessible only to distributors
+@login_required(login_url="/members/login_user")  # Ensure user is logged in, redirect to login if not
+@user_passes_test(is_distributor)  # Ensure user passes the distributor test
+def initiate_deliveries_view(request):
+    if request.method == 'POST':  # Check if the form is submitted via POST method
+        # Get the selected orders from the checkboxes, plus any order IDs typed in, comma separated
+        order_ids = request.POST.getlist('order_id')
+        order_ids += [order_id for order_id in request.POST.get('order_ids', '').split(',') if order_id.strip()]
+
+        try:
+            # Call blockchain service to queue one delivery transaction for all the orders
+            outbox_txs, deliveries = initiate_deliveries([int(order_id) for order_id in order_ids], created_by=request.user)
+            # Display success message with the tracking IDs of the queued transactions
+            tracking_ids = ', '.join(str(outbox_tx.tracking_id) for outbox_tx in outbox_txs)
+            messages.success(request, f"{len(deliveries)} deliveries initiated! Blockchain transaction(s) queued with Tracking ID(s): {tracking_ids}")
+
+        except ValueError as e:  # Handle order IDs that are not numbers, unknown orders or bad addresses
+            messages.warning(request, f"Invalid order IDs: {str(e)}")
+        except Exception as e:  # Handle general exceptions
+            messages.warning(request, f"An error occurred: {str(e)}")
+
+    # Orders with no delivery in transit or delivered, ready to be dispatched
+    ready_orders = (
+        Order.objects.exclude(delivery__delivery_status__in=['in_transit', 'delivered'])
+        .select_related('product', 'retail_store')
+        .order_by('id')
+    )
+
+    # Render the bulk dispatch form
+    return render(request, 'initiate_deliveries.html', {'ready_orders': ready_orders})
+
+
+
+
+
 # View to confirm delivery, accessible only to retail stores
 @login_required(login_url="/members/login_user")  # Ensure user is logged in
 @user_passes_test(is_retail_store)  # Ensure the user is a retail store
@@ -99,16 +135,11 @@ def confirm_delivery_view(request):
                 messages.warning(request, "This delivery has already been confirmed.")
                 return render(request, 'confirm_delivery.html')
 
-            # Call blockchain service to confirm delivery
-            tx_hash = confirm_delivery(order_id, request.user)
-
-            # Update the delivery status to 'delivered' and save the delivery time
-            delivery.delivery_status = 'delivered'
-            delivery.delivered_at = timezone.now()  # Record the delivery time
-            delivery.save()  # Save the delivery record
+            # Call blockchain service to queue the delivery confirmation; it marks the delivery as delivered
+            outbox_tx = confirm_delivery(order_id, request.user)
 
             # Display success message with the transaction hash
-            messages.success(request, f"Delivery confirmed! Transaction Hash: {tx_hash}")
+            messages.success(request, f"Delivery confirmed! Blockchain transaction queued with Tracking ID: {outbox_tx.tracking_id}")
         except Delivery.DoesNotExist:  # Handle case where delivery doesn't exist
             messages.warning(request, "Delivery has not been initiated for this order.")
         except Exception as e:  # Handle other exceptions
@@ -135,24 +166,13 @@ def update_delivery_status_view(request):
             if new_status not in [0, 1, 2]:
                 raise ValueError("Invalid status value.")
 
-            # Fetch all deliveries with the given order_id
-            deliveries = Delivery.objects.filter(order__id=order_id)
             check_order_exists(order_id)  # Ensure the order exists
 
-            # Call blockchain service to update the status
-            tx_hash = update_delivery_status(order_id, new_status)
-
-            
-            
-            for delivery in deliveries:
-                status_map = {0: 'in_transit', 1: 'delivered', 2: 'cancelled'} # Update the status of all deliveries in the database
-                delivery.delivery_status = status_map.get(new_status, 'unknown')
-                if new_status == 1:  # If status is 'delivered', record the delivery time
-                    delivery.delivered_at = timezone.now()
-                delivery.save()  # Save each delivery update
+            # Call blockchain service to queue the status update; it updates the delivery in the database
+            outbox_tx = update_delivery_status(order_id, new_status, created_by=request.user)
 
             # Display success message
-            messages.success(request, f"Delivery status updated for {deliveries.count()} deliveries! Transaction Hash: {tx_hash}")
+            messages.success(request, f"Delivery status updated! Tracking ID: {outbox_tx.tracking_id}")
 
         except ValueError as ve:  # Handle validation errors
             messages.warning(request, f"Invalid input: {ve}")
@@ -172,13 +192,32 @@ def update_delivery_status_view(request):
 @user_passes_test(is_retail_store_or_distributor)  # Ensure the user is either a retail store or distributor
 def get_delivery_details_view(request):
     if request.method == 'POST':  # Check if the form is submitted via POST method
-        order_id = int(request.POST.get('order_id'))  # Get order ID from the form and convert it to an integer
-
         try:
-            # Call blockchain service to get delivery details
-            delivery_details = get_delivery_details(order_id)
+            # Get one or more comma-separated order IDs from the form
+            order_ids = [int(order_id) for order_id in request.POST.get('order_id', '').split(',') if order_id.strip()]
+            if not order_ids:
+                raise ValueError("Enter at least one order ID.")
+
+            # Read the deliveries from the database, where the event listener keeps them up to date
+            local = get_local_deliveries_details(order_ids)
+            # Only call the blockchain when the user asks to verify the local copy
+            verified = verify_deliveries_details(order_ids) if request.POST.get('verify') else {}
+
+            deliveries = [{
+                'order_id': order_id,
+                'delivery': local[order_id][0],
+                'history': local[order_id][1],
+                'on_chain': verified[order_id][0] if verified else None,
+                'matches': verified[order_id][1] if verified else None,
+            } for order_id in order_ids]
             # Render the delivery details page with the retrieved details
-            return render(request, 'delivery_details.html', {'details': delivery_details})
+            return render(request, 'delivery_details.html', {
+                'deliveries': deliveries,
+                'order_ids': ','.join(map(str, order_ids)),  # Posted again by the verify button
+                'verified': bool(verified),
+            })
+        except ValueError as ve:  # Handle invalid order IDs
+            messages.warning(request, f"Invalid input: {ve}")
         except Exception as e:  # Handle exceptions
             messages.warning(request, f"An error occurred: {str(e)}")
 
@@ -199,29 +238,29 @@ def place_order_view(request):
     next_order_id = (next_order_id + 1) if next_order_id else 1  # Start from 1 if no orders exist
 
     if request.method == 'POST':  # Check if the form is submitted via POST method
-        product_id = request.POST.get('product_id')  # Get product ID from the form
-        quantity = int(request.POST.get('quantity'))  # Get quantity from the form and convert it to integer
+        # Get the order lines from the form; each line posts a product_id and a quantity
+        lines = [
+            (product_id.strip(), quantity.strip())
+            for product_id, quantity in zip(request.POST.getlist('product_id'), request.POST.getlist('quantity'))
+            if product_id.strip() or quantity.strip()  # Skip lines left empty
+        ]
 
         try:
-            # Log the product ID received from the form
-            logger.debug(f"Product ID from form: {product_id}")
+            # Log the product IDs received from the form
+            logger.debug(f"Order lines from form: {lines}")
 
-            # Validate the product exists in the warehouse
-            product = Product.objects.get(product_id=product_id)
-            logger.debug(f"Fetched Product: ID={product_id}, Product ID={product.product_id}, Name={product.name}")
-
-            # Call blockchain service to place the order
-            tx_hash = place_order(next_order_id, product.product_id, quantity, request.user)
+            # Call blockchain service to place every line of the order in one transaction
+            outbox_txs, orders = place_orders(lines, request.user)
 
-            # Display success message with the transaction hash and order ID
-            messages.success(request, f"Order placed successfully with Order ID {next_order_id}! Transaction Hash: {tx_hash}")
+            # Display success message with the tracking IDs and order IDs
+            order_ids = ', '.join(str(order.id) for order in orders)
+            tracking_ids = ', '.join(str(outbox_tx.tracking_id) for outbox_tx in outbox_txs)
+            messages.success(request, f"{len(orders)} order(s) placed successfully with Order ID(s) {order_ids}! Tracking ID(s): {tracking_ids}")
 
-            # Fetch the next order ID again after the order is placed
+            # Fetch the next order ID again after the orders are placed
             next_order_id = Order.objects.aggregate(max_id=Max('id'))['max_id'] + 1
 
-        except Product.DoesNotExist:  # Handle case where the product doesn't exist
-            messages.warning(request, "Product does not exist.")
-        except Exception as e:  # Handle general exceptions
+        except Exception as e:  # Handle missing products, invalid lines and other errors
             messages.warning(request, f"An error occurred: {str(e)}")
 
     # Fetch all orders placed by the logged-in user (retail store)
@@ -295,15 +334,12 @@ def check_inventory_view(request):
             # Validate the product exists in the warehouse
             product = Product.objects.get(product_id=product_id)
 
-            # Update the product inventory on the blockchain
-            update_inventory_on_blockchain(int(product.product_id), int(product.quantity))
-
-            # Call blockchain service to check inventory availability
-            is_available = check_inventory(order_id, product.product_id, quantity)
+            # Call blockchain service to check inventory availability; a transaction is only sent to notify the manufacturer
+            is_available, outbox_tx = check_inventory(order_id, product.product_id, quantity, product.quantity, created_by=request.user)
             if is_available:
                 messages.success(request, "Product is available.")
             else:
-                messages.warning(request, "Product is not available. Manufacturer has been notified.")
+                messages.warning(request, f"Product is not available. Manufacturer is being notified. Tracking ID: {outbox_tx.tracking_id}")
 
         except Product.DoesNotExist:  # Handle case where the product doesn't exist
             messages.warning(request, "Product does not exist.")
@@ -332,13 +368,50 @@ def create_product_view(request):
 
             product_id = int(product_id)  # Convert product ID to integer
             # Call blockchain service to create the product on the blockchain
-            tx_hash = create_product(order_id, product_id, quantity)
+            outbox_tx = create_product(order_id, product_id, quantity, created_by=request.user)
 
-            # Display success message with the transaction hash
-            messages.success(request, f"Product created successfully! Transaction Hash: {tx_hash}")
+            # Display success message with the tracking ID of the queued transaction
+            messages.success(request, f"Product creation queued! Tracking ID: {outbox_tx.tracking_id}")
 
         except Exception as e:  # Handle general exceptions
             messages.warning(request, f"An error occurred: {str(e)}")
 
     # Render the create product form
     return render(request, 'create_product.html')
+
+
+
+
+
+
+# Status of a queued blockchain transaction, looked up by the tracking ID shown after a form submit
+@login_required(login_url="/members/login_user")  # Ensure user is logged in
+def transaction_status_view(request, tracking_id):
+    outbox_tx = get_object_or_404(OutboxTransaction, tracking_id=tracking_id, created_by=request.user)  # Only the user who queued it
+    return JsonResponse({
+        'tracking_id': str(outbox_tx.tracking_id),
+        'status': outbox_tx.status,  # queued, sent, confirmed, reverted or failed
+        'tx_hash': outbox_tx.tx_hash or None,
+        'block_number': outbox_tx.block_number,
+        'error': outbox_tx.error or None,
+        'rolled_back': outbox_tx.rolled_back,  # Whether the database changes made with it were undone
+    })
+
+
+# Recent blockchain transactions the user queued, with their receipt status
+@login_required(login_url="/members/login_user")  # Ensure user is logged in
+def transaction_list_view(request):
+    outbox_txs = OutboxTransaction.objects.filter(created_by=request.user).order_by('-pk')  # Only the transactions the user queued
+    status = request.GET.get('status')
+    if status:
+        outbox_txs = outbox_txs.filter(status=status)
+
+    # Set up pagination (20 transactions per page)
+    paginator = Paginator(outbox_txs, 20)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    return render(request, 'transaction_list.html', {
+        'outbox_txs': page_obj,  # Paginated transactions
+        'status': status or '',
+        'status_choices': OutboxTransaction.STATUS_CHOICES,
+    })